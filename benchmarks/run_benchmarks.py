@@ -0,0 +1,230 @@
+"""Time GlucoLog commands against synthetic databases of increasing size.
+
+Results, including rows per second and peak memory, are written to a JSON file and
+can be compared against a baseline so that performance regressions are caught, e.g.
+
+    python -m benchmarks.run_benchmarks --baseline mine.json --save-baseline
+    python -m benchmarks.run_benchmarks --baseline mine.json
+
+Timings depend on the machine, so benchmarks/baseline.json only records one machine
+for reference and is not compared against by default; --large adds a database of
+ten million readings.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess  # nosec
+import tempfile
+from typing import Dict, List, Optional
+from benchmarks.synthetic import synthetic_database
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+DATA_DIR = os.path.join(BENCHMARKS_DIR, "data")
+DEFAULT_RESULTS = os.path.join(BENCHMARKS_DIR, "results.json")
+FMT_DATABASE = "synthetic-{rows}-{seed}.dbglu"
+
+DEFAULT_SIZES = "10000,100000,1000000"
+# Databases this large take a long time to create and export, so are only
+# benchmarked when asked for.
+LARGE_SIZE = 10000000
+COMMANDS = ["list-tables", "export-table", "dump-db"]
+FORMATS = {"csv": ".csv", "excel": ".xlsx"}
+DEFAULT_TOLERANCE = 0.25
+
+# Excel worksheets cannot hold more rows than this, and openpyxl holds a whole
+# workbook in memory so, by default, only smaller databases are exported to Excel.
+EXCEL_MAX_ROWS = 1048576 - 1
+DEFAULT_EXCEL_ROWS = 100000
+
+
+def database(rows: int, seed: int) -> str:
+    """Return a synthetic database of the given size, creating it if needed."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    filename = os.path.join(DATA_DIR, FMT_DATABASE.format(rows=rows, seed=seed))
+    if not os.path.exists(filename):
+        print("Creating %s..." % filename, file=sys.stderr)
+        synthetic_database(filename, rows, seed)
+    return filename
+
+
+def run(argv: List[str]) -> Dict[str, Optional[float]]:
+    """Run a command, returning its exit status, elapsed time and peak memory."""
+    start = time.perf_counter()
+    process = subprocess.Popen(argv, cwd=ROOT_DIR, stdout=subprocess.DEVNULL)  # nosec
+    if hasattr(os, "wait4"):
+        _pid, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = (
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        )
+        # Linux reports kilobytes but macOS reports bytes.
+        peak_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+    else:  # pragma: no cover
+        process.wait()
+        peak_rss = None
+    seconds = time.perf_counter() - start
+    return {
+        "returncode": process.returncode,
+        "seconds": seconds,
+        "peak_rss_bytes": peak_rss,
+    }
+
+
+def benchmark(
+    sizes: List[int], formats: List[str], seed: int, excel_rows: int
+) -> List[Dict]:
+    """Run every command in every format against each size of database.
+
+    A command that fails is recorded, with its exit status, and the rest are run.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        logfile = os.path.join(tmpdir, "glucolog.log")
+        for rows in sizes:
+            filename = database(rows, seed)
+            for command in COMMANDS:
+                for fmt in formats if command != "list-tables" else [None]:
+                    if fmt == "excel" and rows > min(excel_rows, EXCEL_MAX_ROWS):
+                        print("Skipping %s %s: too many rows" % (command, fmt))
+                        continue
+
+                    argv = [sys.executable, "-m", "src.glucolog.glucolog"]
+                    argv += ["--logfile", logfile, filename, command]
+                    if command == "export-table":
+                        argv += ["--table", "t_risultati"]
+                    if fmt is not None:
+                        output = os.path.join(tmpdir, "output" + FORMATS[fmt])
+                        argv += ["--format", fmt, output]
+
+                    result = run(argv)
+                    result.update(command=command, format=fmt, rows=rows)
+                    results.append(result)
+                    if result["returncode"]:
+                        print(
+                            "%-12s %-5s %10d rows FAILED with %d"
+                            % (command, fmt or "", rows, result["returncode"])
+                        )
+                        continue
+
+                    result["rows_per_sec"] = rows / result["seconds"]
+                    if fmt is not None:
+                        result["output_bytes"] = os.path.getsize(output)
+                    print(
+                        "%-12s %-5s %10d rows %8.2fs %12.0f rows/s"
+                        % (
+                            command,
+                            fmt or "",
+                            rows,
+                            result["seconds"],
+                            result["rows_per_sec"],
+                        )
+                    )
+
+    return results
+
+
+def key(result: Dict) -> str:
+    """Return a key identifying a single benchmark."""
+    return "%s:%s:%d" % (result["command"], result["format"], result["rows"])
+
+
+def regressions(results: List[Dict], baseline: List[Dict], tolerance: float):
+    """Return descriptions of results that are slower than the baseline."""
+    expected = {key(result): result for result in baseline}
+    slower = []
+    for result in results:
+        base = expected.get(key(result))
+        if (
+            base
+            and "rows_per_sec" in base
+            and "rows_per_sec" in result
+            and result["rows_per_sec"] < base["rows_per_sec"] * (1 - tolerance)
+        ):
+            slower.append(
+                "%s: %.0f rows/s, baseline %.0f rows/s"
+                % (key(result), result["rows_per_sec"], base["rows_per_sec"])
+            )
+    return slower
+
+
+def main(argv: List[str]) -> int:
+    """Run the benchmarks and check them against the baseline."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="comma separated numbers of readings in the synthetic databases",
+    )
+    parser.add_argument(
+        "--large",
+        action="store_true",
+        help="also benchmark a database of %d readings" % LARGE_SIZE,
+    )
+    parser.add_argument(
+        "--formats", default=",".join(FORMATS), help="comma separated output formats"
+    )
+    parser.add_argument(
+        "--excel-rows",
+        type=int,
+        default=DEFAULT_EXCEL_ROWS,
+        help="largest database to export to Excel",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random number seed")
+    parser.add_argument("--results", default=DEFAULT_RESULTS, help="results file")
+    parser.add_argument("--baseline", help="baseline file to compare against")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save these results as the new baseline",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="fraction by which rows/sec may fall before it is a regression",
+    )
+    args = parser.parse_args(argv[1:])
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline needs --baseline")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.large and LARGE_SIZE not in sizes:
+        sizes.append(LARGE_SIZE)
+    results = benchmark(sizes, args.formats.split(","), args.seed, args.excel_rows)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "results": results,
+    }
+    for filename in [args.results] + ([args.baseline] if args.save_baseline else []):
+        with open(filename, "w") as target:
+            json.dump(report, target, indent=2)
+
+    failed = [key(result) for result in results if result["returncode"]]
+    for failure in failed:
+        print("FAILED %s" % failure, file=sys.stderr)
+    if args.save_baseline or not args.baseline:
+        return 1 if failed else 0
+
+    with open(args.baseline, "r") as source:
+        baseline = json.load(source)
+    for field in ("python", "platform"):
+        if baseline[field] != report[field]:
+            print(
+                "WARNING baseline %s %s differs from %s"
+                % (field, baseline[field], report[field]),
+                file=sys.stderr,
+            )
+    slower = regressions(results, baseline["results"], args.tolerance)
+    for regression in slower:
+        print("REGRESSION %s" % regression, file=sys.stderr)
+    return 1 if slower or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
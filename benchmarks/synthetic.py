@@ -0,0 +1,114 @@
+"""Create synthetic GlucoLog databases of any size for benchmarking."""
+
+import os
+import random
+import sqlite3
+from typing import Iterator
+
+# The synthetic databases use exactly the same schema as the test database.
+from tests.mock_database import DATABASE, TABLES, NAME, COLUMNS, DATA
+
+# First day of readings; midday on 1-Jan-2000 in milliseconds, as the meter does.
+# Very large databases wrap around after twenty years, as though they were pooled
+# from several patients.
+FIRST_DAY = 946728000000
+DAYS = 20 * 365
+DAY_IN_MSECS = 24 * 60 * 60 * 1000
+HOUR_IN_MSECS = 60 * 60 * 1000
+
+# Periods of the day, as (start hour, name), matching the mock parameters.
+PERIODS = [
+    (0, "digiuno"),
+    (6, "mattino"),
+    (12, "primo_pomeriggio"),
+    (16, "tardo_pomeriggio"),
+    (19, "sera"),
+    (21, "notte"),
+]
+EVENTS = ["", "", "", "", "sport", "malattia", "festa"]
+COMMENTS = ["", "", "", "", "", "dopo colazione", "prima di pranzo", "ipo notturna"]
+INSULINS = [(1, "", "Humalog"), (2, "", "Lantus")]
+BATCH_SIZE = 10000
+
+
+def period(ora: int) -> str:
+    """Return the period of the day for a time in milliseconds."""
+    name = PERIODS[0][1]
+    for hour, period_name in PERIODS:
+        if ora >= hour * HOUR_IN_MSECS:
+            name = period_name
+    return name
+
+
+def readings(rows: int, seed: int) -> Iterator[tuple]:
+    """Generate realistic readings, several per day, with occasional doses."""
+    rng = random.Random(seed)
+    days = 0
+    _id = 0
+    while _id < rows:
+        for ora in sorted(
+            rng.randrange(DAY_IN_MSECS) for _ in range(rng.randint(4, 8))
+        ):
+            _id += 1
+            if _id > rows:
+                break
+            dose = rng.random() < 0.3
+            yield (
+                _id,
+                FIRST_DAY + days % DAYS * DAY_IN_MSECS,
+                ora // 60000 * 60000,
+                period(ora),
+                "",
+                "",
+                "",
+                "",
+                "",
+                rng.choice(EVENTS),
+                rng.choice(COMMENTS),
+                round(max(2.0, rng.gauss(8.0, 2.5)), 1),
+                rng.choice(["", 15, 30, 45, 60]),
+                rng.choice(INSULINS)[0] if dose else "",
+                rng.randint(2, 12) if dose else "",
+                "S",
+                "Glu",
+                "",
+                0,
+                "W",
+            )
+        days += 1
+
+
+def synthetic_database(filename: str, rows: int, seed: int = 0) -> None:
+    """Create a database with the given number of readings."""
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+    con = sqlite3.connect(filename)
+    cur = con.cursor()
+    for table in DATABASE[TABLES]:
+        columns = table[COLUMNS]
+        cur.execute(  # nosec
+            "CREATE TABLE {table} ({columns})".format(
+                table=table[NAME], columns=",".join(columns)
+            )
+        )
+        insert = "INSERT INTO {table} VALUES ({values})".format(  # nosec
+            table=table[NAME], values=",".join("?" * len(columns))
+        )
+        if table[NAME] == "t_risultati":
+            batch = []
+            for reading in readings(rows, seed):
+                batch.append(reading)
+                if len(batch) == BATCH_SIZE:
+                    cur.executemany(insert, batch)
+                    batch = []
+            cur.executemany(insert, batch)
+        elif table[NAME] == "t_insulina":
+            cur.executemany(insert, INSULINS)
+        else:
+            cur.executemany(insert, table.get(DATA, []))
+
+    con.commit()
+    con.close()
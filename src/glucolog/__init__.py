@@ -1 +1,13 @@
 """Package trigger file."""
+
+# The asynchronous API is only imported when it is used.
+ASYNC_API = ("aiter_rows", "export")
+
+
+def __getattr__(name):
+    """Return a function of the asynchronous API."""
+    if name in ASYNC_API:
+        from . import aio
+
+        return getattr(aio, name)
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
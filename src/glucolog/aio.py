@@ -0,0 +1,98 @@
+"""Asynchronous API for reading and exporting GlucoLog backup databases.
+
+SQLite and file access block, so all of the work is done in a thread executor and
+rows are handed to the event loop a batch at a time.
+"""
+
+import asyncio
+from functools import partial
+from typing import List
+
+from .glucolog import CSV, OPENPYXL, GlucoLogDatabase
+
+
+def table_batches(database: str, language: str, *args, **options):
+    """Generate batches of rows from a table, closing the database afterwards."""
+    with GlucoLogDatabase(database, language) as glucolog_database:
+        yield from glucolog_database.batches(*args, **options)
+
+
+def export_database(database: str, language: str, *args, **options) -> List[str]:
+    """Export from a database, returning the names of the files written."""
+    with GlucoLogDatabase(database, language) as glucolog_database:
+        return glucolog_database.export(*args, **options)
+
+
+async def aiter_rows(
+    database: str,
+    table: str,
+    columns: List[str] = None,
+    filters: dict = None,
+    *,
+    language: str = None,
+    periods: bool = False,
+    units: str = None,
+    excel: bool = False,
+    executor=None,
+):
+    """Generate the rows of a table, reading them in a thread executor.
+
+    The arguments are those of GlucoLogDatabase.rows(), with table and column names
+    given, and the rows translated, in the language if one is given.
+    """
+    loop = asyncio.get_running_loop()
+    batches = table_batches(
+        database,
+        language,
+        table,
+        columns,
+        filters,
+        periods=periods,
+        units=units,
+        excel=excel,
+    )
+    try:
+        while True:
+            batch = await loop.run_in_executor(executor, next, batches, None)
+            if batch is None:
+                break
+            for row in batch:
+                yield row
+    finally:
+        await loop.run_in_executor(executor, batches.close)
+
+
+async def export(
+    database: str,
+    output: str,
+    *,
+    table: str = None,
+    columns: List[str] = None,
+    output_format: str = CSV,
+    language: str = None,
+    periods: bool = False,
+    units: str = None,
+    excel_engine: str = OPENPYXL,
+    executor=None,
+) -> List[str]:
+    """Export a table, or the whole database, in a thread executor.
+
+    The arguments are those of GlucoLogDatabase.export() and the names of the files
+    written are returned.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor,
+        partial(
+            export_database,
+            database,
+            language,
+            output,
+            table,
+            columns,
+            output_format=output_format,
+            periods=periods,
+            units=units,
+            excel_engine=excel_engine,
+        ),
+    )
@@ -1,12 +1,27 @@
 """Read a GlucoLog backup database."""
+from __future__ import annotations
+
 import os
+import io
 import sys
 import re
+import hashlib
+import itertools
+import math
+import time
+import threading
+import cProfile
+from contextlib import closing, contextmanager
+from functools import lru_cache
+import json
+import fnmatch
+import pathlib
 import glob
 import argparse
 from argparse import Namespace
 import datetime
 import calendar
+from bisect import bisect_right
 from logging import (
     getLogger,
     StreamHandler,
@@ -16,29 +31,119 @@ from logging import (
     Formatter,
     FileHandler,
 )
-from typing import List
+from types import GeneratorType, MappingProxyType
+from typing import List, TYPE_CHECKING
 import sqlite3
 from sqlite3 import Cursor
-import csv
-import yaml
-from openpyxl import Workbook
-from openpyxl.styles import NamedStyle
-from openpyxl.worksheet.worksheet import Worksheet
+
+# The CSV, YAML and Excel modules are only imported when a command needs them, so
+# that short commands such as "list-tables" start quickly.
+if TYPE_CHECKING:  # pragma: no cover
+    from openpyxl.worksheet.worksheet import Worksheet
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Peak memory use is not available on Windows.
+    resource = None
 
 PROC_NAME = "glucolog"
 
 RGX_SAFE_SQL_NAME = re.compile(r"^[a-z_][a-z0-9_@$]*$", re.IGNORECASE)
 
 EXCEL_EPOCH = 25569
+EXCEL_LEAP_DAY = 60
+# The most rows, including the column names, that an Excel worksheet can hold.
+EXCEL_MAX_ROWS = 1048576
 DAY_IN_SECS = 24 * 60 * 60
 LANG_FILE_GLOB = "lang_??.yml"
+RGX_LANGUAGE = re.compile(r"^[a-z]{2}$")
+FMT_LANG_CACHE = "lang_{language}.v{version}.json"
+ALL_LANGUAGES = "all"
+FMT_LANGUAGE_OUTPUT = "{stem}.{language}{suffix}"
+LANG_CACHE_VERSION = 1
+XLAT_TO = "to"
+XLAT_FROM = "from"
 FMT_LANG_FILE = "lang_{language}.yml"
 
 # Output file formats.
 CSV = "csv"
 EXCEL = "excel"
-FORMAT_CHOICES = [CSV, EXCEL]
-FORMAT_SUFFIXES = {CSV: ".csv", EXCEL: ".xlsx"}
+NDJSON = "ndjson"
+FORMAT_CHOICES = [CSV, EXCEL, NDJSON]
+FORMAT_SUFFIXES = {CSV: ".csv", EXCEL: ".xlsx", NDJSON: ".ndjson"}
+# Each table in an NDJSON file starts with an object holding its name.
+NDJSON_TABLE = "table"
+# Databases can be dumped to a CSV file per table in a directory or zip archive.
+ZIP_SUFFIX = ".zip"
+
+# Excel spreadsheets are written by openpyxl or, faster, by glucolog itself.
+OPENPYXL = "openpyxl"
+NATIVE = "native"
+EXCEL_ENGINE_CHOICES = [OPENPYXL, NATIVE]
+
+# The parts of a spreadsheet written by glucolog itself.
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+RGX_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+XLSX_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+XLSX_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+XLSX_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+XLSX_SHEET = "xl/worksheets/sheet%d.xml"
+XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="%s" xmlns:r="%s">' % (XLSX_MAIN, XLSX_REL)
+)
+XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" '
+    'ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    "%s</Types>"
+)
+XLSX_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/%s" ContentType="application/'
+    'vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+XLSX_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="%s"><Relationship Id="rId1" Type="%s/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>' % (XLSX_PKG_REL, XLSX_REL)
+)
+XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="%s" xmlns:r="%s"><sheets>%%s</sheets></workbook>'
+    % (XLSX_MAIN, XLSX_REL)
+)
+XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="%s">%%s<Relationship Id="rId%%d" Type="%s/styles" '
+    'Target="styles.xml"/></Relationships>' % (XLSX_PKG_REL, XLSX_REL)
+)
+XLSX_SHEET_REL = '<Relationship Id="rId%%d" Type="%s/worksheet" Target="%%s"/>' % (
+    XLSX_REL
+)
+XLSX_STYLESHEET = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="%s"><numFmts count="%%d">%%s</numFmts>'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border>'
+    "</borders>"
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/>'
+    "</cellStyleXfs>"
+    '<cellXfs count="%%d"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" '
+    'xfId="0"/>%%s</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/>'
+    "</cellStyles></styleSheet>" % XLSX_MAIN
+)
+# Custom number formats are numbered from 164.
+XLSX_FIRST_FORMAT = 164
 
 
 # Translation file keys.
@@ -54,37 +159,228 @@ FUNC = "function"
 STYLE = "style"
 WIDTH = "width"
 DATA = "data"
+GLUCOSE = "glucose"
+
+# Columns of 't_parametri' that hold the start time of each period of the day.
+PERIOD_COLUMNS = [
+    "digiuno",
+    "mattino",
+    "primo_pomeriggio",
+    "tardo_pomeriggio",
+    "sera",
+    "notte",
+    "periodocustoms1",
+    "periodocustoms2",
+    "periodocustoms3",
+    "periodocustoms4",
+]
+
+# Custom periods that are not in use are either empty or left at this start time.
+CUSTOM_PERIOD_COLUMNS = PERIOD_COLUMNS[6:]
+CUSTOM_PERIOD_UNSET = "01:00"
+
+# Computed column giving the period of the day in which a reading was taken.
+PERIOD_TABLE = "t_risultati"
+PERIOD_TIME = "ora"
+PERIOD_COLUMN = "periodo_calcolato"
+
+# Glycaemia units, as recorded in 't_parametri.um_glicemia', and the conversion
+# between them, with the number of decimal places to which each is rounded.
+MG_DL = "mg/dl"
+MMOL_L = "mmol/l"
+UNITS_CHOICES = [MG_DL, MMOL_L]
+UM_GLICEMIA = {1: MG_DL, 2: MMOL_L}
+MG_DL_PER_MMOL_L = 18.0182
+UNITS_FACTOR = {
+    (MMOL_L, MG_DL): MG_DL_PER_MMOL_L,
+    (MG_DL, MMOL_L): 1 / MG_DL_PER_MMOL_L,
+}
+UNITS_PLACES = {MG_DL: 0, MMOL_L: 1}
+
+# Readings joined with the nearest preceding insulin dose, which is treated as a
+# table in its own right for formatting and translation.
+JOIN_TABLE = "t_risultati_insulina"
+JOIN_COLUMNS = [
+    "data",
+    "ora",
+    "periodo",
+    "risultato",
+    "data_dose",
+    "ora_dose",
+    "insulina",
+    "dose",
+]
+DEFAULT_WINDOW = 240
+DAY_IN_MSECS = DAY_IN_SECS * 1000
+
+# Full-text search of the free text held with each reading.  The index is cached in
+# a sidecar database named after the hash of the backup's contents.
+SEARCH_TABLE = "t_risultati"
+SEARCH_COLUMNS = ["commento", "evento"]
+SEARCH_INDEX_VERSION = 1
+FMT_SEARCH_INDEX = "{digest}.v{version}.fts"
+CACHE_ENV = "GLUCOLOG_CACHE"
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Catalog of a directory of backups, and the keys of each backup's entry.
+CATALOG_FILE = "glucolog-catalog.json"
+CATALOG_VERSION = 1
+DEFAULT_PATTERN = "*.dbglu"
+
+# A directory of backups can be watched, appending the readings added to each backup
+# since it was last exported to a file of its own.
+WATCH_TABLE = "t_risultati"
+WATCH_FORMATS = [CSV, NDJSON]
+WATCH_STATE_FILE = "glucolog-watch.json"
+WATCH_STATE_VERSION = 1
+DEFAULT_INTERVAL = 60
+HIGH_WATER = "high_water"
+OPTIONS = "options"
+
+# The backups in a directory can be served over HTTP.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_POOL_SIZE = 8
+JSON = "json"
+CONTENT_TYPES = {
+    CSV: "text/csv; charset=utf-8",
+    NDJSON: "application/x-ndjson",
+    JSON: "application/json",
+}
+SERVE_BACKUPS = "/backups"
+SERVE_TABLES = "/tables"
+SERVE_COLUMNS = "/columns"
+SERVE_EXPORT = "/export"
+SERVE_STATS = "/stats"
+REQUESTS = "requests"
+ERRORS = "errors"
+POOL_HITS = "pool_hits"
+POOL_MISSES = "pool_misses"
+POOL_EVICTIONS = "pool_evictions"
+VERSION = "version"
+BACKUPS = "backups"
+SIZE = "size"
+MTIME = "mtime"
+DIGEST = "sha256"
+ROWS = "rows"
+FIRST = "first"
+LAST = "last"
+PATIENT = "patient"
+PID = "pid"
+
+# Worksheet titles are limited in length and characters.
+RGX_BAD_SHEET_TITLE = re.compile(r"[\\/*?:\[\]]")
+MAX_SHEET_TITLE = 31
+
+# Rows are read, reformatted, translated and written in batches, and the time spent
+# in each of these stages is recorded per table.
+BATCH_SIZE = 1000
+STAGE_QUERY = "query"
+STAGE_FORMAT = "format"
+STAGE_TRANSLATE = "translate"
+STAGE_WRITE = "write"
+STAGE_CLOSE = "close"
+ALL_TABLES = "*"
+
+# Counts, and the run report, recorded per table.
+ROWS_READ = "rows_read"
+ROWS_WRITTEN = "rows_written"
+BYTES_WRITTEN = "bytes_written"
+REPORT_VERSION = 1
+SERVER_COUNTS = [
+    REQUESTS,
+    ERRORS,
+    ROWS_WRITTEN,
+    BYTES_WRITTEN,
+    POOL_HITS,
+    POOL_MISSES,
+    POOL_EVICTIONS,
+]
+
+# A single table is exported in parallel by splitting it into ranges of rowids, which
+# SQLite reads in the same order as a whole table.
+PARTITION_COLUMN = "rowid"
+# Each job exports several smaller ranges so that the work is evenly shared, and
+# rows are only held for a few ranges at a time while they wait to be written.
+PARTITIONS_PER_JOB = 4
+
+# Rows read for a spreadsheet are all written by the main process, so each range is
+# at most this many batches, and only a few ranges are waiting to be written at once.
+PARTITION_BATCHES = 10
+
+# Batches are handed between the threads of a pipelined export through queues of at
+# most this many batches, which are checked for being stopped every PIPELINE_POLL
+# seconds while they are full.
+PIPELINE_DEPTH = 4
+PIPELINE_POLL = 0.1
+
+# Dates and times repeat a great deal so the converters cache their results.
+CONVERTER_CACHE_SIZE = 4096
 
 # Errors.
 ERR_NO_SUCH_TABLE = "no such table"
 ERR_NO_SUCH_COLUMN = "no such column"
 
 
+# Set to a Tracer when calls are being traced.
+tracer = None
+
+
 def entry_exit(func):
     """Decorate a function with entry and exit tracing."""
     func_name = func.__name__
 
     def _entry_exit(*args, **kwargs):
         log.debug("Entry: { %s", func_name)
-        rsp = func(*args, **kwargs)
+        if tracer is None:
+            rsp = func(*args, **kwargs)
+        else:
+            tracer.enter(func_name)
+            try:
+                rsp = func(*args, **kwargs)
+            finally:
+                tracer.exit()
         log.debug("Exit: } %s", func_name)
+        if isinstance(rsp, GeneratorType):
+            return _iterate(rsp)
         return rsp
 
+    def _iterate(generator):
+        # Calling a generator function only creates the generator so the time spent
+        # producing each item is what is traced, as a call for every item.
+        with closing(generator):
+            while True:
+                if tracer is None:
+                    item = next(generator, _iterate)
+                else:
+                    tracer.enter(func_name)
+                    try:
+                        item = next(generator, _iterate)
+                    finally:
+                        tracer.exit()
+                if item is _iterate:
+                    return
+                yield item
+
     return _entry_exit
 
 
 # We have to define reformatting functions before the definition of
-# the reformatting.
+# the reformatting.  For Excel, dates and times are returned as Excel serial
+# numbers, the days since Excel's epoch, which a column number format displays as a
+# date or time, so that no conversion is needed for every cell as it is written.
+@lru_cache(maxsize=CONVERTER_CACHE_SIZE)
 @entry_exit
 def day_month_year(excel, value):
     """Parse a day-month-year datestamp."""
     datestamp = datetime.datetime.strptime(value, "%d-%m-%Y")
-    if not excel:
-        datestamp = datestamp.strftime("%Y-%m-%d")
+    if excel:
+        return excel_serial((datestamp - UNIX_EPOCH).days)
 
-    return datestamp
+    return datestamp.strftime("%Y-%m-%d")
 
 
+@lru_cache(maxsize=CONVERTER_CACHE_SIZE)
 @entry_exit
 def hour_minute(excel, value):
     """Parse an hour-minute timestamp."""
@@ -92,106 +388,131 @@ def hour_minute(excel, value):
     if value == "24:00":
         value = "00:00"
     timestamp = datetime.datetime.strptime(value, "%H:%M")
-    # if excel:
-    #    timestamp = time_to_days(timestamp)
-    # else:
-    if not excel:
-        timestamp = timestamp.strftime("%H:%M:00")
+    if excel:
+        return (timestamp.hour * 60 + timestamp.minute) * 60 / DAY_IN_SECS
 
-    return timestamp
+    return timestamp.strftime("%H:%M:00")
 
 
+@lru_cache(maxsize=CONVERTER_CACHE_SIZE)
 @entry_exit
 def unix_date_microseconds(excel, value):
     """Parse a unix timestamp with microseconds."""
-    datestamp = datetime.datetime.fromtimestamp(int(value / 1000))
-    # if excel:
-    #    datestamp = to_excel(datestamp)
-    # else:
-    if not excel:
-        datestamp = datestamp.strftime("%Y-%m-%d")
+    # Dates are in UTC, as they are when compared by date_milliseconds(), so that
+    # they are the same whatever the local time zone.
+    datestamp = UNIX_EPOCH + datetime.timedelta(seconds=int(value / 1000))
+    if excel:
+        return excel_serial((datestamp - UNIX_EPOCH).total_seconds() / DAY_IN_SECS)
 
-    return datestamp
+    return datestamp.strftime("%Y-%m-%d")
 
 
+@lru_cache(maxsize=CONVERTER_CACHE_SIZE)
 @entry_exit
 def time_seconds(excel, value):
     """Parse a timestamp in seconds of the day."""
     if excel:
-        # print(value)
-        timestamp = datetime.timedelta(seconds=int(value / 1000))
-        # timestamp = timedelta_to_days(timestamp)
-        # print(timestamp)
-        # sys.exit(9)
-    else:
-        today = datetime.date.timetuple(datetime.date.today())
-        today_seconds = calendar.timegm(today)
-        today_seconds = today_seconds + int(value / 1000)
-        timestamp = datetime.datetime.fromtimestamp(today_seconds)
-        timestamp = timestamp.strftime("%H:%M")
+        return int(value / 1000) / DAY_IN_SECS
 
-    return timestamp
+    # The time of day is the same whatever the date or time zone, so can be cached.
+    hours, seconds = divmod(int(value / 1000) % DAY_IN_SECS, 60 * 60)
+    return "%02d:%02d" % (hours, seconds // 60)
 
 
-date_style = NamedStyle(name="date", number_format="YYYY-MM-DD")
-time_style = NamedStyle(name="time", number_format="HH:MM")
+# Converters by name, so that the use of their caches can be reported.
+CONVERTERS = {
+    "day_month_year": day_month_year,
+    "hour_minute": hour_minute,
+    "unix_date_microseconds": unix_date_microseconds,
+    "time_seconds": time_seconds,
+}
+
+# Named styles for Excel cells, which are only created when a workbook uses them.
+DATE_STYLE = "date"
+TIME_STYLE = "time"
+NAMED_STYLES = {DATE_STYLE: "YYYY-MM-DD", TIME_STYLE: "HH:MM"}
+# Spreadsheets written by glucolog itself number these styles from 1.
+XLSX_STYLES = {name: iindex + 1 for iindex, name in enumerate(NAMED_STYLES)}
 
 # Identify fields that require special treatment.
 REFORMAT_FIELDS = {
     "t_parametri": {
         "data_nascita": {
             FUNC: day_month_year,
-            STYLE: date_style,
+            STYLE: DATE_STYLE,
             WIDTH: 12,
         },
         "digiuno": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "mattino": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "primo_pomeriggio": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "tardo_pomeriggio": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "sera": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "periodocustoms1": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "periodocustoms2": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "periodocustoms3": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "periodocustoms4": {
             FUNC: hour_minute,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
     },
     "t_risultati": {
         "data": {
             FUNC: unix_date_microseconds,
-            STYLE: date_style,
+            STYLE: DATE_STYLE,
+            WIDTH: 12,
+        },
+        "ora": {
+            FUNC: time_seconds,
+            STYLE: TIME_STYLE,
+        },
+        "periodo": {DATA: True},
+        "risultato": {GLUCOSE: True},
+        PERIOD_COLUMN: {DATA: True},
+    },
+    JOIN_TABLE: {
+        "data": {
+            FUNC: unix_date_microseconds,
+            STYLE: DATE_STYLE,
             WIDTH: 12,
         },
         "ora": {
             FUNC: time_seconds,
-            STYLE: time_style,
+            STYLE: TIME_STYLE,
         },
         "periodo": {DATA: True},
+        "data_dose": {
+            FUNC: unix_date_microseconds,
+            STYLE: DATE_STYLE,
+            WIDTH: 12,
+        },
+        "ora_dose": {
+            FUNC: time_seconds,
+            STYLE: TIME_STYLE,
+        },
     },
 }
 
@@ -199,12 +520,18 @@ REFORMAT_FIELDS = {
 log = getLogger()
 
 
+class GlucoLogError(Exception):
+    """Error raised when glucolog is used as a library and a command fails."""
+
+
 class CsvExport:
     """Class describing creation of a CSV file."""
 
     @entry_exit
     def __init__(self, filename: str):
         """Create a CSV file."""
+        import csv
+
         self.file = open(filename, "w", newline="")
         self.csv_writer = csv.writer(self.file)
         self.first_page = True
@@ -225,6 +552,11 @@ class CsvExport:
         """Write table column names to the CSV file."""
         self.csv_writer.writerow(columns)
 
+    @entry_exit
+    def layout(self, _worksheet: Worksheet, _table: str, _columns: List[str]) -> None:
+        """No layout in a CSV file."""
+        pass
+
     @entry_exit
     def format_worksheet(
         self, worksheet: Worksheet, _table: str, _columns: List[str]
@@ -237,6 +569,11 @@ class CsvExport:
         """Write a row of data to the CSV file."""
         self.csv_writer.writerow(data)
 
+    @entry_exit
+    def tell(self) -> int:
+        """Return the number of bytes written to the CSV file so far."""
+        return self.file.tell()
+
     @entry_exit
     def close(self):
         """Close the CSV file."""
@@ -245,46 +582,182 @@ class CsvExport:
         self.csv_writer = None
 
 
+class TableCsvExport(CsvExport):
+    """Class describing creation of a CSV file holding a single table."""
+
+    @entry_exit
+    def __init__(self, file, header: bool = True):
+        """Write CSV to an open text file, without a header if appending to it."""
+        import csv
+
+        self.file = file
+        self.csv_writer = csv.writer(self.file)
+        self.header = header
+
+    @entry_exit
+    def worksheet(self, title: str):
+        """Add nothing, since the file is named after the table."""
+        return None
+
+    @entry_exit
+    def columns(self, worksheet: Worksheet, columns: List[str]):
+        """Write table column names, unless the file already has them."""
+        if self.header:
+            super().columns(worksheet, columns)
+
+    @entry_exit
+    def tell(self):
+        """Return the number of bytes written so far, if the file can tell."""
+        # Files in a zip archive are written as a stream.
+        return self.file.tell() if self.file.seekable() else None
+
+
+class NdjsonExport:
+    """Class describing creation of a newline-delimited JSON file."""
+
+    @entry_exit
+    def __init__(self, filename: str):
+        """Create an NDJSON file."""
+        self.file = open(filename, "w", newline="")
+        self.keys = []
+
+    @entry_exit
+    def worksheet(self, title: str):
+        """Fake adding a worksheet to the NDJSON file."""
+        # As for CSV files, all the data goes in a single file with an object naming
+        # each table before the objects for its rows.
+        self.file.write(json.dumps({NDJSON_TABLE: title}) + "\n")
+        return None
+
+    @entry_exit
+    def columns(self, _worksheet: Worksheet, columns: List[str]):
+        """Use the table column names as the keys of each row."""
+        self.keys = columns
+
+    @entry_exit
+    def layout(self, _worksheet: Worksheet, _table: str, _columns: List[str]) -> None:
+        """No layout in an NDJSON file."""
+        pass
+
+    @entry_exit
+    def format_worksheet(
+        self, worksheet: Worksheet, _table: str, _columns: List[str]
+    ) -> None:
+        """No formatting in an NDJSON file."""
+        pass
+
+    @entry_exit
+    def data(self, _worksheet: Worksheet, data: List[str]):
+        """Write a row of data to the NDJSON file."""
+        self.file.write(json.dumps(dict(zip(self.keys, data))) + "\n")
+
+    @entry_exit
+    def tell(self) -> int:
+        """Return the number of bytes written to the NDJSON file so far."""
+        return self.file.tell()
+
+    @entry_exit
+    def close(self):
+        """Close the NDJSON file."""
+        self.file.close()
+        self.file = None
+
+
+class TableNdjsonExport(NdjsonExport):
+    """Class describing creation of an NDJSON file holding a single table."""
+
+    @entry_exit
+    def __init__(self, file):
+        """Write NDJSON to an open text file."""
+        self.file = file
+        self.keys = []
+
+    @entry_exit
+    def worksheet(self, title: str):
+        """Add nothing, since the file holds a single table."""
+        return None
+
+
 class ExcelExport:
     """Class describing creation of an Excel spreadsheet."""
 
     @entry_exit
     def __init__(self, filename: str):
         """Create an Excel Workbook."""
+        from openpyxl import Workbook
+
         self.excel_file = filename
         self.workbook = Workbook()
         self.workbook.iso_dates = True
+        self.styles = {}
+
+    @entry_exit
+    def named_style(self, name: str):
+        """Return a named style, creating it the first time that it is used."""
+        if name not in self.styles:
+            from openpyxl.styles import NamedStyle
+
+            self.styles[name] = NamedStyle(name=name, number_format=NAMED_STYLES[name])
+        return self.styles[name]
 
     @entry_exit
     def worksheet(self, title: str):
         """Create a new Excel worksheet."""
-        worksheet = self.workbook.create_sheet(title)
+        worksheet = self.workbook.create_sheet(
+            unique_sheet_title(title, self.workbook.sheetnames)
+        )
+        # Tables with more rows than a worksheet can hold are continued on further
+        # worksheets.
+        self.title = title
+        self.header = None
+        self.parts = [worksheet]
+        self.rows = 0
         return worksheet
 
+    @entry_exit
+    def rollover(self) -> None:
+        """Continue the table on a new worksheet, repeating the column names."""
+        title = rollover_title(self.title, len(self.parts) + 1)
+        log.info("Continuing '%s' on worksheet '%s'.", self.title, title)
+        self.parts.append(
+            self.workbook.create_sheet(
+                unique_sheet_title(title, self.workbook.sheetnames)
+            )
+        )
+        self.rows = 0
+        if self.header is not None:
+            self.parts[-1].append(self.header)
+            self.rows = 1
+
     @entry_exit
     def columns(self, worksheet: Worksheet, columns: List[str]):
         """Write the column names to the Excel worksheet."""
         worksheet.append(columns)
+        self.header = columns
+        self.rows += 1
+
+    @entry_exit
+    def layout(self, _worksheet: Worksheet, _table: str, _columns: List[str]) -> None:
+        """Nothing to do as the worksheet is formatted once it is written."""
+        pass
 
     @entry_exit
     def format_worksheet(
-        self, worksheet: Worksheet, table: str, columns: List[str]
+        self, _worksheet: Worksheet, table: str, columns: List[str]
     ) -> None:
-        """Set formatting for columns in the worksheet if appropriate."""
+        """Set formatting for columns in the worksheets of a table if appropriate."""
+        for worksheet in self.parts:
+            self.format_part(worksheet, table, columns)
+
+    @entry_exit
+    def format_part(self, worksheet: Worksheet, table: str, columns: List[str]):
+        """Set formatting for columns in one worksheet if appropriate."""
         for iindex, (cell,) in enumerate(worksheet.iter_cols(min_row=1, max_row=1)):
-            try:
-                style = REFORMAT_FIELDS[table][columns[iindex]][STYLE]
-                column_width = REFORMAT_FIELDS[table][columns[iindex]][WIDTH]
-                log.debug(
-                    "applying style '%s' to '%s:%s'.",
-                    style.name,
-                    table,
-                    columns[iindex],
-                )
-            except KeyError:
-                # This just means we don't want to style this field.
-                style = None
-                column_width = None
+            # Not every field has both a style and a width.
+            field = REFORMAT_FIELDS.get(table, {}).get(columns[iindex], {})
+            style = field.get(STYLE)
+            column_width = field.get(WIDTH)
+            log.debug("applying style '%s' to '%s:%s'.", style, table, columns[iindex])
 
             # First set the column width, if present.
             if column_width:
@@ -292,6 +765,7 @@ class ExcelExport:
                 log.debug("column width set to %d", column_width)
             if style:
                 # We have to loop over all cells and apply the style.
+                style = self.named_style(style)
                 for (cell,) in worksheet.iter_rows(
                     min_row=1, min_col=cell.column, max_col=cell.column
                 ):
@@ -299,16 +773,26 @@ class ExcelExport:
                     cell.style = style
 
     @entry_exit
-    def data(self, worksheet: Worksheet, data: List[str]):
+    def data(self, _worksheet: Worksheet, data: List[str]):
         """Write a row to the Excel worksheet."""
-        worksheet.append(data)
+        if self.rows >= EXCEL_MAX_ROWS:
+            self.rollover()
+        self.parts[-1].append(data)
+        self.rows += 1
+
+    @entry_exit
+    def tell(self):
+        """Return None because nothing is written until the workbook is closed."""
+        return None
 
     @entry_exit
     def close(self):
         """Write and close the Excel spreadsheet."""
-        # First remove the default "Sheet" worksheet.
-        sheet = self.workbook[DEFAULT_WORKSHEET]
-        self.workbook.remove(sheet)
+        # First remove the default "Sheet" worksheet, unless nothing was written and
+        # it is the only worksheet.
+        if len(self.workbook.worksheets) > 1:
+            sheet = self.workbook[DEFAULT_WORKSHEET]
+            self.workbook.remove(sheet)
 
         # Now write the workbook.
         self.workbook.save(filename=self.excel_file)
@@ -316,139 +800,770 @@ class ExcelExport:
         self.workbook = None
 
 
-@entry_exit
-def translate_table(args: Namespace, table: str):
-    """If possible, translate table name."""
-    log.debug("before: %s", table)
-    xlat_table = table
-    try:
-        xlat_table = args.xlat_to[TABLES][table]
-    except KeyError:
-        log.error("Missing '%s' translation for table '%s'.", args.xlat, table)
-        xlat_table = table
+def peak_memory():
+    """Return the peak memory use of this process in bytes, if it is known."""
+    if resource is None:  # pragma: no cover
+        return None
 
-    log.debug("after: %s", xlat_table)
-    return xlat_table
+    # Linux reports kilobytes but macOS reports bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
 
 
-@entry_exit
-def maybe_translate_table(args: Namespace, table: str):
-    """If possible, translate table name."""
-    log.debug("before: %s", table)
-    xlat_table = table
-    if args.xlat:
-        xlat_table = translate_table(args, table)
+class XlsxExport:
+    """Class describing creation of an Excel spreadsheet without openpyxl.
+
+    Each worksheet is streamed straight into the spreadsheet's zip file, so memory
+    use does not grow with the number of rows, with strings written inline and
+    dates and times written as numbers with a date or time format.
+    """
+
+    @entry_exit
+    def __init__(self, filename: str):
+        """Create an Excel spreadsheet."""
+        import zipfile
+
+        self.file = open(filename, "wb")
+        self.zip_file = zipfile.ZipFile(self.file, "w", zipfile.ZIP_DEFLATED)
+        self.titles = []
+        self.sheet = None
+        self.buffer = []
+        self.row = 0
+        self.letters = []
+        self.styles = []
+
+    def _write(self, xml: str) -> None:
+        """Buffer XML for the current worksheet, writing it out in blocks."""
+        self.buffer.append(xml)
+        if len(self.buffer) >= BATCH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write buffered XML to the current worksheet."""
+        self.sheet.write("".join(self.buffer).encode("utf-8"))
+        self.buffer = []
+
+    def _start_data(self) -> None:
+        """Start the rows of the current worksheet, after any column widths."""
+        if self.row == 0:
+            self._write("<sheetData>")
+
+    def _end_worksheet(self) -> None:
+        """Finish writing the current worksheet, if there is one."""
+        if self.sheet is not None:
+            self._start_data()
+            self._write("</sheetData></worksheet>")
+            self._flush()
+            self.sheet.close()
+            self.sheet = None
+
+    def _columns(self, count: int) -> None:
+        """Ensure that there are letters and styles for a number of columns."""
+        while len(self.letters) < count:
+            self.letters.append(column_letter(len(self.letters) + 1))
+        if len(self.styles) < count:
+            self.styles.extend([0] * (count - len(self.styles)))
+
+    def _start_worksheet(self, title: str) -> None:
+        """Start writing a worksheet."""
+        self._end_worksheet()
+        self.titles.append(unique_sheet_title(title, self.titles))
+        self.sheet = self.zip_file.open(
+            XLSX_SHEET % len(self.titles), "w", force_zip64=True
+        )
+        self._write(XLSX_SHEET_START)
+        self.row = 0
 
-    log.debug("after: %s", xlat_table)
-    return xlat_table
+    @entry_exit
+    def worksheet(self, title: str):
+        """Start a new Excel worksheet."""
+        self._start_worksheet(title)
+        # Tables with more rows than a worksheet can hold are continued on further
+        # worksheets, with the same layout.
+        self.title = title
+        self.parts = 1
+        self.header = None
+        self.cols = ""
+        self.styles = []
+        return len(self.titles)
 
+    @entry_exit
+    def rollover(self) -> None:
+        """Continue the table on a new worksheet, repeating the column names."""
+        self.parts += 1
+        title = rollover_title(self.title, self.parts)
+        log.info("Continuing '%s' on worksheet '%s'.", self.title, title)
+        self._start_worksheet(title)
+        self._write(self.cols)
+        if self.header is not None:
+            self.columns(len(self.titles), self.header)
 
-@entry_exit
-def maybe_translate_tables(args: Namespace, tables: List[str]):
-    """If possible, translate table names."""
-    log.debug("before: %s", tables)
-    xlat_tables = list(tables)
-    if args.xlat:
-        for iindex, table in enumerate(tables):
-            xlat_tables[iindex] = translate_table(args, table)
+    @entry_exit
+    def layout(self, _worksheet: int, table: str, columns: List[str]) -> None:
+        """Set the style and width of the columns, before any rows are written."""
+        self._columns(len(columns))
+        widths = []
+        for iindex, column in enumerate(columns):
+            field = REFORMAT_FIELDS.get(table, {}).get(column, {})
+            self.styles[iindex] = XLSX_STYLES.get(field.get(STYLE), 0)
+            if field.get(WIDTH):
+                widths.append(
+                    '<col min="%d" max="%d" width="%d" customWidth="1"/>'
+                    % (iindex + 1, iindex + 1, field[WIDTH])
+                )
+        if widths:
+            self.cols = "<cols>%s</cols>" % "".join(widths)
+            self._write(self.cols)
 
-    log.debug("after: %s", xlat_tables)
-    return xlat_tables
+    @entry_exit
+    def columns(self, worksheet: int, columns: List[str]):
+        """Write the column names to the Excel worksheet."""
+        # The column names are not styled as dates or times.
+        styles, self.styles = self.styles, []
+        self.data(worksheet, columns)
+        self.styles = styles
+        self.header = columns
 
+    @entry_exit
+    def format_worksheet(self, _worksheet: int, _table: str, _columns: List[str]):
+        """Nothing to do as each cell is formatted as it is written."""
+        pass
 
-@entry_exit
-def maybe_translate_table_from(args: Namespace, xlat_table: str):
-    """Reverse translate a table name."""
-    log.debug("xlat_table: %s", xlat_table)
-    table = xlat_table
-    if args.xlat:
+    @entry_exit
+    def data(self, _worksheet: int, data: List[str]):
+        """Write a row to the Excel worksheet."""
+        if self.row >= EXCEL_MAX_ROWS:
+            self.rollover()
+        self._start_data()
+        self.row += 1
+        self._columns(len(data))
+        cells = []
+        for letter, style, value in zip(self.letters, self.styles, data):
+            if value is None or value == "":
+                continue
+            if isinstance(value, str):
+                cells.append(
+                    '<c r="%s%d" t="inlineStr"><is><t xml:space="preserve">%s</t>'
+                    "</is></c>" % (letter, self.row, xml_escape(value))
+                )
+                continue
+            if isinstance(value, float) and not math.isfinite(value):
+                # Excel has no infinities or NaNs, so they are left empty.
+                continue
+            if isinstance(value, bool):
+                cells.append(
+                    '<c r="%s%d" t="b"><v>%d</v></c>' % (letter, self.row, value)
+                )
+                continue
+            if isinstance(value, datetime.datetime):
+                value = excel_serial((value - UNIX_EPOCH).total_seconds() / DAY_IN_SECS)
+                style = style or XLSX_STYLES[DATE_STYLE]
+            elif isinstance(value, datetime.date):
+                value = excel_serial((value - UNIX_EPOCH.date()).days)
+                style = style or XLSX_STYLES[DATE_STYLE]
+            elif isinstance(value, datetime.timedelta):
+                value = value.total_seconds() / DAY_IN_SECS
+                style = style or XLSX_STYLES[TIME_STYLE]
+            elif isinstance(value, datetime.time):
+                value = (
+                    value.hour * 3600 + value.minute * 60 + value.second
+                ) / DAY_IN_SECS
+                style = style or XLSX_STYLES[TIME_STYLE]
+            elif not isinstance(value, (int, float)):
+                cells.append(
+                    '<c r="%s%d" t="inlineStr"><is><t xml:space="preserve">%s</t>'
+                    "</is></c>" % (letter, self.row, xml_escape(str(value)))
+                )
+                continue
+            cells.append(
+                '<c r="%s%d"%s><v>%r</v></c>'
+                % (letter, self.row, ' s="%d"' % style if style else "", value)
+            )
+        self._write('<row r="%d">%s</row>' % (self.row, "".join(cells)))
+
+    @entry_exit
+    def tell(self) -> int:
+        """Return the number of bytes written to the spreadsheet so far."""
+        return self.file.tell()
+
+    @entry_exit
+    def close(self):
+        """Write the workbook's parts and close the Excel spreadsheet."""
+        self._end_worksheet()
+        if not self.titles:
+            # A workbook must have at least one worksheet.
+            self.worksheet(DEFAULT_WORKSHEET)
+            self._end_worksheet()
+
+        sheets = range(1, len(self.titles) + 1)
+        self.zip_file.writestr(
+            "[Content_Types].xml",
+            XLSX_CONTENT_TYPES
+            % "".join(
+                XLSX_SHEET_CONTENT_TYPE % (XLSX_SHEET % sheet) for sheet in sheets
+            ),
+        )
+        self.zip_file.writestr("_rels/.rels", XLSX_RELS)
+        self.zip_file.writestr(
+            "xl/workbook.xml",
+            XLSX_WORKBOOK
+            % "".join(
+                '<sheet name="%s" sheetId="%d" r:id="rId%d"/>'
+                % (xml_escape(title), sheet, sheet)
+                for sheet, title in zip(sheets, self.titles)
+            ),
+        )
+        self.zip_file.writestr(
+            "xl/_rels/workbook.xml.rels",
+            XLSX_WORKBOOK_RELS
+            % (
+                "".join(
+                    XLSX_SHEET_REL % (sheet, (XLSX_SHEET % sheet)[3:])
+                    for sheet in sheets
+                ),
+                len(self.titles) + 1,
+            ),
+        )
+        self.zip_file.writestr(
+            "xl/styles.xml",
+            XLSX_STYLESHEET
+            % (
+                len(NAMED_STYLES),
+                "".join(
+                    '<numFmt numFmtId="%d" formatCode="%s"/>'
+                    % (XLSX_FIRST_FORMAT + iindex, xml_escape(number_format))
+                    for iindex, number_format in enumerate(NAMED_STYLES.values())
+                ),
+                len(NAMED_STYLES) + 1,
+                "".join(
+                    '<xf numFmtId="%d" fontId="0" fillId="0" borderId="0" xfId="0" '
+                    'applyNumberFormat="1"/>' % (XLSX_FIRST_FORMAT + iindex)
+                    for iindex in range(len(NAMED_STYLES))
+                ),
+            ),
+        )
+        self.zip_file.close()
+        self.file.close()
+        self.zip_file = None
+        self.file = None
+
+
+def excel_serial(days: float) -> float:
+    """Return the Excel serial number of a date, given in days since 1970."""
+    serial = days + EXCEL_EPOCH
+    # Excel believes that 1900 was a leap year so earlier dates are a day out.
+    if serial < EXCEL_LEAP_DAY:
+        serial -= 1
+    return serial
+
+
+def rollover_title(title: str, part: int) -> str:
+    """Return the title of a worksheet that continues a table."""
+    suffix = " (%d)" % part
+    return title[: MAX_SHEET_TITLE - len(suffix)] + suffix
+
+
+def unique_sheet_title(title: str, titles: List[str]) -> str:
+    """Make a title usable as the title of another worksheet in a workbook."""
+    title = sheet_title(title)
+    # As openpyxl does, duplicates are numbered, ignoring case as Excel does.
+    used = {used.lower() for used in titles}
+    unique, number = title, 0
+    while unique.lower() in used:
+        number += 1
+        suffix = str(number)
+        unique = title[: MAX_SHEET_TITLE - len(suffix)] + suffix
+    return unique
+
+
+def column_letter(column: int) -> str:
+    """Return the letters of a spreadsheet column, counting from 1."""
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def xml_escape(value: str) -> str:
+    """Escape a string for XML, removing characters that XML does not allow."""
+    value = RGX_XML_ILLEGAL.sub("", value)
+    return (
+        value.replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+    )
+
+
+# Export file classes for each output format, and Excel engine.
+EXPORTERS = {CSV: CsvExport, EXCEL: ExcelExport, NDJSON: NdjsonExport}
+EXCEL_EXPORTERS = {OPENPYXL: ExcelExport, NATIVE: XlsxExport}
+
+
+def export_class(args: Namespace, output_format: str):
+    """Return the class that writes an output format."""
+    if output_format == EXCEL:
+        return EXCEL_EXPORTERS[args.excel_engine]
+    return EXPORTERS[output_format]
+
+
+class ExportSink:
+    """Class writing rows to one export file, in one language."""
+
+    __slots__ = ("translator", "export_file", "excel", "worksheet", "plan")
+
+    @entry_exit
+    def __init__(self, translator: Translator, export_file, excel: bool):
+        """Write to an export file, translating with the translator."""
+        self.translator = translator
+        self.export_file = export_file
+        self.excel = excel
+        self.worksheet = None
+        self.plan = ()
+
+    @entry_exit
+    def start_table(self, it_table: str, ot_columns: List[str], title: str = None):
+        """Start a worksheet for a table, with a header of translated column names."""
+        self.worksheet = self.export_file.worksheet(
+            title or self.translator.table(it_table)
+        )
+        self.export_file.layout(self.worksheet, it_table, ot_columns)
+        self.export_file.columns(self.worksheet, self.translator.columns(ot_columns))
+        self.plan = self.translator.row_plan(it_table, ot_columns)
+
+
+class ExportStats:
+    """Class recording the rows, bytes and time spent in each export stage."""
+
+    def __init__(self):
+        """Start with nothing recorded."""
+        self.times = {}
+        self.counts = {}
+        # Tables can be exported by several threads at once.
+        self.lock = threading.Lock()
+        self.started = datetime.datetime.now()
+        self.wall, self.cpu = time.perf_counter(), time.process_time()
+        # Converter caches live as long as the process, so only report on their use
+        # since we started.
+        self.caches = {name: func.cache_info() for name, func in CONVERTERS.items()}
+
+    @contextmanager
+    def stage(self, table: str, stage: str):
+        """Record the time spent in a stage of exporting a table."""
+        wall, cpu = time.perf_counter(), time.process_time()
         try:
-            # Reverse translation only happens if the user gives is local language
-            # values to translate and these MUST match those in the appropriate language
-            # file.
-            table = args.xlat_from[TABLES][xlat_table]
-        except KeyError:
+            yield
+        finally:
+            with self.lock:
+                times = self.times.setdefault(table, {}).setdefault(stage, [0.0, 0.0])
+                times[0] += time.perf_counter() - wall
+                times[1] += time.process_time() - cpu
+
+    def count(self, table: str, counter: str, value: int) -> None:
+        """Add to a count, such as the rows read, for a table."""
+        with self.lock:
+            counts = self.counts.setdefault(table, {})
+            counts[counter] = counts.get(counter, 0) + value
+
+    def merge(self, times: dict, counts: dict) -> None:
+        """Add the times and counts recorded by another process."""
+        with self.lock:
+            for table, stages in times.items():
+                for stage, (wall, cpu) in stages.items():
+                    total = self.times.setdefault(table, {}).setdefault(
+                        stage, [0.0, 0.0]
+                    )
+                    total[0] += wall
+                    total[1] += cpu
+            for table, table_counts in counts.items():
+                total = self.counts.setdefault(table, {})
+                for counter, value in table_counts.items():
+                    total[counter] = total.get(counter, 0) + value
+
+    def log_times(self) -> None:
+        """Log the time spent in each stage for each table."""
+        for table, stages in self.times.items():
+            for stage, (wall, cpu) in stages.items():
+                log.info(
+                    "%s: %s took %.3fs wall-clock, %.3fs CPU", table, stage, wall, cpu
+                )
+
+    def report(self, args: Namespace, completed: bool) -> dict:
+        """Return a report of the run that can be written as JSON."""
+        wall = time.perf_counter() - self.wall
+        tables = {}
+        for table in sorted(set(self.times) | set(self.counts)):
+            if table == ALL_TABLES:
+                continue
+            stages = self.times.get(table, {})
+            counts = self.counts.get(table, {})
+            seconds = {
+                stage: round(stages.get(stage, [0.0, 0.0])[0], 6)
+                for stage in (STAGE_QUERY, STAGE_FORMAT, STAGE_TRANSLATE, STAGE_WRITE)
+            }
+            busy = sum(seconds.values())
+            tables[table] = {
+                ROWS_READ: counts.get(ROWS_READ, 0),
+                ROWS_WRITTEN: counts.get(ROWS_WRITTEN, 0),
+                BYTES_WRITTEN: counts.get(BYTES_WRITTEN),
+                "query_seconds": seconds[STAGE_QUERY],
+                "transform_seconds": round(
+                    seconds[STAGE_FORMAT] + seconds[STAGE_TRANSLATE], 6
+                ),
+                "write_seconds": seconds[STAGE_WRITE],
+                "rows_per_second": (
+                    round(counts.get(ROWS_WRITTEN, 0) / busy, 1) if busy else None
+                ),
+            }
+
+        converters = {}
+        for name, func in CONVERTERS.items():
+            info, old_info = func.cache_info(), self.caches[name]
+            hits, misses = info.hits - old_info.hits, info.misses - old_info.misses
+            converters[name] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            }
+
+        output = getattr(args, "output", None)
+        outputs = [
+            output for output in getattr(args, "outputs", []) if os.path.isfile(output)
+        ]
+        close = self.times.get(ALL_TABLES, {}).get(STAGE_CLOSE, [0.0, 0.0])
+        return {
+            "version": REPORT_VERSION,
+            "command": args.cmd,
+            "database": args.database,
+            "output": output,
+            "format": getattr(args, "format", None),
+            "started": self.started.isoformat(timespec="seconds"),
+            "completed": completed,
+            "seconds": round(wall, 6),
+            "cpu_seconds": round(time.process_time() - self.cpu, 6),
+            "close_seconds": round(close[0], 6),
+            BYTES_WRITTEN: (
+                sum(os.path.getsize(output) for output in outputs) if outputs else None
+            ),
+            "peak_memory_bytes": peak_memory(),
+            "tables": tables,
+            "converters": converters,
+        }
+
+
+class Tracer:
+    """Class recording calls of entry_exit functions as Chrome trace-event spans."""
+
+    def __init__(self):
+        """Start with no spans recorded."""
+        self.origin = time.perf_counter_ns()
+        self.threads = []
+        self.local = threading.local()
+
+    def _frames(self) -> list:
+        """Return the stack of calls for this thread."""
+        try:
+            return self.local.frames
+        except AttributeError:
+            # Each frame is [name, start, index of first event, last event] and the
+            # first frame is a placeholder for the calls made outside any other.
+            # Thread idents are reused once a thread ends so each thread's events are
+            # kept in a list of their own rather than by ident.
+            self.local.events = []
+            self.threads.append(self.local.events)
+            self.local.frames = [[None, None, 0, None]]
+            return self.local.frames
+
+    def enter(self, name: str) -> None:
+        """Record the start of a call."""
+        frames = self._frames()
+        frames.append([name, time.perf_counter_ns(), len(self.local.events), None])
+
+    def exit(self) -> None:
+        """Record the end of a call, merging it with a repeat of the previous call."""
+        end = time.perf_counter_ns()
+        frames = self._frames()
+        events = self.local.events
+        name, start, first, _last = frames.pop()
+        parent = frames[-1]
+        previous = parent[3]
+
+        # Calls made for every row or cell would flood the trace so a call of the same
+        # function as the one before it is merged into the same span, and only the
+        # calls made by the first of them are kept.
+        if previous is not None and previous["name"] == name:
+            del events[first:]
+            previous["dur"] = (end - self.origin) / 1000 - previous["ts"]
+            previous["args"]["calls"] += 1
+            previous["args"]["total_ms"] += (end - start) / 1000000
+            return
+
+        event = {
+            "name": name,
+            "cat": PROC_NAME,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {"calls": 1, "total_ms": (end - start) / 1000000},
+        }
+        events.append(event)
+        parent[3] = event
+
+    def trace(self) -> dict:
+        """Return the spans in Chrome trace-event format."""
+        return {
+            "traceEvents": [event for events in self.threads for event in events],
+            "displayTimeUnit": "ms",
+        }
+
+
+class Translator:
+    """Class translating table names, column names and data to and from a language."""
+
+    __slots__ = (
+        "language",
+        "to_tables",
+        "from_tables",
+        "to_columns",
+        "from_columns",
+        "to_data",
+    )
+
+    @entry_exit
+    def __init__(self, language: str = None):
+        """Read the language file, if any, for the translations in both directions."""
+        self.language = language
+        xlat_to, xlat_from = read_language_file(language) if language else ({}, {})
+        xlat_to, xlat_from = xlat_to or {}, xlat_from or {}
+        self.to_tables = MappingProxyType(xlat_to.get(TABLES, {}))
+        self.from_tables = MappingProxyType(xlat_from.get(TABLES, {}))
+        self.to_columns = MappingProxyType(xlat_to.get(COLUMNS, {}))
+        self.from_columns = MappingProxyType(xlat_from.get(COLUMNS, {}))
+        self.to_data = MappingProxyType(xlat_to.get(DATA, {}))
+
+    def table(self, table: str) -> str:
+        """Translate a table name."""
+        if not self.language:
+            return table
+        xlat_table = self.to_tables.get(table)
+        if xlat_table is None:
+            log.error("Missing '%s' translation for table '%s'.", self.language, table)
+            return table
+        return xlat_table
+
+    def tables(self, tables: List[str]) -> List[str]:
+        """Translate a list of table names."""
+        return [self.table(table) for table in tables]
+
+    def table_from(self, xlat_table: str) -> str:
+        """Reverse translate a table name."""
+        if not self.language:
+            return xlat_table
+        # Reverse translation only happens if the user gives is local language values
+        # to translate and these MUST match those in the appropriate language file.
+        table = self.from_tables.get(xlat_table)
+        if table is None:
             log.error("Table '%s' is not recognised." % xlat_table)
             sys.exit(2)
+        return table
+
+    def columns(self, columns: List[str]) -> List[str]:
+        """Translate a header of column names."""
+        if not self.language:
+            return list(columns)
+        xlat_columns = []
+        for column in columns:
+            xlat_column = self.to_columns.get(column)
+            if xlat_column is None:
+                log.error(
+                    "Missing '%s' translation for column '%s'.", self.language, column
+                )
+                xlat_column = column
+            xlat_columns.append(xlat_column)
+        return xlat_columns
+
+    def columns_from(self, xlat_columns: List[str]) -> List[str]:
+        """Reverse translate column names."""
+        if not self.language:
+            return list(xlat_columns)
+        columns = []
+        for xlat_column in xlat_columns:
+            column = self.from_columns.get(xlat_column)
+            if column is None:
+                log.error("Column '%s' is not recognised." % xlat_column)
+                sys.exit(2)
+            columns.append(column)
+        return columns
+
+    def row_plan(self, table: str, columns: List[str]) -> tuple:
+        """Return the (index, column) of the columns whose data is translated."""
+        if not self.language:
+            return ()
+        fields = REFORMAT_FIELDS.get(table, {})
+        return tuple(
+            (iindex, column)
+            for iindex, column in enumerate(columns)
+            if fields.get(column, {}).get(DATA)
+        )
+
+    def rows(self, table: str, plan: tuple, rows: List[tuple]) -> List[tuple]:
+        """Translate the data of a batch of rows, following a plan from row_plan()."""
+        if not plan:
+            return rows
+        return [self.row(table, plan, row) for row in rows]
+
+    def row(self, table: str, plan: tuple, row: tuple) -> tuple:
+        """Translate the data of a row, following a plan from row_plan()."""
+        if not plan:
+            return row
+        data = list(row)
+        for iindex, column in plan:
+            # Yes, some data fields are empty!
+            value = data[iindex]
+            if value:
+                xlat_value = self.to_data.get(value)
+                if xlat_value is None:
+                    log.error(
+                        "Missing '%s' translation for data '%s' from column '%s:%s'.",
+                        self.language,
+                        value,
+                        table,
+                        column,
+                    )
+                else:
+                    data[iindex] = xlat_value
+        return tuple(data)
+
+
+class MealPeriods:
+    """Class assigning times of day to the periods configured in 't_parametri'."""
+
+    @entry_exit
+    def __init__(self, boundaries: List[tuple]):
+        """Sort the (seconds, period) boundaries ready for searching."""
+        # Sort on the start time but keep the configured order for equal times.
+        boundaries = sorted(
+            (seconds, iindex, period)
+            for iindex, (seconds, period) in enumerate(boundaries)
+        )
+        self.starts = [seconds for seconds, _iindex, _period in boundaries]
+        self.periods = [period for _seconds, _iindex, period in boundaries]
+
+    def period(self, value) -> str:
+        """Return the period for a time in milliseconds of the day."""
+        if not self.starts or not isinstance(value, int):
+            return ""
+
+        # A time before the first boundary belongs to the last period of the
+        # previous day, which is conveniently what index -1 gives us.
+        return self.periods[bisect_right(self.starts, value // 1000) - 1]
+
 
-    log.debug("table: %s", table)
-    return table
+def seconds_of_day(value) -> int:
+    """Convert an 'HH:MM' period boundary into seconds of the day."""
+    # The data can contain "24:00" which is not a valid time!
+    hours, minutes = value.split(":")
+    return (int(hours) * 60 + int(minutes)) * 60 % DAY_IN_SECS
 
 
 @entry_exit
-def maybe_translate_columns(args: Namespace, columns: List[str]):
-    """If possible, translate column names."""
-    log.debug("before: %s", columns)
-    xlat_columns = list(columns)
-    if args.xlat:
-        for iindex, column in enumerate(columns):
-            try:
-                xlat_columns[iindex] = args.xlat_to[COLUMNS][column]
-            except KeyError:
-                log.error(
-                    "Missing '%s' translation for column '%s'.", args.xlat, column
-                )
-                xlat_columns[iindex] = column
+def read_meal_periods(args: Namespace, cur: Cursor):
+    """Read the period boundaries from the 't_parametri' table."""
+    try:
+        row = cur.execute(  # nosec
+            "SELECT %s FROM t_parametri LIMIT 1" % ",".join(PERIOD_COLUMNS)
+        ).fetchone()
+    except sqlite3.OperationalError as ee:
+        log.warning("Unable to read period boundaries: %s", ee)
+        row = None
+
+    boundaries = []
+    starts = set()
+    for period, value in zip(PERIOD_COLUMNS, row or []):
+        try:
+            seconds = seconds_of_day(value)
+        except (AttributeError, ValueError):
+            log.debug("ignoring boundary '%s' for period '%s'", value, period)
+            continue
+
+        # A custom period starting with another period would hide that period.
+        if period in CUSTOM_PERIOD_COLUMNS and (
+            value == CUSTOM_PERIOD_UNSET or seconds in starts
+        ):
+            log.debug("ignoring boundary '%s' for period '%s'", value, period)
+            continue
 
-    log.debug("after: %s", xlat_columns)
-    return xlat_columns
+        starts.add(seconds)
+        boundaries.append((seconds, period))
+
+    log.debug("boundaries: %s", boundaries)
+    return MealPeriods(boundaries)
 
 
 @entry_exit
-def maybe_translate_columns_from(args: Namespace, columns: List[str]):
-    """If possible, translate column names."""
-    log.debug("before: %s", columns)
-    it_columns = list(columns)
-    if args.xlat:
-        for iindex, column in enumerate(columns):
-            try:
-                # Reverse translation only happens if the user gives is local language
-                # values to translate and these MUST match those in the appropriate
-                # language file.
-                it_columns[iindex] = args.xlat_from[COLUMNS][column]
-            except KeyError:
-                log.error("Column '%s' is not recognised." % column)
-                sys.exit(2)
+def read_glucose_units(args: Namespace, cur: Cursor):
+    """Read the glycaemia units used by the meter from the 't_parametri' table."""
+    try:
+        row = cur.execute("SELECT um_glicemia FROM t_parametri LIMIT 1").fetchone()
+    except sqlite3.OperationalError as ee:
+        log.warning("Unable to read glycaemia units: %s", ee)
+        row = None
 
-    log.debug("after: %s", it_columns)
-    return it_columns
+    units = UM_GLICEMIA.get(row[0]) if row else None
+    log.debug("units: %s", units)
+    return units
 
 
 @entry_exit
-def maybe_translate_data(
-    args: Namespace, it_table, it_columns: List[str], it_data: tuple
+def select_expressions(
+    args: Namespace, cur: Cursor, it_table: str, it_columns: List[str]
 ):
-    """If possible, translate column names."""
-    log.debug("before: %s", it_data)
-    data = list(it_data)
-    if args.xlat:
-        for iindex, it_column in enumerate(it_columns):
-            try:
-                if REFORMAT_FIELDS[it_table][it_column][DATA]:
-                    try:
-                        # Yes, some data fields are empty!
-                        if data[iindex]:
-                            data[iindex] = args.xlat_to[DATA][it_data[iindex]]
-                    except KeyError:
-                        log.error(
-                            (
-                                "Missing '%s' translation for data '%s' "
-                                "from column '%s:%s'."
-                            ),
-                            args.xlat,
-                            it_data[iindex],
-                            it_table,
-                            it_column,
-                        )
-                        raise KeyError("Just to trigger arm below...")
-
-            except KeyError:
-                # This just means that we don't need a translation of this
-                # data field.
-                pass
-
-    log.debug("after: %s", data)
-    return tuple(data)
+    """Return the SQL expressions that select the columns from a table."""
+    # Any unit conversion is pushed into the SELECT so that SQLite performs it
+    # as the rows are read rather than us touching every row in Python.
+    it_expressions = list(it_columns)
+    it_glucose = [
+        iindex
+        for iindex, it_column in enumerate(it_columns)
+        if REFORMAT_FIELDS.get(it_table, {}).get(it_column, {}).get(GLUCOSE)
+    ]
+    if getattr(args, "units", None) and it_glucose:
+        units = read_glucose_units(args, cur)
+        if units is None:
+            log.warning("Glycaemia units are unknown so results are not converted.")
+        elif units != args.units:
+            log.info("Converting glycaemia from '%s' to '%s'.", units, args.units)
+            expression = "ROUND(%%s * %r, %d)" % (
+                UNITS_FACTOR[(units, args.units)],
+                UNITS_PLACES[args.units],
+            )
+            if UNITS_PLACES[args.units] == 0:
+                expression = "CAST(%s AS INTEGER)" % expression
+            for iindex in it_glucose:
+                it_column = it_columns[iindex]
+                # Empty results are left alone.
+                it_expressions[iindex] = (
+                    "CASE WHEN typeof(%s) IN ('integer', 'real') THEN %s ELSE %s END"
+                    % (it_column, expression % it_column, it_column)
+                )
+
+    log.debug("expressions: %s", it_expressions)
+    return it_expressions
+
+
+@entry_exit
+def computed_columns(args: Namespace, it_table: str, it_columns: List[str]):
+    """Return the names of the columns that will be exported for a table."""
+    it_columns = list(it_columns)
+    if getattr(args, "periods", False) and it_table == PERIOD_TABLE:
+        if PERIOD_TIME in it_columns:
+            it_columns.append(PERIOD_COLUMN)
+
+    log.debug("columns: %s", it_columns)
+    return it_columns
 
 
 @entry_exit
@@ -467,7 +1582,7 @@ def do_list_tables(args: Namespace, cur: Cursor):
     print("Tables found")
     print("============")
     rows = list_tables(args, cur)
-    rows = maybe_translate_tables(args, rows)
+    rows = args.translator.tables(rows)
     for row in rows:
         print(row)
 
@@ -502,24 +1617,24 @@ def do_list_columns(args: Namespace, cur: Cursor):
     """List the columns available from the indicated table."""
     assert "table" in args, "Table name should have been supplied"
 
-    table = maybe_translate_table_from(args, args.table)
+    table = args.translator.table_from(args.table)
 
     title = "Columns for table '%s'" % args.table
     print(title)
     print("=" * len(title))
     columns = list_columns(args, cur, table)
-    columns = maybe_translate_columns(args, columns)
+    columns = args.translator.columns(columns)
     for column in columns:
         print(column)
 
 
-def format_data(args: Namespace, it_table: str, it_columns: List[str], it_row: tuple):
+def format_data(excel: bool, it_table: str, it_columns: List[str], it_row: tuple):
     """Reformat the data in rows, typically for time or date formatting."""
     formatted_row = list(it_row)
     for iindex, it_column in enumerate(it_columns):
         try:
             formatted_row[iindex] = REFORMAT_FIELDS[it_table][it_column][FUNC](
-                args.format == EXCEL, it_row[iindex]
+                excel, it_row[iindex]
             )
         except KeyError:
             # Just means there is no reformatter for this field.
@@ -528,8 +1643,16 @@ def format_data(args: Namespace, it_table: str, it_columns: List[str], it_row: t
     return tuple(formatted_row)
 
 
-def export_data(args: Namespace, cur: Cursor, it_table: str, it_columns: List[str]):
-    """Write a CSV file that contains the columns from a specific table."""
+@entry_exit
+def export_batches(
+    args: Namespace,
+    cur: Cursor,
+    it_table: str,
+    it_columns: List[str],
+    where: str = "",
+    parameters: tuple = (),
+):
+    """Generate batches of reformatted rows from a table, keyed by the Excel flag."""
     # Each row is returned as a tuple...
     assert RGX_SAFE_SQL_NAME.match(it_table), (
         "'%s' is an invalid table name and could be used for an "
@@ -540,10 +1663,53 @@ def export_data(args: Namespace, cur: Cursor, it_table: str, it_columns: List[st
             "'%s' is an invalid column name and could be used for an "
             "SQL injection attack." % it_column
         )
-    try:
-        it_rows = cur.execute(  # nosec
-            "SELECT %s FROM %s" % (",".join(it_columns), it_table)
+
+    # Computed columns are appended to each row as it is reformatted so that no
+    # additional pass over the data is required.
+    periods = None
+    ot_columns = computed_columns(args, it_table, it_columns)
+    if PERIOD_COLUMN in ot_columns:
+        periods = read_meal_periods(args, cur)
+
+    it_expressions = select_expressions(args, cur, it_table, it_columns)
+    if getattr(args, "pipeline", False):
+        # Rows are read by one thread, using a connection of its own, and reformatted
+        # by another so that reading, reformatting and writing overlap.
+        it_batches = pipelined(
+            read_own_batches(args, it_table, it_expressions, where, parameters)
+        )
+        batches = pipelined(
+            format_batches(args, it_table, it_columns, periods, it_batches)
+        )
+    else:
+        it_batches = read_batches(
+            args, cur, it_table, it_expressions, where, parameters
         )
+        batches = format_batches(args, it_table, it_columns, periods, it_batches)
+    yield from batches
+
+
+@entry_exit
+def read_batches(
+    args: Namespace,
+    cur: Cursor,
+    it_table: str,
+    it_expressions: List[str],
+    where: str,
+    parameters: tuple,
+):
+    """Generate batches of rows selected from a table."""
+    try:
+        with args.stats.stage(it_table, STAGE_QUERY):
+            it_rows = cur.execute(  # nosec
+                "SELECT %s FROM %s%s"
+                % (
+                    ",".join(it_expressions),
+                    it_table,
+                    " WHERE " + where if where else "",
+                ),
+                parameters,
+            )
     except sqlite3.OperationalError as ee:
         if ERR_NO_SUCH_COLUMN in str(ee):
             log.error("One or more columns are not recognised.")
@@ -552,68 +1718,1521 @@ def export_data(args: Namespace, cur: Cursor, it_table: str, it_columns: List[st
             # Some other exception; just raise it.
             raise (ee)
 
-    rows = []
-    for it_row in it_rows:
-        it_row = format_data(args, it_table, it_columns, it_row)
-        rows.append(maybe_translate_data(args, it_table, it_columns, it_row))
-
-    return rows
+    # Each stage works on a whole batch of rows at a time so that we can time the
+    # stages without the cost of timing every row.
+    while True:
+        with args.stats.stage(it_table, STAGE_QUERY):
+            it_batch = it_rows.fetchmany(BATCH_SIZE)
+        if not it_batch:
+            break
+        args.stats.count(it_table, ROWS_READ, len(it_batch))
+        yield it_batch
 
 
 @entry_exit
-def do_export_table(args: Namespace, cur: Cursor):
-    """Write a CSV file that contains the columns from a specific table."""
-    assert "table" in args, "Table should have been defined"
-    assert "format" in args, "Output file formation should have been defined"
+def read_own_batches(
+    args: Namespace,
+    it_table: str,
+    it_expressions: List[str],
+    where: str,
+    parameters: tuple,
+):
+    """Generate batches of rows selected from a table using a connection of our own."""
+    # SQLite connections cannot be shared between threads.
+    with closing(sqlite3.connect(args.database)) as con:
+        yield from read_batches(
+            args, con.cursor(), it_table, it_expressions, where, parameters
+        )
 
-    export_file = (
-        CsvExport(args.output) if args.format == CSV else ExcelExport(args.output)
-    )
 
-    it_table = maybe_translate_table_from(args, args.table)
+@entry_exit
+def format_batches(
+    args: Namespace,
+    it_table: str,
+    it_columns: List[str],
+    periods: MealPeriods,
+    it_batches,
+):
+    """Generate batches of reformatted rows, keyed by the Excel flag."""
+    if periods:
+        period_index = it_columns.index(PERIOD_TIME)
+
+    for it_batch in it_batches:
+        # Rows are reformatted once for each kind of output, Excel or not.
+        with args.stats.stage(it_table, STAGE_FORMAT):
+            batches = {
+                excel: [
+                    format_data(excel, it_table, it_columns, it_row)
+                    for it_row in it_batch
+                ]
+                for excel in args.excel_flags
+            }
+            if periods:
+                it_periods = [(periods.period(row[period_index]),) for row in it_batch]
+                batches = {
+                    excel: [row + period for row, period in zip(batch, it_periods)]
+                    for excel, batch in batches.items()
+                }
+
+        yield batches
+
+
+def pipelined(batches):
+    """Generate the batches of a generator which is run by a thread of its own.
+
+    The thread runs at most PIPELINE_DEPTH batches ahead, handing them over through
+    a bounded queue, and stops if the batches are no longer wanted.
+    """
+    import queue
+
+    handoff = queue.Queue(maxsize=PIPELINE_DEPTH)
+    stopped = threading.Event()
+
+    def put(item) -> None:
+        while not stopped.is_set():
+            try:
+                handoff.put(item, timeout=PIPELINE_POLL)
+                return
+            except queue.Full:
+                continue
 
-    # If no columns were specified then we dump all columns, which requires
-    # listing them first.
-    if not args.columns:
-        it_columns = list_columns(args, cur, it_table)
-        columns = maybe_translate_columns(args, it_columns)
-    else:
-        columns = args.columns
-        it_columns = maybe_translate_columns_from(args, columns)
+    def produce() -> None:
+        try:
+            for batch in batches:
+                put((None, batch))
+                if stopped.is_set():
+                    break
+        except BaseException as ee:
+            # Errors, including a sys.exit(), are raised again by the consumer.
+            put((ee, None))
+        finally:
+            # The generator must be closed by the thread which ran it.
+            batches.close()
+            put(None)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = handoff.get()
+            if item is None:
+                break
+            error, batch = item
+            if error is not None:
+                raise error
+            yield batch
+    finally:
+        stopped.set()
+        thread.join()
 
-    worksheet = export_file.worksheet(args.table)
-    export_file.columns(worksheet, columns)
-    rows = export_data(args, cur, it_table, it_columns)
-    for row in rows:
-        export_file.data(worksheet, row)
 
-    export_file.format_worksheet(worksheet, it_table, it_columns)
-    export_file.close()
+@entry_exit
+def open_exports(args: Namespace) -> List[ExportSink]:
+    """Open an export file for each language and format being exported."""
+    return [
+        ExportSink(
+            translator,
+            export_class(args, output_format)(output),
+            output_format == EXCEL,
+        )
+        for translator, output_format, output in args.exports
+    ]
+
+
+@entry_exit
+def write_batches(
+    args: Namespace,
+    sinks: List[ExportSink],
+    it_table: str,
+    ot_columns: List[str],
+    batches,
+) -> int:
+    """Translate and write batches of rows to each sink and then format them."""
+    # Rows are only read and reformatted once, however many languages and formats
+    # they are written in.
+    rows = 0
+    starts = [sink.export_file.tell() for sink in sinks]
+    for batch in batches:
+        for sink in sinks:
+            with args.stats.stage(it_table, STAGE_TRANSLATE):
+                xlat_batch = sink.translator.rows(
+                    it_table, sink.plan, batch[sink.excel]
+                )
+            with args.stats.stage(it_table, STAGE_WRITE):
+                for row in xlat_batch:
+                    sink.export_file.data(sink.worksheet, row)
+        rows += len(batch[sinks[0].excel])
+
+    # Each row is counted once, however many sinks it was written to.
+    args.stats.count(it_table, ROWS_WRITTEN, rows)
+    for sink, start in zip(sinks, starts):
+        with args.stats.stage(it_table, STAGE_WRITE):
+            sink.export_file.format_worksheet(sink.worksheet, it_table, ot_columns)
+        if start is not None:
+            args.stats.count(it_table, BYTES_WRITTEN, sink.export_file.tell() - start)
+
+    log.debug("rows: %d", rows)
+    return rows
+
+
+@entry_exit
+def close_export(args: Namespace, export_file) -> None:
+    """Close an export file, which for a spreadsheet is when it is written."""
+    with args.stats.stage(ALL_TABLES, STAGE_CLOSE):
+        export_file.close()
+
+
+@entry_exit
+def close_exports(args: Namespace, sinks: List[ExportSink]) -> None:
+    """Close the export file of each sink."""
+    for sink in sinks:
+        close_export(args, sink.export_file)
+
+
+@entry_exit
+def row_partitions(
+    cur: Cursor, it_table: str, jobs: int, size: int = None
+) -> List[tuple]:
+    """Split a table into contiguous ranges of rowids, one for each job.
+
+    If a size is given then the table is split into more ranges if needed so that
+    none holds more than that many rowids.
+    """
+    try:
+        low, high = cur.execute(  # nosec
+            "SELECT MIN({column}), MAX({column}) FROM {table}".format(
+                column=PARTITION_COLUMN, table=it_table
+            )
+        ).fetchone()
+    except sqlite3.OperationalError as ee:
+        log.warning("Unable to partition '%s': %s", it_table, ee)
+        return []
+    if low is None:
+        return []
+
+    if size:
+        jobs = max(jobs, -(-(high + 1 - low) // size))
+    bounds = [low + (high + 1 - low) * part // jobs for part in range(jobs + 1)]
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if start < end]
+
+
+def export_partition(partition: dict) -> dict:
+    """Export a range of rowids from a table to a chunk file for each export.
+
+    This runs in a worker process, so it opens its own connection to the database
+    and returns the times and counts that it recorded along with the offset at which
+    the rows of each chunk start, after its title and column names.
+    """
+    args = Namespace(
+        database=partition["database"],
+        periods=partition["periods"],
+        units=partition["units"],
+        excel_flags=[False],
+        stats=ExportStats(),
+    )
+    it_table, it_columns = partition["table"], partition["columns"]
+    sinks = [
+        ExportSink(Translator(language), EXPORTERS[output_format](chunk), False)
+        for language, output_format, chunk in partition["chunks"]
+    ]
+    ot_columns = computed_columns(args, it_table, it_columns)
+    for sink in sinks:
+        sink.start_table(it_table, ot_columns)
+    starts = [sink.export_file.tell() for sink in sinks]
+
+    with closing(sqlite3.connect(args.database)) as con:
+        batches = export_batches(
+            args,
+            con.cursor(),
+            it_table,
+            it_columns,
+            "{column} >= ? AND {column} < ?".format(column=PARTITION_COLUMN),
+            partition["range"],
+        )
+        write_batches(args, sinks, it_table, ot_columns, batches)
+    for sink in sinks:
+        sink.export_file.close()
+
+    return {"times": args.stats.times, "counts": args.stats.counts, "starts": starts}
+
+
+@entry_exit
+def export_partitions(
+    args: Namespace,
+    sinks: List[ExportSink],
+    it_table: str,
+    it_columns: List[str],
+    partitions: List[tuple],
+) -> None:
+    """Export ranges of a table in worker processes, appending their rows in order."""
+    import shutil
+    import tempfile
+    from concurrent.futures import ProcessPoolExecutor
+
+    directory = os.path.dirname(os.path.abspath(args.output))
+    with tempfile.TemporaryDirectory(dir=directory) as chunk_directory:
+        work = [
+            {
+                "database": args.database,
+                "periods": args.periods,
+                "units": args.units,
+                "table": it_table,
+                "columns": it_columns,
+                "range": partition,
+                "chunks": [
+                    (
+                        translator.language,
+                        output_format,
+                        os.path.join(chunk_directory, "%d.%d" % (part, iexport)),
+                    )
+                    for iexport, (translator, output_format, _) in enumerate(
+                        args.exports
+                    )
+                ],
+            }
+            for part, partition in enumerate(partitions)
+        ]
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            # Results arrive in order, so each chunk is appended as soon as it and
+            # all of the chunks before it are written.
+            for partition, result in zip(work, executor.map(export_partition, work)):
+                args.stats.merge(result["times"], result["counts"])
+                with args.stats.stage(it_table, STAGE_WRITE):
+                    for sink, (_, _, chunk), start in zip(
+                        sinks, partition["chunks"], result["starts"]
+                    ):
+                        with open(chunk, "r", newline="") as chunk_file:
+                            chunk_file.seek(start)
+                            shutil.copyfileobj(chunk_file, sink.export_file.file)
+
+
+def format_partition(partition: dict) -> dict:
+    """Read and reformat a range of rowids from a table.
+
+    This runs in a worker process, so it opens its own connection to the database
+    and returns the times and counts that it recorded along with the batches of
+    rows for each kind of output.
+    """
+    args = Namespace(
+        database=partition["database"],
+        periods=partition["periods"],
+        units=partition["units"],
+        excel_flags=partition["excel_flags"],
+        stats=ExportStats(),
+    )
+    with closing(sqlite3.connect(args.database)) as con:
+        batches = list(
+            export_batches(
+                args,
+                con.cursor(),
+                partition["table"],
+                partition["columns"],
+                "{column} >= ? AND {column} < ?".format(column=PARTITION_COLUMN),
+                partition["range"],
+            )
+        )
+    return {"times": args.stats.times, "counts": args.stats.counts, "batches": batches}
+
+
+def ordered_results(executor, func, work: list, ahead: int):
+    """Generate the result of a function for each piece of work, in order.
+
+    At most 'ahead' pieces of work are running, or waiting to be collected, at once.
+    """
+    from collections import deque
+
+    futures = deque()
+    for piece in work:
+        if len(futures) >= ahead:
+            yield futures.popleft().result()
+        futures.append(executor.submit(func, piece))
+    while futures:
+        yield futures.popleft().result()
+
+
+@entry_exit
+def format_partitions(
+    args: Namespace, it_table: str, it_columns: List[str], partitions: List[tuple]
+):
+    """Generate batches of rows read and reformatted by worker processes, in order."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    work = [
+        {
+            "database": args.database,
+            "periods": args.periods,
+            "units": args.units,
+            "excel_flags": args.excel_flags,
+            "table": it_table,
+            "columns": it_columns,
+            "range": partition,
+        }
+        for partition in partitions
+    ]
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for result in ordered_results(executor, format_partition, work, args.jobs * 2):
+            args.stats.merge(result["times"], result["counts"])
+            yield from result["batches"]
+
+
+@entry_exit
+def do_export_table(args: Namespace, cur: Cursor):
+    """Write a CSV file that contains the columns from a specific table."""
+    assert "table" in args, "Table should have been defined"
+    assert "format" in args, "Output file formation should have been defined"
+
+    sinks = open_exports(args)
+
+    it_table = args.translator.table_from(args.table)
+
+    # If no columns were specified then we dump all columns, which requires
+    # listing them first.
+    if not args.columns:
+        it_columns = list_columns(args, cur, it_table)
+    else:
+        it_columns = args.translator.columns_from(args.columns)
+    ot_columns = computed_columns(args, it_table, it_columns)
+    if args.periods and it_table == PERIOD_TABLE and PERIOD_COLUMN not in ot_columns:
+        log.warning(
+            "Column '%s' is required to compute '%s'.", PERIOD_TIME, PERIOD_COLUMN
+        )
+
+    for sink in sinks:
+        sink.start_table(it_table, ot_columns)
+
+    # A large table can be split into ranges which are exported in parallel.
+    partitions = []
+    if args.jobs and args.jobs > 1:
+        size = PARTITION_BATCHES * BATCH_SIZE if True in args.excel_flags else None
+        partitions = row_partitions(cur, it_table, args.jobs * PARTITIONS_PER_JOB, size)
+    if len(partitions) > 1 and True in args.excel_flags:
+        # Worksheets cannot be joined together, so the workers only read and
+        # reformat the rows, which are all written here.
+        batches = format_partitions(args, it_table, it_columns, partitions)
+        write_batches(args, sinks, it_table, ot_columns, batches)
+    elif len(partitions) > 1:
+        export_partitions(args, sinks, it_table, it_columns, partitions)
+    else:
+        batches = export_batches(args, cur, it_table, it_columns)
+        write_batches(args, sinks, it_table, ot_columns, batches)
+    close_exports(args, sinks)
+
+
+@entry_exit
+def open_table_exports(args: Namespace, table: str, archives: list):
+    """Open a CSV file for a table in the directory or zip archive of each export."""
+    sinks = []
+    for (translator, _, output), archive in zip(args.exports, archives):
+        filename = translator.table(table) + FORMAT_SUFFIXES[CSV]
+        if archive is None:
+            file = open(os.path.join(output, filename), "w", newline="")
+        else:
+            file = io.TextIOWrapper(
+                archive.open(filename, "w", force_zip64=True), newline=""
+            )
+        sinks.append(ExportSink(translator, TableCsvExport(file), False))
+    return sinks
+
+
+@entry_exit
+def dump_table(args: Namespace, cur: Cursor, table: str, archives: list) -> None:
+    """Write a table to a CSV file of its own in each export."""
+    sinks = open_table_exports(args, table, archives)
+    columns = list_columns(args, cur, table)
+    ot_columns = computed_columns(args, table, columns)
+    for sink in sinks:
+        sink.start_table(table, ot_columns)
+    batches = export_batches(args, cur, table, columns)
+    write_batches(args, sinks, table, ot_columns, batches)
+    close_exports(args, sinks)
+
+
+@entry_exit
+def dump_table_file(args: Namespace, table: str) -> None:
+    """Write a table to a file in each directory, using a connection of its own."""
+    # SQLite connections cannot be shared between threads.
+    with closing(sqlite3.connect(args.database)) as con:
+        dump_table(args, con.cursor(), table, [None] * len(args.exports))
+
+
+@entry_exit
+def dump_db_split(args: Namespace, cur: Cursor) -> None:
+    """Write each table to its own CSV file in a directory or zip archive."""
+    tables = list_tables(args, cur)
+    if args.output.endswith(ZIP_SUFFIX):
+        import zipfile
+
+        # A zip archive is written as a stream so its tables are written in turn.
+        archives = [
+            zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED)
+            for output in args.outputs
+        ]
+        try:
+            for table in tables:
+                dump_table(args, cur, table, archives)
+        finally:
+            with args.stats.stage(ALL_TABLES, STAGE_CLOSE):
+                for archive in archives:
+                    archive.close()
+        return
+
+    # Files in a directory are independent so tables are written in parallel.
+    from concurrent.futures import ThreadPoolExecutor
+
+    for output in args.outputs:
+        os.makedirs(output, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(dump_table_file, args, table) for table in tables]
+        for future in futures:
+            future.result()
 
 
 @entry_exit
 def do_dump_db(args: Namespace, cur: Cursor):
     """Write a CSV file that contains the columns from a specific table."""
     assert "format" in args, "Output file format should have been defined."
-    export_file = (
-        CsvExport(args.output) if args.format == CSV else ExcelExport(args.output)
-    )
+    if args.split:
+        dump_db_split(args, cur)
+        return
+
+    sinks = open_exports(args)
     # First get the tables...
     tables = list_tables(args, cur)
 
     for table in tables:
-        xlat_table = maybe_translate_table(args, table)
-        worksheet = export_file.worksheet(xlat_table)
-
         columns = list_columns(args, cur, table)
-        xlat_columns = maybe_translate_columns(args, columns)
-        export_file.columns(worksheet, xlat_columns)
-        rows = export_data(args, cur, table, columns)
-        for row in rows:
-            export_file.data(worksheet, row)
-        export_file.format_worksheet(worksheet, table, columns)
+        ot_columns = computed_columns(args, table, columns)
+        for sink in sinks:
+            sink.start_table(table, ot_columns)
+        batches = export_batches(args, cur, table, columns)
+        write_batches(args, sinks, table, ot_columns, batches)
+
+    close_exports(args, sinks)
+
+
+def merge_asof(left, right, key, tolerance):
+    """Pair each left row with the nearest preceding right row within tolerance.
 
-    export_file.close()
+    Both sets of rows must already be sorted on the key so that this is a single
+    merge pass over each.
+    """
+    right = iter(right)
+    pending = next(right, None)
+    nearest = None
+    for row in left:
+        row_key = key(row)
+        while pending is not None and key(pending) <= row_key:
+            nearest = pending
+            pending = next(right, None)
+
+        if nearest is not None and row_key - key(nearest) <= tolerance:
+            yield row, nearest
+        else:
+            yield row, None
+
+
+def reading_time(row: tuple) -> int:
+    """Return the time in seconds of a (data, ora, ...) row."""
+    return row[0] // DAY_IN_MSECS * DAY_IN_SECS + row[1] // 1000
+
+
+@entry_exit
+def do_join_insulin(args: Namespace, cur: Cursor):
+    """Write a file pairing each reading with the preceding insulin dose."""
+    assert "format" in args, "Output file format should have been defined."
+    (sink,) = open_exports(args)
+
+    try:
+        insulins = dict(cur.execute("SELECT _id, desc_insulina FROM t_insulina"))
+    except sqlite3.OperationalError as ee:
+        log.warning("Unable to read insulin descriptions: %s", ee)
+        insulins = {}
+
+    # Both readings and doses are recorded in the results table; sort both on the
+    # time of day within the day so that they can be merged in a single pass.
+    order = (
+        "typeof(data) = 'integer' AND typeof(ora) = 'integer' "
+        "ORDER BY data / %d, ora" % DAY_IN_MSECS
+    )
+    readings = cur.execute(  # nosec
+        "SELECT data, ora, periodo, risultato FROM t_risultati "
+        "WHERE typeof(risultato) IN ('integer', 'real') AND " + order
+    )
+    doses = cur.connection.cursor()
+    doses.execute(  # nosec
+        "SELECT data, ora, insulina, dose FROM t_risultati "
+        "WHERE typeof(dose) IN ('integer', 'real') AND " + order
+    )
+
+    sink.start_table(JOIN_TABLE, JOIN_COLUMNS)
+    for reading, dose in merge_asof(readings, doses, reading_time, args.window * 60):
+        row = reading
+        if dose is not None:
+            row = row + (dose[0], dose[1], insulins.get(dose[2], dose[2]), dose[3])
+        row = format_data(sink.excel, JOIN_TABLE, JOIN_COLUMNS[: len(row)], row)
+        # Readings without a preceding dose are padded with empty dose fields.
+        row = row + ("",) * (len(JOIN_COLUMNS) - len(row))
+        sink.export_file.data(
+            sink.worksheet, sink.translator.row(JOIN_TABLE, sink.plan, row)
+        )
+
+    sink.export_file.format_worksheet(sink.worksheet, JOIN_TABLE, JOIN_COLUMNS)
+    close_exports(args, [sink])
+
+
+@entry_exit
+def cache_directory():
+    """Return the directory in which cached files are kept, creating it if needed."""
+    dirname = os.environ.get(CACHE_ENV) or os.path.join(
+        os.path.expanduser("~"), ".cache", PROC_NAME
+    )
+    os.makedirs(dirname, exist_ok=True)
+    log.debug("cache directory: %s", dirname)
+    return dirname
+
+
+@entry_exit
+def file_digest(filename: str) -> str:
+    """Return the SHA-256 hash of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(filename, "rb") as source:
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+@entry_exit
+def search_index(args: Namespace, cur: Cursor, database: str, digest: str = None):
+    """Return the search index for a database, building it if necessary."""
+    index_file = os.path.join(
+        cache_directory(),
+        FMT_SEARCH_INDEX.format(
+            digest=digest or file_digest(database), version=SEARCH_INDEX_VERSION
+        ),
+    )
+    if os.path.exists(index_file):
+        log.info("Using search index '%s'.", index_file)
+        return index_file
+
+    # Build the index under a temporary name so that an interrupted build is never
+    # mistaken for a complete index.
+    log.info("Building search index '%s'...", index_file)
+    build_file = "%s.%d.tmp" % (index_file, os.getpid())
+    cur.execute("ATTACH DATABASE ? AS build", (build_file,))
+    try:
+        # The index is "contentless"; matches are looked up in the backup by rowid.
+        cur.execute(
+            "CREATE VIRTUAL TABLE build.search USING fts5(%s, content='')"
+            % ",".join(SEARCH_COLUMNS)
+        )
+        cur.execute(  # nosec
+            "INSERT INTO build.search (rowid, %s) SELECT rowid, %s FROM %s"
+            % (",".join(SEARCH_COLUMNS), ",".join(SEARCH_COLUMNS), SEARCH_TABLE)
+        )
+        cur.connection.commit()
+    except sqlite3.OperationalError:
+        cur.execute("DETACH DATABASE build")
+        os.remove(build_file)
+        raise
+
+    cur.execute("DETACH DATABASE build")
+    os.replace(build_file, index_file)
+    return index_file
+
+
+@entry_exit
+def search_backup(
+    args: Namespace,
+    cur: Cursor,
+    sinks: List[ExportSink],
+    title: str,
+    database: str,
+    digest: str = None,
+    skip_empty: bool = False,
+):
+    """Write the readings from one database whose free text matches a query."""
+    try:
+        index_file = search_index(args, cur, database, digest)
+    except sqlite3.OperationalError as ee:
+        log.error("Unable to build search index for '%s': %s", database, ee)
+        sys.exit(2)
+
+    cur.execute("ATTACH DATABASE ? AS fts", (index_file,))
+
+    where = "rowid IN (SELECT rowid FROM fts.search WHERE search MATCH ?)"
+    parameters = (args.query,)
+    since, until = getattr(args, "since", None), getattr(args, "until", None)
+    if since is not None:
+        where += " AND data >= ?"
+        parameters += (since,)
+    if until is not None:
+        where += " AND data < ?"
+        parameters += (until,)
+
+    it_columns = list_columns(args, cur, SEARCH_TABLE)
+    ot_columns = computed_columns(args, SEARCH_TABLE, it_columns)
+    batches = export_batches(args, cur, SEARCH_TABLE, it_columns, where, parameters)
+    # Fetch the first batch to find out whether there are any matches at all.
+    first = next(batches, [])
+
+    if first or not skip_empty:
+        for sink in sinks:
+            sink.start_table(SEARCH_TABLE, ot_columns, title)
+        batches = itertools.chain([first], batches)
+        rows = write_batches(args, sinks, SEARCH_TABLE, ot_columns, batches)
+        log.info("%d readings in '%s' match '%s'.", rows, database, args.query)
+    cur.execute("DETACH DATABASE fts")
+
+
+@entry_exit
+def check_query(query: str) -> None:
+    """Check that a full-text query is valid, before any output is written."""
+    # The query is compiled against an empty index with the same columns, so that
+    # column filters are checked too.
+    with closing(sqlite3.connect(":memory:")) as con:
+        try:
+            con.execute(
+                "CREATE VIRTUAL TABLE search USING fts5(%s, content='')"
+                % ",".join(SEARCH_COLUMNS)
+            )
+            con.execute("SELECT rowid FROM search WHERE search MATCH ?", (query,))
+        except sqlite3.OperationalError as ee:
+            log.error("Search '%s' is not valid: %s", query, ee)
+            sys.exit(2)
+
+
+@entry_exit
+def do_search(args: Namespace, cur: Cursor):
+    """Write a file containing the readings whose free text matches a query."""
+    assert "format" in args, "Output file format should have been defined."
+    check_query(args.query)
+    backups = None
+    if cur is None:
+        # Searching a directory of backups so use the catalog to pick only those
+        # backups which might contain matching readings.
+        backups = select_backups(args, update_catalog(args))
+
+    sinks = open_exports(args)
+    if backups is None:
+        search_backup(args, cur, sinks, None, args.database)
+    else:
+        for backup, entry in backups:
+            title = sheet_title(os.path.splitext(backup)[0])
+            database = os.path.join(args.database, backup)
+            with sqlite3.connect(database) as con:
+                search_backup(
+                    args,
+                    con.cursor(),
+                    sinks,
+                    title,
+                    database,
+                    entry[DIGEST],
+                    skip_empty=True,
+                )
+            con.close()
+
+    close_exports(args, sinks)
+
+
+def sheet_title(title: str) -> str:
+    """Make a title usable as the title of a worksheet."""
+    return RGX_BAD_SHEET_TITLE.sub("_", title)[-MAX_SHEET_TITLE:]
+
+
+@entry_exit
+def scan_backup(dirname: str, backup: str) -> dict:
+    """Record the metadata describing a backup database."""
+    filename = os.path.join(dirname, backup)
+    stat = os.stat(filename)
+    entry = {
+        SIZE: stat.st_size,
+        MTIME: stat.st_mtime_ns,
+        DIGEST: file_digest(filename),
+        ROWS: {},
+        FIRST: None,
+        LAST: None,
+        PATIENT: None,
+        PID: None,
+    }
+
+    # Open the backup read-only; we must never modify the backups.
+    uri = pathlib.Path(filename).absolute().as_uri() + "?mode=ro"
+    con = sqlite3.connect(uri, uri=True)
+    try:
+        cur = con.cursor()
+        for (table,) in cur.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'"
+        ).fetchall():
+            if RGX_SAFE_SQL_NAME.match(table):
+                entry[ROWS][table] = cur.execute(  # nosec
+                    "SELECT COUNT(*) FROM %s" % table
+                ).fetchone()[0]
+
+        if "t_risultati" in entry[ROWS]:
+            entry[FIRST], entry[LAST] = cur.execute(
+                "SELECT MIN(data), MAX(data) FROM t_risultati "
+                "WHERE typeof(data) = 'integer'"
+            ).fetchone()
+
+        if "t_parametri" in entry[ROWS]:
+            row = cur.execute(
+                "SELECT nome, cognome, PID FROM t_parametri LIMIT 1"
+            ).fetchone()
+            if row:
+                entry[PATIENT] = " ".join(str(name) for name in row[:2] if name)
+                entry[PID] = row[2]
+    finally:
+        con.close()
+
+    return entry
+
+
+@entry_exit
+def update_catalog(args: Namespace) -> dict:
+    """Bring the catalog of a directory of backups up to date."""
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    catalog_file = getattr(args, "catalog", None) or os.path.join(
+        args.database, CATALOG_FILE
+    )
+    try:
+        with open(catalog_file, "r") as source:
+            catalog = json.load(source)
+        if catalog.get(VERSION) != CATALOG_VERSION:
+            log.info("Ignoring catalog '%s' from another version.", catalog_file)
+            catalog = {}
+    except FileNotFoundError:
+        catalog = {}
+    old_backups = catalog.get(BACKUPS, {})
+
+    # Find all of the backups, identified by their path relative to the directory,
+    # and rescan those which are new or have changed since the catalog was written.
+    backups = {}
+    changed = []
+    for dirpath, _dirnames, filenames in os.walk(args.database):
+        for filename in fnmatch.filter(filenames, args.pattern):
+            backup = os.path.relpath(os.path.join(dirpath, filename), args.database)
+            entry = old_backups.get(backup)
+            stat = os.stat(os.path.join(args.database, backup))
+            if (
+                entry
+                and entry[SIZE] == stat.st_size
+                and entry[MTIME] == stat.st_mtime_ns
+            ):
+                backups[backup] = entry
+            else:
+                changed.append(backup)
+
+    log.info("Scanning %d new or changed backups...", len(changed))
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(scan_backup, args.database, backup): backup
+            for backup in changed
+        }
+        for future in as_completed(futures):
+            try:
+                backups[futures[future]] = future.result()
+            except sqlite3.DatabaseError as ee:
+                log.warning("Ignoring '%s': %s", futures[future], ee)
+
+    catalog = {VERSION: CATALOG_VERSION, BACKUPS: dict(sorted(backups.items()))}
+    if backups != old_backups:
+        log.info("Writing catalog '%s'.", catalog_file)
+        replace_json(catalog_file, catalog)
+
+    return catalog
+
+
+def replace_json(filename: str, value) -> None:
+    """Write a JSON file, replacing any existing file in one step."""
+    # Write a new file and then swap it in, so that readers never see a partially
+    # written file.
+    build_file = "%s.%d.tmp" % (filename, os.getpid())
+    with open(build_file, "w") as target:
+        json.dump(value, target, separators=(",", ":"))
+    os.replace(build_file, filename)
+
+
+@entry_exit
+def select_backups(args: Namespace, catalog: dict) -> List[tuple]:
+    """Return the (backup, entry) pairs for the backups that might match a query."""
+    patient = getattr(args, "patient", None)
+    since, until = getattr(args, "since", None), getattr(args, "until", None)
+    selected = []
+    for backup, entry in catalog[BACKUPS].items():
+        if patient is not None and not any(
+            patient.lower() in str(field).lower()
+            for field in (entry[PATIENT], entry[PID])
+            if field
+        ):
+            log.debug("'%s' skipped: patient", backup)
+        elif since is not None and (entry[LAST] is None or entry[LAST] < since):
+            log.debug("'%s' skipped: before %d", backup, since)
+        elif until is not None and (entry[FIRST] is None or entry[FIRST] >= until):
+            log.debug("'%s' skipped: after %d", backup, until)
+        else:
+            selected.append((backup, entry))
+
+    log.info("%d of %d backups selected.", len(selected), len(catalog[BACKUPS]))
+    return selected
+
+
+@entry_exit
+def do_catalog(args: Namespace, cur: Cursor):
+    """Update the catalog of a directory of backups and list those matching."""
+    if cur is not None:
+        log.error("'%s' is not a directory of backups.", args.database)
+        sys.exit(2)
+
+    print("Backups found")
+    print("=============")
+    for backup, entry in select_backups(args, update_catalog(args)):
+        dates = [
+            unix_date_microseconds(False, entry[field]) if entry[field] else ""
+            for field in (FIRST, LAST)
+        ]
+        print(
+            "%s,%s,%s,%s,%s"
+            % (backup, entry[PATIENT] or "", entry[PID] or "", dates[0], dates[1])
+        )
+
+
+@entry_exit
+def read_watch_state(state_file: str) -> dict:
+    """Return what was last exported from each backup in a watched directory."""
+    try:
+        with open(state_file, "r") as source:
+            state = json.load(source)
+    except FileNotFoundError:
+        return {}
+
+    if state.get(VERSION) != WATCH_STATE_VERSION:
+        log.info("Ignoring watch state '%s' from another version.", state_file)
+        return {}
+    return state[BACKUPS]
+
+
+def watch_options(args: Namespace) -> dict:
+    """Return the options that change what is written for each reading."""
+    return {
+        "format": args.format,
+        "columns": args.columns,
+        "periods": args.periods,
+        "units": args.units,
+        "language": args.translator.language,
+    }
+
+
+@entry_exit
+def export_new_readings(args: Namespace, backup: str, entry: dict) -> int:
+    """Append the readings added to a backup since it was last exported."""
+    filename = os.path.join(args.database, backup)
+    output = os.path.join(
+        args.output, os.path.splitext(backup)[0] + FORMAT_SUFFIXES[args.format]
+    )
+
+    # Open the backup read-only; we must never modify the backups.
+    uri = pathlib.Path(filename).absolute().as_uri() + "?mode=ro"
+    with closing(sqlite3.connect(uri, uri=True)) as con:
+        cur = con.cursor()
+        high_water = entry.get(HIGH_WATER, 0)
+        (last,) = cur.execute(  # nosec
+            "SELECT IFNULL(MAX(rowid), 0) FROM %s" % WATCH_TABLE
+        ).fetchone()
+        if last < high_water:
+            log.warning("'%s' has lost readings, so is exported again.", backup)
+            high_water = 0
+        if not os.path.exists(output):
+            high_water = 0
+        # Rows exported with other options would not match those already written.
+        if entry.get(OPTIONS) != watch_options(args):
+            high_water = 0
+
+        if args.columns:
+            it_columns = args.translator.columns_from(args.columns)
+        else:
+            it_columns = list_columns(args, cur, WATCH_TABLE)
+        ot_columns = computed_columns(args, WATCH_TABLE, it_columns)
+
+        # Only readings up to the last one found are exported, so that the high
+        # water mark is right even if the backup is being written.
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        file = open(output, "a" if high_water else "w", newline="")
+        if args.format == CSV:
+            export_file = TableCsvExport(file, header=not high_water)
+        else:
+            export_file = TableNdjsonExport(file)
+        sinks = [ExportSink(args.translator, export_file, False)]
+        try:
+            sinks[0].start_table(WATCH_TABLE, ot_columns)
+            batches = export_batches(
+                args,
+                cur,
+                WATCH_TABLE,
+                it_columns,
+                "rowid > ? AND rowid <= ?",
+                (high_water, last),
+            )
+            rows = write_batches(args, sinks, WATCH_TABLE, ot_columns, batches)
+        finally:
+            close_exports(args, sinks)
+
+    entry[HIGH_WATER] = last
+    entry[OPTIONS] = watch_options(args)
+    log.info("%d new readings from '%s' written to '%s'.", rows, backup, output)
+    return rows
+
+
+@entry_exit
+def watch_backups(args: Namespace, state: dict, state_file: str) -> int:
+    """Export the new readings of each new or changed backup in a directory."""
+    changed = 0
+    backups = {}
+    for dirpath, _dirnames, filenames in os.walk(args.database):
+        for filename in sorted(fnmatch.filter(filenames, args.pattern)):
+            backup = os.path.relpath(os.path.join(dirpath, filename), args.database)
+            stat = os.stat(os.path.join(args.database, backup))
+            entry = dict(state.get(backup, {}))
+            backups[backup] = entry
+            same_options = entry.get(OPTIONS) == watch_options(args)
+            if (
+                same_options
+                and entry.get(SIZE) == stat.st_size
+                and entry.get(MTIME) == stat.st_mtime_ns
+            ):
+                continue
+
+            # A backup which has only been touched is not exported again.
+            digest = file_digest(os.path.join(args.database, backup))
+            if not same_options or entry.get(DIGEST) != digest:
+                try:
+                    export_new_readings(args, backup, entry)
+                except sqlite3.DatabaseError as ee:
+                    # The backup may still be being copied, so try again later.
+                    log.warning("Ignoring '%s' for now: %s", backup, ee)
+                    backups[backup] = state.get(backup, {})
+                    continue
+                changed += 1
+            entry.update({SIZE: stat.st_size, MTIME: stat.st_mtime_ns, DIGEST: digest})
+
+            # The state is saved after each backup so that no readings are written
+            # twice if watching stops.
+            state[backup] = entry
+            replace_json(state_file, {VERSION: WATCH_STATE_VERSION, BACKUPS: state})
+
+    # Backups which have gone are forgotten.
+    if backups.keys() != state.keys():
+        state.clear()
+        state.update(backups)
+        replace_json(state_file, {VERSION: WATCH_STATE_VERSION, BACKUPS: state})
+
+    log.info("%d of %d backups changed.", changed, len(backups))
+    return changed
+
+
+@entry_exit
+def do_watch(args: Namespace, cur: Cursor):
+    """Poll a directory of backups, exporting new readings as they are added."""
+    if cur is not None:
+        log.error("'%s' is not a directory of backups.", args.database)
+        sys.exit(2)
+
+    os.makedirs(args.output, exist_ok=True)
+    state_file = os.path.join(args.output, WATCH_STATE_FILE)
+    state = read_watch_state(state_file)
+    if not args.once:
+        log.warning("Watching '%s' every %d seconds...", args.database, args.interval)
+    try:
+        while True:
+            watch_backups(args, state, state_file)
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        log.warning("Stopped watching '%s'.", args.database)
+
+
+class GlucoLogDatabase:
+    """Class giving access to a GlucoLog backup database from Python.
+
+    The database is kept open, and its tables and columns are only listed once, so
+    that many calls can be made cheaply. Logging is not set up, so messages go
+    wherever the caller's logging sends them, and errors raise GlucoLogError rather
+    than exiting. An instance should only be used by one thread at a time.
+    """
+
+    def __init__(self, database: str, language: str = None, read_only: bool = False):
+        """Open a database, naming tables and columns in a language if given."""
+        if not os.path.isfile(database):
+            raise GlucoLogError("Database '%s' does not exist." % database)
+        if language is not None and not is_language(language):
+            raise GlucoLogError("Language '%s' is not recognised." % language)
+
+        self.database = database
+        self.translator = cached_translator(language)
+        # Rows may be read by whichever thread of an executor is free.
+        if read_only:
+            self.connection = sqlite3.connect(
+                pathlib.Path(database).resolve().as_uri() + "?mode=ro",
+                uri=True,
+                check_same_thread=False,
+            )
+        else:
+            self.connection = sqlite3.connect(database, check_same_thread=False)
+        self.schema = None
+        self.plans = {}
+
+    def __enter__(self):
+        """Use the database as a context manager, which closes it."""
+        return self
+
+    def __exit__(self, *_exc_info):
+        """Close the database."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the database."""
+        self.connection.close()
+
+    @contextmanager
+    def errors(self):
+        """Raise GlucoLogError for commands that exit, or databases that fail."""
+        try:
+            yield
+        except SystemExit as se:
+            # The reason has already been logged.
+            raise GlucoLogError(
+                "glucolog failed with exit code %s; see the log for details." % se.code
+            ) from None
+        except sqlite3.Error as ee:
+            # e.g. a backup which is still being copied.
+            raise GlucoLogError(
+                "Database '%s' cannot be read: %s" % (self.database, ee)
+            ) from ee
+
+    def options(self, **options) -> Namespace:
+        """Return the options for exporting from the database."""
+        options.setdefault("periods", False)
+        options.setdefault("units", None)
+        if options["units"] not in [None] + UNITS_CHOICES:
+            raise GlucoLogError("Units '%s' are not recognised." % options["units"])
+        return Namespace(
+            database=self.database,
+            translator=self.translator,
+            translators=[self.translator],
+            xlat=self.translator.language,
+            stats=ExportStats(),
+            **options,
+        )
+
+    def read_schema(self) -> dict:
+        """Return the columns of each table, which are only listed once."""
+        if self.schema is None:
+            args, cur = self.options(), self.connection.cursor()
+            with self.errors():
+                self.schema = {
+                    it_table: list_columns(args, cur, it_table)
+                    for it_table in list_tables(args, cur)
+                }
+        return self.schema
+
+    def it_table(self, table: str) -> str:
+        """Return the name in the database of a table."""
+        it_table = table
+        if self.translator.language:
+            it_table = self.translator.from_tables.get(table)
+        if it_table not in self.read_schema():
+            raise GlucoLogError("Table '%s' is not recognised." % table)
+        return it_table
+
+    def it_columns(self, it_table: str, columns: List[str]) -> List[str]:
+        """Return the names in the database of columns of a table, or all of them."""
+        if columns is None:
+            return list(self.read_schema()[it_table])
+
+        it_columns = []
+        for column in columns:
+            it_column = column
+            if self.translator.language:
+                it_column = self.translator.from_columns.get(column)
+            if it_column not in self.read_schema()[it_table]:
+                raise GlucoLogError("Column '%s' is not recognised." % column)
+            it_columns.append(it_column)
+        return it_columns
+
+    def tables(self) -> List[str]:
+        """Return the names of the tables."""
+        return self.translator.tables(self.read_schema())
+
+    def columns(self, table: str) -> List[str]:
+        """Return the names of the columns of a table."""
+        return self.translator.columns(self.read_schema()[self.it_table(table)])
+
+    def header(
+        self, table: str, columns: List[str] = None, periods: bool = False
+    ) -> List[str]:
+        """Return the names of the columns of the rows of a table."""
+        args = self.options(periods=periods)
+        it_table = self.it_table(table)
+        it_columns = self.it_columns(it_table, columns)
+        return self.translator.columns(computed_columns(args, it_table, it_columns))
+
+    def batches(
+        self,
+        table: str,
+        columns: List[str] = None,
+        filters: dict = None,
+        *,
+        periods: bool = False,
+        units: str = None,
+        excel: bool = False,
+    ):
+        """Generate batches of the rows of a table, reformatted and translated.
+
+        Only rows whose columns equal the values, as stored in the database, given
+        by the filters are read.
+        Dates and times are formatted as they are for CSV files or, if 'excel' is
+        set, as Excel serial numbers.
+        """
+        args = self.options(periods=periods, units=units, excel_flags=[excel])
+        it_table = self.it_table(table)
+        it_columns = self.it_columns(it_table, columns)
+        filters = filters or {}
+        it_filters = self.it_columns(it_table, list(filters))
+        ot_columns = computed_columns(args, it_table, it_columns)
+        key = (it_table, tuple(ot_columns))
+        plan = self.plans.get(key)
+        if plan is None:
+            plan = self.plans[key] = self.translator.row_plan(it_table, ot_columns)
+
+        where = " AND ".join("%s = ?" % it_filter for it_filter in it_filters)
+        with self.errors():
+            for batches in export_batches(
+                args,
+                self.connection.cursor(),
+                it_table,
+                it_columns,
+                where,
+                tuple(filters.values()),
+            ):
+                yield self.translator.rows(it_table, plan, batches[excel])
+
+    def rows(
+        self, table: str, columns: List[str] = None, filters: dict = None, **options
+    ):
+        """Generate the rows of a table, reformatted and translated."""
+        for batch in self.batches(table, columns, filters, **options):
+            yield from batch
+
+    def export(
+        self,
+        output: str,
+        table: str = None,
+        columns: List[str] = None,
+        *,
+        output_format: str = CSV,
+        periods: bool = False,
+        units: str = None,
+        excel_engine: str = OPENPYXL,
+    ) -> List[str]:
+        """Export a table, or the whole database, returning the files written.
+
+        Several comma-separated formats can be given, each of which adds its suffix
+        to the output filename.
+        """
+        formats = list(dict.fromkeys(output_format.split(",")))
+        for each_format in formats:
+            if each_format not in FORMAT_CHOICES:
+                raise GlucoLogError("Format '%s' is not recognised." % each_format)
+        if len(formats) == 1 and not output.endswith(FORMAT_SUFFIXES[formats[0]]):
+            raise GlucoLogError(
+                "Output '%s' does not end in '%s'."
+                % (output, FORMAT_SUFFIXES[formats[0]])
+            )
+        if table:
+            # Check the names now, to raise a more helpful error than exiting.
+            self.it_columns(self.it_table(table), columns)
+
+        args = self.options(
+            cmd="export-table" if table else "dump-db",
+            func=do_export_table if table else do_dump_db,
+            output=output,
+            table=table,
+            columns=columns,
+            periods=periods,
+            units=units,
+            excel_engine=excel_engine,
+            jobs=None,
+            pipeline=False,
+            split=False,
+        )
+        plan_exports(args, formats)
+        with self.errors():
+            args.func(args, self.connection.cursor())
+        return args.outputs
+
+
+@lru_cache(maxsize=None)
+def cached_translator(language: str) -> Translator:
+    """Return a translator for a language, which is only read once."""
+    return Translator(language)
+
+
+class ConnectionPool:
+    """Class keeping read-only connections to the backups in a directory open.
+
+    Connections are handed to one request at a time and the least recently used
+    idle connections are closed once there are more than the size of the pool. The
+    tables and columns of each backup, and the translation plans of rows, are kept
+    for as long as the backup is unchanged.
+    """
+
+    def __init__(self, directory: str, pattern: str, language: str, size: int):
+        """Start with no connections open."""
+        self.directory = directory
+        self.pattern = pattern
+        self.language = language
+        self.size = size
+        self.idle = []
+        self.schemas = {}
+        self.plans = {}
+        self.counts = dict.fromkeys(SERVER_COUNTS, 0)
+        self.lock = threading.Lock()
+
+    def count(self, counter: str, value: int = 1) -> None:
+        """Add to one of the counts reported by the server."""
+        with self.lock:
+            self.counts[counter] += value
+
+    def backups(self) -> List[str]:
+        """Return the backups in the directory, relative to it."""
+        return sorted(
+            os.path.relpath(os.path.join(dirpath, filename), self.directory)
+            for dirpath, _dirnames, filenames in os.walk(self.directory)
+            for filename in fnmatch.filter(filenames, self.pattern)
+        )
+
+    def key(self, backup: str) -> tuple:
+        """Return the backup's path, size and modification time, checking its name."""
+        backup = os.path.normpath(backup or "")
+        filename = os.path.join(self.directory, backup)
+        if (
+            os.path.isabs(backup)
+            or backup.startswith(os.pardir)
+            or not fnmatch.fnmatch(os.path.basename(backup), self.pattern)
+            or not os.path.isfile(filename)
+        ):
+            raise GlucoLogError("Backup '%s' is not recognised." % backup)
+        stat = os.stat(filename)
+        return filename, stat.st_size, stat.st_mtime_ns
+
+    @contextmanager
+    def connection(self, backup: str):
+        """Lend a connection to a backup, opening one if none is idle."""
+        key = self.key(backup)
+        with self.lock:
+            # The most recently used idle connection to the backup is lent.
+            database = None
+            for iindex in range(len(self.idle) - 1, -1, -1):
+                if self.idle[iindex][0] == key:
+                    database = self.idle.pop(iindex)[1]
+                    break
+            self.counts[POOL_HITS if database else POOL_MISSES] += 1
+        if database is None:
+            database = GlucoLogDatabase(key[0], self.language, read_only=True)
+            database.schema = self.schemas.get(key)
+            database.plans = self.plans
+
+        try:
+            yield database
+        finally:
+            with self.lock:
+                # Only the schema of the latest version of each backup is kept.
+                for old_key in [
+                    old_key
+                    for old_key in self.schemas
+                    if old_key[0] == key[0] and old_key != key
+                ]:
+                    del self.schemas[old_key]
+                self.schemas[key] = database.schema
+                self.idle.append((key, database))
+                size = self.size
+                evicted, self.idle = self.idle[:-size], self.idle[-size:]
+                self.counts[POOL_EVICTIONS] += len(evicted)
+            for _, old_database in evicted:
+                old_database.close()
+
+    def stats(self) -> dict:
+        """Return the counts reported by the server."""
+        with self.lock:
+            stats = dict(self.counts)
+            stats["idle_connections"] = len(self.idle)
+        return stats
+
+    def close(self) -> None:
+        """Close all of the idle connections."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for _, database in idle:
+            database.close()
+
+
+def json_chunks(value):
+    """Generate a value as JSON."""
+    yield (json.dumps(value) + "\n").encode()
+
+
+def export_chunks(pool: ConnectionPool, query: dict, output_format: str):
+    """Generate the header and rows of a table of a backup in CSV or NDJSON."""
+    import csv
+
+    options = {
+        "periods": query.get("periods", [""])[0] in ("1", "true", "yes"),
+        "units": query.get("units", [None])[0],
+    }
+    columns = query.get("columns", [None])[0]
+    columns = columns.split(",") if columns else None
+    table = query.get("table", [""])[0]
+    with pool.connection(query.get("backup", [None])[0]) as database:
+        header = database.header(table, columns, options["periods"])
+        # The first batch is read before anything is sent, so that all of the options
+        # have been checked.
+        batches = database.batches(table, columns, **options)
+        first = next(batches, [])
+        text = io.StringIO()
+        csv_writer = csv.writer(text)
+        if output_format == CSV:
+            csv_writer.writerow(header)
+
+        for batch in itertools.chain([first], batches):
+            if output_format == CSV:
+                csv_writer.writerows(batch)
+            else:
+                for row in batch:
+                    text.write(json.dumps(dict(zip(header, row))) + "\n")
+            pool.count(ROWS_WRITTEN, len(batch))
+            yield text.getvalue().encode()
+            text.seek(0)
+            text.truncate()
+
+
+def route_request(pool: ConnectionPool, path: str, query: dict) -> tuple:
+    """Return the content type and the chunks of the response to a request."""
+    backup = query.get("backup", [None])[0]
+    table = query.get("table", [""])[0]
+    if path == SERVE_BACKUPS:
+        return CONTENT_TYPES[JSON], json_chunks(pool.backups())
+    if path == SERVE_STATS:
+        return CONTENT_TYPES[JSON], json_chunks(pool.stats())
+    if path == SERVE_TABLES:
+        with pool.connection(backup) as database:
+            return CONTENT_TYPES[JSON], json_chunks(database.tables())
+    if path == SERVE_COLUMNS:
+        with pool.connection(backup) as database:
+            return CONTENT_TYPES[JSON], json_chunks(database.columns(table))
+
+    stem, suffix = os.path.splitext(path)
+    for output_format in (CSV, NDJSON):
+        if stem == SERVE_EXPORT and suffix == FORMAT_SUFFIXES[output_format]:
+            return CONTENT_TYPES[output_format], export_chunks(
+                pool, query, output_format
+            )
+    raise FileNotFoundError(path)
+
+
+def handle_request(handler, pool: ConnectionPool) -> None:
+    """Respond to a request, streaming the response as it is generated."""
+    from urllib.parse import parse_qs, urlsplit
+
+    pool.count(REQUESTS)
+    url = urlsplit(handler.path)
+    try:
+        content_type, chunks = route_request(pool, url.path, parse_qs(url.query))
+        # The first chunk is generated before responding, so that unknown tables and
+        # columns are reported as errors.
+        first = next(chunks)
+    except FileNotFoundError:
+        pool.count(ERRORS)
+        handler.send_error(404, "Not found")
+        return
+    except GlucoLogError as ee:
+        # The reason quotes the request, so is only sent in the body, which is
+        # escaped, and never in the status line.
+        pool.count(ERRORS)
+        handler.send_error(400, "Bad request", str(ee))
+        return
+
+    handler.send_response(200)
+    handler.send_header("Content-Type", content_type)
+    handler.end_headers()
+    try:
+        for chunk in itertools.chain([first], chunks):
+            handler.wfile.write(chunk)
+            pool.count(BYTES_WRITTEN, len(chunk))
+    except GlucoLogError as ee:
+        # The response has started, so it can only be cut short.
+        pool.count(ERRORS)
+        log.error("Response to '%s' cut short: %s", handler.path, ee)
+    finally:
+        chunks.close()
+
+
+def make_server(args: Namespace):
+    """Create an HTTP server for the backups in a directory."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    pool = ConnectionPool(
+        args.database, args.pattern, args.translator.language, args.pool
+    )
+
+    class RequestHandler(BaseHTTPRequestHandler):
+        """Class handling requests to the server."""
+
+        def do_GET(self):
+            """Respond to a GET request."""
+            handle_request(self, pool)
+
+        def log_message(self, fmt, *fmt_args):
+            """Log requests to the log file rather than to stderr."""
+            log.info("%s %s", self.address_string(), fmt % fmt_args)
+
+    server = ThreadingHTTPServer((args.host, args.port), RequestHandler)
+    server.daemon_threads = True
+    server.pool = pool
+    return server
+
+
+@entry_exit
+def do_serve(args: Namespace, cur: Cursor):
+    """Serve the backups in a directory over HTTP until interrupted."""
+    if not os.path.isdir(args.database):
+        log.error("'%s' is not a directory of backups.", args.database)
+        sys.exit(2)
+
+    server = make_server(args)
+    host, port = server.server_address[:2]
+    log.warning("Serving '%s' on http://%s:%d/", args.database, host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.warning("Stopped serving '%s'.", args.database)
+    finally:
+        server.server_close()
+        server.pool.close()
+
+
+def date_argument(value: str) -> datetime.date:
+    """Parse a YYYY-MM-DD date given on the command line."""
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("'%s' is not a YYYY-MM-DD date" % value)
+
+
+def date_milliseconds(value: datetime.date) -> int:
+    """Convert a date into the milliseconds used for dates in the database."""
+    return calendar.timegm(value.timetuple()) * 1000
 
 
 @entry_exit
@@ -649,14 +3268,15 @@ def setup_logging(args):
 
 
 @entry_exit
-def read_language_file(language):
-    """Read the language file, validate it and return tranlations."""
+def compile_language_file(filename: str):
+    """Parse a language file and create the reverse translation table."""
     # At some point we might want to use the python-i18n package instead.
-    xlat_to = {}
-    dirname = os.path.dirname(__file__)
-    filename = os.path.join(dirname, FMT_LANG_FILE.format(language=language))
+    import yaml
+
+    # The C loader is much faster, if PyYAML was built with it.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     with open(filename, "r") as source:
-        xlat_to = yaml.load(source, Loader=yaml.SafeLoader)
+        xlat_to = yaml.load(source, Loader=loader)
 
     # Now create the reverse translation table.
     xlat_from = {}
@@ -668,6 +3288,60 @@ def read_language_file(language):
     return xlat_to, xlat_from
 
 
+@entry_exit
+def read_language_file(language):
+    """Read the language file, validate it and return tranlations."""
+    filename = language_filename(language)
+    stat = os.stat(filename)
+
+    # Parsing YAML is slow so both directions of translation are cached, compiled,
+    # and only recompiled if the language file has changed.
+    try:
+        cache_file = os.path.join(
+            cache_directory(),
+            FMT_LANG_CACHE.format(language=language, version=LANG_CACHE_VERSION),
+        )
+    except OSError as ee:
+        # Nor is being unable to create the cache directory, as below.
+        log.warning("Unable to use cache directory: %s", ee)
+        return compile_language_file(filename)
+
+    try:
+        with open(cache_file, "r") as source:
+            cache = json.load(source)
+    except (OSError, ValueError):
+        cache = {}
+    if cache.get(SIZE) == stat.st_size and cache.get(MTIME) == stat.st_mtime_ns:
+        log.debug("using compiled language file '%s'", cache_file)
+        return cache[XLAT_TO], cache[XLAT_FROM]
+
+    # The file may just have been touched, for example by reinstalling.
+    digest = file_digest(filename)
+    if cache.get(DIGEST) == digest:
+        xlat_to, xlat_from = cache[XLAT_TO], cache[XLAT_FROM]
+    else:
+        log.debug("compiling language file '%s'", filename)
+        xlat_to, xlat_from = compile_language_file(filename)
+
+    cache = {
+        SIZE: stat.st_size,
+        MTIME: stat.st_mtime_ns,
+        DIGEST: digest,
+        XLAT_TO: xlat_to,
+        XLAT_FROM: xlat_from,
+    }
+    build_file = "%s.%d.tmp" % (cache_file, os.getpid())
+    try:
+        with open(build_file, "w") as target:
+            json.dump(cache, target)
+        os.replace(build_file, cache_file)
+    except OSError as ee:
+        # Failing to cache the translations is not a reason to fail the command.
+        log.warning("Unable to write compiled language file '%s': %s", cache_file, ee)
+
+    return xlat_to, xlat_from
+
+
 @entry_exit
 def list_languages():
     """List language files so user has options for translation."""
@@ -680,15 +3354,99 @@ def list_languages():
     return languages
 
 
+def language_filename(language: str) -> str:
+    """Return the name of the file for a language."""
+    return os.path.join(
+        os.path.dirname(__file__), FMT_LANG_FILE.format(language=language)
+    )
+
+
+def is_language(language: str) -> bool:
+    """Return whether there is a file for a language."""
+    return bool(RGX_LANGUAGE.match(language)) and os.path.isfile(
+        language_filename(language)
+    )
+
+
+def language_argument(value: str) -> str:
+    """Check that there are language files for the languages given as an argument."""
+    if value == ALL_LANGUAGES:
+        return value
+
+    # Language files are only looked for when a language is given.
+    for language in value.split(","):
+        if not is_language(language):
+            raise argparse.ArgumentTypeError(
+                "invalid choice: '%s' (choose from %s, or %s)"
+                % (language, ", ".join(sorted(list_languages())), ALL_LANGUAGES)
+            )
+    return value
+
+
+def format_argument(value: str) -> str:
+    """Check the output formats given as an argument."""
+    for output_format in value.split(","):
+        if output_format not in FORMAT_CHOICES:
+            raise argparse.ArgumentTypeError(
+                "invalid choice: '%s' (choose from %s)"
+                % (output_format, ", ".join(FORMAT_CHOICES))
+            )
+    return value
+
+
+def export_output(
+    output: str, language: str, output_format: str, languages: list, formats: list
+) -> str:
+    """Return the name of the output file for a language and format."""
+    if len(formats) > 1:
+        # The output was given without a suffix, which depends on the format.
+        output += FORMAT_SUFFIXES[output_format]
+    if len(languages) == 1:
+        return output
+
+    stem, suffix = os.path.splitext(output)
+    return FMT_LANGUAGE_OUTPUT.format(stem=stem, language=language, suffix=suffix)
+
+
+def plan_exports(args: Namespace, formats: List[str]) -> None:
+    """Set the language, format and output file of each export to be written."""
+    if len(formats) > 1:
+        # Each format adds its own suffix to the output filename.
+        stem, suffix = os.path.splitext(args.output)
+        if suffix in FORMAT_SUFFIXES.values():
+            setattr(args, "output", stem)
+    setattr(args, "format", formats[0])
+    setattr(
+        args,
+        "excel_flags",
+        sorted({output_format == EXCEL for output_format in formats}),
+    )
+
+    languages = [translator.language for translator in args.translators]
+    setattr(
+        args,
+        "exports",
+        [
+            (
+                translator,
+                output_format,
+                export_output(
+                    args.output, translator.language, output_format, languages, formats
+                ),
+            )
+            for translator in args.translators
+            for output_format in formats
+        ],
+    )
+    setattr(args, "outputs", [output for _, _, output in args.exports])
+
+
 @entry_exit
 def parse_args(argv):
     """Parse command line arguments."""
     # Determine default log file (local file with name of script).
     default_logfile = os.path.splitext(os.path.basename(argv[0]))[0] + ".log"
 
-    # Determine available languages.
-    languages = list_languages()
-
     parser = argparse.ArgumentParser(
         prog=PROC_NAME,
         description="Tool to extract information from a GlucoLog back-up database",
@@ -713,16 +3471,38 @@ def parse_args(argv):
     common_group.add_argument(
         "-l", "--logfile", help="specify log file name", default=default_logfile
     )
+    common_group.add_argument(
+        "--excel-engine",
+        choices=EXCEL_ENGINE_CHOICES,
+        default=OPENPYXL,
+        help="write Excel spreadsheets with openpyxl, or natively which is faster",
+    )
+    common_group.add_argument(
+        "--profile",
+        metavar="FILE",
+        default=None,
+        help="profile the command, writing statistics to this file",
+    )
+    common_group.add_argument(
+        "--report",
+        metavar="FILE",
+        default=None,
+        help="write a JSON report of rows, bytes and timings to this file",
+    )
+    common_group.add_argument(
+        "--trace",
+        metavar="FILE",
+        default=None,
+        help="trace the command, writing Chrome trace-event JSON to this file",
+    )
 
-    if languages:
-        # We have some languages so add the option.
-        common_group.add_argument(
-            "-x",
-            "--xlat",
-            type=str,
-            choices=languages,
-            help="language to translate to",
-        )
+    common_group.add_argument(
+        "-x",
+        "--xlat",
+        type=language_argument,
+        metavar="LANGUAGE",
+        help="language, or comma-separated languages or 'all', to translate to",
+    )
 
     common_group.add_argument(
         "database",
@@ -754,23 +3534,219 @@ def parse_args(argv):
     export_parser.add_argument(
         "-f",
         "--format",
-        choices=FORMAT_CHOICES,
+        type=format_argument,
         required=True,
-        help="output to CSV file",
+        help="output format, or comma-separated formats, from %s"
+        % ", ".join(FORMAT_CHOICES),
+    )
+    export_parser.add_argument(
+        "-p",
+        "--periods",
+        action="store_true",
+        help="add the period of the day computed from the patient's parameters",
+    )
+    export_parser.add_argument(
+        "-u",
+        "--units",
+        choices=UNITS_CHOICES,
+        default=None,
+        help="convert glycaemia results to these units",
+    )
+    export_parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="read, reformat and write the rows in separate threads",
+    )
+    export_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of processes exporting ranges of the table in parallel",
     )
     export_parser.add_argument("output", help="name of destination file")
-    export_parser.set_defaults(func=do_export_table, cmd="export-table")
+    export_parser.set_defaults(func=do_export_table, cmd="export-table", fan_out=True)
 
     dump_parser = subparsers.add_parser("dump-db")
-    dump_parser.set_defaults(func=do_dump_db, cmd="dump-db")
+    dump_parser.set_defaults(func=do_dump_db, cmd="dump-db", fan_out=True)
     dump_parser.add_argument(
         "-f",
         "--format",
-        choices=FORMAT_CHOICES,
+        type=format_argument,
         required=True,
-        help="output to CSV file",
+        help="output format, or comma-separated formats, from %s"
+        % ", ".join(FORMAT_CHOICES),
+    )
+    dump_parser.add_argument(
+        "-p",
+        "--periods",
+        action="store_true",
+        help="add the period of the day computed from the patient's parameters",
     )
-    dump_parser.add_argument("output", help="name of destination file")
+    dump_parser.add_argument(
+        "-u",
+        "--units",
+        choices=UNITS_CHOICES,
+        default=None,
+        help="convert glycaemia results to these units",
+    )
+    dump_parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="read, reformat and write the rows in separate threads",
+    )
+    dump_parser.add_argument(
+        "-s",
+        "--split",
+        action="store_true",
+        help="write a CSV file for each table to a directory, or a zip archive if "
+        "the output ends in '%s'" % ZIP_SUFFIX,
+    )
+    dump_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of tables to write to a directory in parallel",
+    )
+    dump_parser.add_argument("output", help="name of destination file or directory")
+
+    join_parser = subparsers.add_parser("join-insulin")
+    join_parser.set_defaults(func=do_join_insulin, cmd="join-insulin")
+    join_parser.add_argument(
+        "-f",
+        "--format",
+        type=format_argument,
+        required=True,
+        help="output format, or comma-separated formats, from %s"
+        % ", ".join(FORMAT_CHOICES),
+    )
+    join_parser.add_argument(
+        "-w",
+        "--window",
+        type=int,
+        default=DEFAULT_WINDOW,
+        help="minutes before a reading in which to look for an insulin dose",
+    )
+    join_parser.add_argument("output", help="name of destination file")
+
+    search_parser = subparsers.add_parser("search")
+    search_parser.set_defaults(func=do_search, cmd="search", fan_out=True)
+    search_parser.add_argument(
+        "-f",
+        "--format",
+        type=format_argument,
+        required=True,
+        help="output format, or comma-separated formats, from %s"
+        % ", ".join(FORMAT_CHOICES),
+    )
+    search_parser.add_argument(
+        "query", help="full-text query to match against comments and events"
+    )
+    search_parser.add_argument("output", help="name of destination file")
+
+    serve_parser = subparsers.add_parser("serve")
+    serve_parser.set_defaults(func=do_serve, cmd="serve", directory=True)
+    serve_parser.add_argument(
+        "--host", default=DEFAULT_HOST, help="address on which to serve the backups"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="port on which to serve"
+    )
+    serve_parser.add_argument(
+        "--pool",
+        type=int,
+        default=DEFAULT_POOL_SIZE,
+        help="number of idle database connections to keep open",
+    )
+    serve_parser.add_argument(
+        "--pattern",
+        default=DEFAULT_PATTERN,
+        help="pattern matching backups in a directory of backups",
+    )
+
+    watch_parser = subparsers.add_parser("watch")
+    # Readings are appended to text files, never to spreadsheets.
+    watch_parser.set_defaults(
+        func=do_watch, cmd="watch", directory=True, excel_flags=[False]
+    )
+    watch_parser.add_argument(
+        "-c",
+        "--columns",
+        default=None,
+        help="comma seperated names of columns of the readings",
+    )
+    watch_parser.add_argument(
+        "-f",
+        "--format",
+        choices=WATCH_FORMATS,
+        default=CSV,
+        help="format of the files that readings are appended to",
+    )
+    watch_parser.add_argument(
+        "-p",
+        "--periods",
+        action="store_true",
+        help="add the period of the day computed from the patient's parameters",
+    )
+    watch_parser.add_argument(
+        "-u",
+        "--units",
+        choices=UNITS_CHOICES,
+        default=None,
+        help="convert glycaemia results to these units",
+    )
+    watch_parser.add_argument(
+        "--pattern",
+        default=DEFAULT_PATTERN,
+        help="pattern matching backups in a directory of backups",
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_INTERVAL,
+        help="seconds to wait between looking for new or changed backups",
+    )
+    watch_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="look for new or changed backups once, rather than until interrupted",
+    )
+    watch_parser.add_argument(
+        "output", help="directory of files to append each backup's readings to"
+    )
+
+    catalog_parser = subparsers.add_parser("catalog")
+    catalog_parser.set_defaults(func=do_catalog, cmd="catalog")
+
+    # Options for selecting backups from a directory using the catalog.
+    for directory_parser in (search_parser, catalog_parser):
+        directory_parser.set_defaults(directory=True)
+        directory_parser.add_argument(
+            "--catalog",
+            help="catalog file for a directory of backups",
+        )
+        directory_parser.add_argument(
+            "--pattern",
+            default=DEFAULT_PATTERN,
+            help="pattern matching backups in a directory of backups",
+        )
+        directory_parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="number of backups to scan in parallel",
+        )
+        directory_parser.add_argument(
+            "--patient", help="only backups for a patient's name or PID"
+        )
+        directory_parser.add_argument(
+            "--since", type=date_argument, help="only readings on or after this date"
+        )
+        directory_parser.add_argument(
+            "--until", type=date_argument, help="only readings on or before this date"
+        )
 
     args = parser.parse_args(argv[1:])
 
@@ -782,40 +3758,127 @@ def parse_args(argv):
     if getattr(args, "columns", None) is not None:
         setattr(args, "columns", args.columns.split(","))
 
-    if "format" in args:
+    # Dates are compared with those in the database, which are in milliseconds, and
+    # the "until" date is inclusive.
+    if getattr(args, "since", None) is not None:
+        setattr(args, "since", date_milliseconds(args.since))
+    if getattr(args, "until", None) is not None:
+        setattr(
+            args,
+            "until",
+            date_milliseconds(args.until + datetime.timedelta(days=1)),
+        )
+
+    formats = []
+    if "format" in args and args.cmd != "watch":
         log.debug("check format, '%s' vs output file, '%s'", args.format, args.output)
-        if not args.output.endswith(FORMAT_SUFFIXES[args.format]):
-            parser.error(
-                "Output '%s' filename '%s' does not end in '%s'"
-                % (args.format, args.output, FORMAT_SUFFIXES[args.format])
-            )
+        formats = list(dict.fromkeys(args.format.split(",")))
+        if getattr(args, "split", False):
+            # The output is a directory or zip archive of CSV files.
+            if formats != [CSV]:
+                parser.error("Only the '%s' format can be split into tables." % CSV)
+        elif len(formats) == 1:
+            if not args.output.endswith(FORMAT_SUFFIXES[args.format]):
+                parser.error(
+                    "Output '%s' filename '%s' does not end in '%s'"
+                    % (args.format, args.output, FORMAT_SUFFIXES[args.format])
+                )
+        elif not getattr(args, "fan_out", False):
+            parser.error("Only one format can be given for this command.")
+
+    # Time spent in each stage of exporting a table is always recorded.
+    setattr(args, "stats", ExportStats())
 
     # If present, read the language file.
     if getattr(args, "xlat", None) is not None:
         log.info("Reading language file for '%s'...", args.xlat)
-        xlat_to, xlat_from = read_language_file(args.xlat)
-        setattr(args, "xlat_to", xlat_to)
-        setattr(args, "xlat_from", xlat_from)
+        if args.xlat == ALL_LANGUAGES:
+            languages = sorted(list_languages())
+        else:
+            languages = list(dict.fromkeys(args.xlat.split(",")))
     else:
         # Ensure that there is an xlat field, even if it is only "None"
         log.debug("no language file specified")
         setattr(args, "xlat", None)
-        setattr(args, "xlat_to", {})
-        setattr(args, "xlat_from", {})
+        languages = [None]
+
+    # Exports can be written in several languages at once, with one output file for
+    # each, and names given on the command line are in the first of the languages.
+    if len(languages) > 1 and not getattr(args, "fan_out", False):
+        parser.error("Only one language can be given for this command.")
+    setattr(args, "translators", [Translator(language) for language in languages])
+    setattr(args, "translator", args.translators[0])
+    if formats:
+        plan_exports(args, formats)
 
     return args
 
 
+@entry_exit
+def write_report(args: Namespace, completed: bool) -> None:
+    """Write a machine-readable report of the run."""
+    with open(args.report, "w") as report_file:
+        json.dump(args.stats.report(args, completed), report_file, indent=2)
+    log.info("Report written to '%s'.", args.report)
+
+
+def write_trace(args: Namespace) -> None:
+    """Stop tracing and write the spans that were recorded."""
+    global tracer
+    trace, tracer = tracer.trace(), None
+    with open(args.trace, "w") as trace_file:
+        json.dump(trace, trace_file)
+    log.info("Trace written to '%s'.", args.trace)
+
+
+@entry_exit
+def run_command(args: Namespace, cur: Cursor):
+    """Run the command, profiling, tracing and reporting on it if requested."""
+    global tracer
+    profiler = cProfile.Profile() if args.profile else None
+    if args.trace:
+        tracer = Tracer()
+    completed = False
+    try:
+        if profiler:
+            profiler.runcall(args.func, args, cur)
+        else:
+            args.func(args, cur)
+        completed = True
+    finally:
+        if args.trace:
+            write_trace(args)
+        if profiler:
+            profiler.dump_stats(args.profile)
+            log.info("Profile written to '%s'.", args.profile)
+            args.stats.log_times()
+        if args.report:
+            write_report(args, completed)
+
+
 @entry_exit
 def main(argv):
     """Mainline routine."""
     args = parse_args(argv)
     setup_logging(args)
 
+    # Some commands work on a whole directory of backups rather than a database.
+    if os.path.isdir(args.database):
+        if not getattr(args, "directory", False):
+            log.error("'%s' is a directory, not a database.", args.database)
+            return 2
+
+        try:
+            run_command(args, None)
+        except SystemExit as se:
+            return se.code
+
+        return 0
+
     with sqlite3.connect(args.database) as con:
         try:
             cur = con.cursor()
-            args.func(args, cur)
+            run_command(args, cur)
 
         except SystemExit as se:
             # This code ensures that we close down the DB on a sys.exit() call.
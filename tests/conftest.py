@@ -1,7 +1,9 @@
 """Fixtures to create, and discard, files for testing."""
 import os
+import time
 import pytest
 from mock_database import mock_database
+from src.glucolog.glucolog import CONVERTERS
 
 
 @pytest.fixture
@@ -13,6 +15,28 @@ def db(tmp_path, request):
     os.remove(db_filename)
 
 
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """Keep cached files for each test out of the user's cache directory."""
+    cache_dirname = os.path.join(tmp_path, "cache")
+    monkeypatch.setenv("GLUCOLOG_CACHE", cache_dirname)
+    yield cache_dirname
+
+
+@pytest.fixture
+def timezone(monkeypatch):
+    """Run in a time zone well away from UTC, with empty converter caches."""
+    monkeypatch.setenv("TZ", "IST-5:30")
+    time.tzset()
+    for converter in CONVERTERS.values():
+        converter.cache_clear()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+    for converter in CONVERTERS.values():
+        converter.cache_clear()
+
+
 @pytest.fixture
 def csv(tmp_path, request):
     """Create an output CSV filename for the specific test."""
@@ -0,0 +1,80 @@
+"""Test the asynchronous API."""
+import asyncio
+import os
+import pytest
+from src import glucolog
+from src.glucolog import aiter_rows, export
+from src.glucolog.glucolog import GlucoLogError
+
+
+async def _rows(*args, **kwargs):
+    """Collect the rows generated by aiter_rows()."""
+    return [row async for row in aiter_rows(*args, **kwargs)]
+
+
+def test_aiter_rows(db, capsys):
+    """Rows are reformatted and translated."""
+    rows = asyncio.run(_rows(db, "t_results", ["_id", "date", "period"], language="en"))
+    assert len(rows) == 6
+    assert rows[0] == (17, "2021-04-28", "morning")
+
+    rows = asyncio.run(_rows(db, "t_risultati", ["_id", "data"], excel=True))
+    assert isinstance(rows[0][1], float)
+
+
+def test_aiter_rows_concurrently(db, capsys):
+    """Several tables can be read at once, and reading can stop early."""
+
+    async def first_row(table):
+        async for row in aiter_rows(db, table, periods=True):
+            return row
+
+    async def read_tables():
+        return await asyncio.gather(
+            _rows(db, "t_risultati"), first_row("t_risultati"), _rows(db, "t_parametri")
+        )
+
+    results, first, parameters = asyncio.run(read_tables())
+    assert len(results) == 6
+    assert first[:-1] == results[0]
+    assert first[-1] == "mattino"
+    assert len(parameters) == 1
+
+
+def test_aiter_rows_errors(db, tmp_path, capsys):
+    """Errors are raised rather than exiting."""
+    with pytest.raises(GlucoLogError, match="Table 't_nessuna' is not recognised"):
+        asyncio.run(_rows(db, "t_nessuna"))
+    with pytest.raises(GlucoLogError, match="does not exist"):
+        asyncio.run(_rows(os.path.join(tmp_path, "missing.sql3"), "t_risultati"))
+
+
+def test_export(db, tmp_path, capsys):
+    """Export a table, or the whole database, in several formats."""
+    output = os.path.join(tmp_path, "results")
+    outputs = asyncio.run(
+        export(
+            db,
+            output,
+            table="t_results",
+            columns=["_id", "period"],
+            output_format="csv,ndjson",
+            language="en",
+            periods=True,
+            units="mmol/l",
+        )
+    )
+    assert outputs == [output + ".csv", output + ".ndjson"]
+    with open(output + ".csv", "r") as source:
+        assert source.read().splitlines()[1:3] == ["_id,period", "17,morning"]
+
+    output = os.path.join(tmp_path, "dump.csv")
+    assert asyncio.run(export(db, output)) == [output]
+    with pytest.raises(GlucoLogError, match="does not exist"):
+        asyncio.run(export(os.path.join(tmp_path, "missing.sql3"), output))
+
+
+def test_unknown_attribute():
+    """Only the asynchronous API is imported on demand."""
+    with pytest.raises(AttributeError, match="no attribute 'nessuna'"):
+        glucolog.nessuna
@@ -0,0 +1,133 @@
+"""Test the synthetic databases and regression checks used for benchmarking."""
+import os
+import sys
+import json
+import pytest
+import sqlite3
+from benchmarks.synthetic import synthetic_database
+from benchmarks import run_benchmarks
+from benchmarks.run_benchmarks import LARGE_SIZE, benchmark, regressions, run
+from src.glucolog.glucolog import PROC_NAME, main
+
+
+def test_synthetic_database(tmp_path, csv):
+    """Create a synthetic database and dump it."""
+    filename = os.path.join(tmp_path, "synthetic.dbglu")
+    synthetic_database(filename, 1000, seed=1)
+
+    con = sqlite3.connect(filename)
+    rows = con.execute("SELECT * FROM t_risultati ORDER BY _id").fetchall()
+    con.close()
+    assert len(rows) == 1000
+    assert rows[-1][0] == 1000
+
+    # The same seed always gives the same database.
+    synthetic_database(filename, 1000, seed=1)
+    con = sqlite3.connect(filename)
+    assert con.execute("SELECT * FROM t_risultati ORDER BY _id").fetchall() == rows
+    con.close()
+
+    assert main([PROC_NAME, filename, "dump-db", "--format", "csv", csv]) == 0
+    with open(csv, "r") as source:
+        assert source.read().count(",Glu,") == 1000
+
+
+def test_regressions():
+    """Detect results that are slower than the baseline."""
+    baseline = [
+        {"command": "dump-db", "format": "csv", "rows": 10, "rows_per_sec": 100.0},
+        {"command": "dump-db", "format": "excel", "rows": 10, "rows_per_sec": 50.0},
+        {"command": "dump-db", "format": "csv", "rows": 20, "rows_per_sec": 50.0},
+    ]
+    results = [
+        {"command": "dump-db", "format": "csv", "rows": 10, "rows_per_sec": 80.0},
+        {"command": "dump-db", "format": "excel", "rows": 10, "rows_per_sec": 30.0},
+        {"command": "list-tables", "format": None, "rows": 10, "rows_per_sec": 1.0},
+        {"command": "dump-db", "format": "csv", "rows": 20, "returncode": 1},
+    ]
+    slower = regressions(results, baseline, 0.25)
+    assert slower == ["dump-db:excel:10: 30 rows/s, baseline 50 rows/s"]
+
+
+def test_large(tmp_path, monkeypatch):
+    """The largest database is only benchmarked when asked for."""
+    runs = []
+    monkeypatch.setattr(
+        run_benchmarks, "benchmark", lambda sizes, *_args: runs.append(sizes) or []
+    )
+    argv = ["run_benchmarks", "--sizes", "10"]
+    argv += ["--results", os.path.join(tmp_path, "results.json")]
+    assert run_benchmarks.main(argv) == 0
+    assert run_benchmarks.main(argv + ["--large"]) == 0
+    assert runs == [[10], [10, LARGE_SIZE]]
+
+
+def test_failures(monkeypatch, capsys):
+    """Commands that fail are recorded and the rest are still run."""
+    assert run([sys.executable, "-c", "raise SystemExit(3)"])["returncode"] == 3
+
+    def _run(argv):
+        if "excel" in argv:
+            return {"returncode": -9, "seconds": 1.0, "peak_rss_bytes": None}
+        if "--format" in argv:
+            with open(argv[-1], "w") as target:
+                target.write("output")
+        return {"returncode": 0, "seconds": 1.0, "peak_rss_bytes": None}
+
+    monkeypatch.setattr(run_benchmarks, "run", _run)
+    monkeypatch.setattr(run_benchmarks, "database", lambda rows, seed: "x.dbglu")
+    results = benchmark([10, 20], ["csv", "excel"], 0, 10)
+    assert [run_benchmarks.key(result) for result in results] == [
+        "list-tables:None:10",
+        "export-table:csv:10",
+        "export-table:excel:10",
+        "dump-db:csv:10",
+        "dump-db:excel:10",
+        "list-tables:None:20",
+        "export-table:csv:20",
+        "dump-db:csv:20",
+    ]
+    failed = [result for result in results if result["returncode"]]
+    assert [result["format"] for result in failed] == ["excel", "excel"]
+    assert all("rows_per_sec" not in result for result in failed)
+    assert results[1]["rows_per_sec"] == 10.0
+    assert results[1]["output_bytes"] == 6
+    assert "excel         10 rows FAILED with -9" in capsys.readouterr().out
+
+
+def test_main_failures(tmp_path, monkeypatch, capsys):
+    """The benchmarks fail if any command failed."""
+    failure = {"command": "dump-db", "format": "excel", "rows": 10, "returncode": -9}
+    monkeypatch.setattr(run_benchmarks, "benchmark", lambda *_args: [failure])
+    argv = ["run_benchmarks", "--sizes", "10"]
+    argv += ["--results", os.path.join(tmp_path, "results.json")]
+    assert run_benchmarks.main(argv) == 1
+    assert "FAILED dump-db:excel:10" in capsys.readouterr().err
+
+
+def test_baseline(tmp_path, monkeypatch, capsys):
+    """Results are only compared against a baseline that is asked for."""
+    result = {"command": "dump-db", "format": "csv", "rows": 10, "returncode": 0}
+    results = [dict(result, rows_per_sec=100.0)]
+    monkeypatch.setattr(run_benchmarks, "benchmark", lambda *_args: results)
+    baseline = os.path.join(tmp_path, "baseline.json")
+    argv = ["run_benchmarks", "--sizes", "10"]
+    argv += ["--results", os.path.join(tmp_path, "results.json")]
+
+    with pytest.raises(SystemExit):
+        run_benchmarks.main(argv + ["--save-baseline"])
+    assert run_benchmarks.main(argv + ["--baseline", baseline, "--save-baseline"]) == 0
+    assert run_benchmarks.main(argv + ["--baseline", baseline]) == 0
+    assert "WARNING" not in capsys.readouterr().err
+
+    # A baseline from elsewhere is compared against, with a warning.
+    with open(baseline) as source:
+        report = json.load(source)
+    report.update(python="2.7.18", results=[dict(result, rows_per_sec=200.0)])
+    with open(baseline, "w") as target:
+        json.dump(report, target)
+    assert run_benchmarks.main(argv) == 0
+    assert run_benchmarks.main(argv + ["--baseline", baseline]) == 1
+    err = capsys.readouterr().err
+    assert "WARNING baseline python 2.7.18 differs" in err
+    assert "REGRESSION dump-db:csv:10" in err
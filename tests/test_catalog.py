@@ -0,0 +1,197 @@
+"""Test the 'catalog' command."""
+import os
+import json
+import shutil
+import sqlite3
+from csv import reader
+import pytest
+from src.glucolog.glucolog import PROC_NAME, main, CATALOG_FILE
+
+
+@pytest.fixture
+def backups(tmp_path, db):
+    """Create a directory of backups for different patients."""
+    dirname = os.path.join(tmp_path, "backups")
+    os.makedirs(os.path.join(dirname, "2021"))
+    shutil.copy(db, os.path.join(dirname, "garibaldi.dbglu"))
+
+    # A second patient, whose readings are all a year later.
+    second = os.path.join(dirname, "2021", "mazzini.dbglu")
+    shutil.copy(db, second)
+    con = sqlite3.connect(second)
+    con.execute("UPDATE t_parametri SET nome = 'Giuseppe', cognome = 'Mazzini'")
+    con.execute("UPDATE t_risultati SET data = data + 365 * 86400000")
+    con.execute("UPDATE t_risultati SET commento = 'lunch' WHERE _id = 18")
+    con.execute("UPDATE t_risultati SET commento = 'dinner' WHERE _id = 22")
+    con.commit()
+    con.close()
+
+    # Something which is not a database at all.
+    with open(os.path.join(dirname, "broken.dbglu"), "w") as target:
+        target.write("Not a database")
+
+    # ...and something which is not a backup.
+    with open(os.path.join(dirname, "notes.txt"), "w") as target:
+        target.write("Not a backup")
+
+    yield dirname
+
+
+def catalog(backups, *options):
+    """Run the catalog command and return the backups listed."""
+    argv = [PROC_NAME, "-v", backups, "catalog", *options]
+    assert main(argv) == 0
+
+
+def test_catalog_minimal(backups, capsys):
+    """Catalog a directory of backups."""
+    catalog(backups)
+    captured = capsys.readouterr()
+    lines = captured.out.splitlines()[2:]
+    assert lines == [
+        "2021/mazzini.dbglu,Giuseppe Mazzini,,2022-04-28,2022-05-03",
+        "garibaldi.dbglu,Giuseppe Garibaldi,,2021-04-28,2021-05-03",
+    ]
+    assert "Ignoring 'broken.dbglu'" in captured.err
+
+    with open(os.path.join(backups, CATALOG_FILE), "r") as source:
+        entries = json.load(source)["backups"]
+    entry = entries["garibaldi.dbglu"]
+    assert entry["rows"]["t_risultati"] == 6
+    assert entry["rows"]["t_insulina"] == 0
+    assert entry["first"] == 1619611200000
+    assert len(entry["sha256"]) == 64
+
+
+def test_catalog_update(backups, tmp_path, capsys):
+    """Update a catalog as backups change."""
+    catalog_file = os.path.join(tmp_path, "catalog.json")
+    catalog(backups, "--catalog", catalog_file)
+    captured = capsys.readouterr()
+    assert "Scanning 3 new or changed backups" in captured.err
+    assert "Writing catalog" in captured.err
+
+    # Only the broken backup is rescanned and the catalog is unchanged.
+    written = os.stat(catalog_file).st_mtime_ns
+    catalog(backups, "--catalog", catalog_file)
+    captured = capsys.readouterr()
+    assert "Scanning 1 new or changed backups" in captured.err
+    assert os.stat(catalog_file).st_mtime_ns == written
+
+    os.remove(os.path.join(backups, "garibaldi.dbglu"))
+    catalog(backups, "--catalog", catalog_file)
+    captured = capsys.readouterr()
+    assert "Writing catalog" in captured.err
+    assert "1 of 1 backups selected" in captured.err
+
+    # Catalogs from other versions are discarded.
+    with open(catalog_file, "w") as target:
+        json.dump({"version": 0}, target)
+    catalog(backups, "--catalog", catalog_file)
+    captured = capsys.readouterr()
+    assert "Ignoring catalog" in captured.err
+
+
+def test_catalog_select(backups, capsys):
+    """Select backups from a catalog."""
+    catalog(backups, "--patient", "mazz")
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[2:] == [
+        "2021/mazzini.dbglu,Giuseppe Mazzini,,2022-04-28,2022-05-03"
+    ]
+
+    catalog(backups, "--since", "2022-05-03")
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()[2:]) == 1
+
+    catalog(backups, "--until", "2021-04-28")
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[2:][0].startswith("garibaldi.dbglu")
+
+    catalog(backups, "--since", "2021-06-01", "--until", "2021-12-31")
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[2:] == []
+
+
+def test_catalog_empty(backups, capsys):
+    """Catalog backups without readings or parameters."""
+    con = sqlite3.connect(os.path.join(backups, "garibaldi.dbglu"))
+    con.execute("DELETE FROM t_parametri")
+    con.execute("DELETE FROM t_risultati")
+    con.commit()
+    con.close()
+    catalog(backups, "--pattern", "garibaldi.dbglu")
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[2:] == ["garibaldi.dbglu,,,,"]
+
+    catalog(backups, "--pattern", "garibaldi.dbglu", "--patient", "garibaldi")
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[2:] == []
+
+    for option in ("--since", "--until"):
+        catalog(backups, "--pattern", "garibaldi.dbglu", option, "2021-01-01")
+        captured = capsys.readouterr()
+        assert captured.out.splitlines()[2:] == []
+
+
+def test_catalog_not_directory(db, capsys):
+    """Catalog something that is not a directory."""
+    assert main([PROC_NAME, db, "catalog"]) == 2
+    captured = capsys.readouterr()
+    assert "is not a directory of backups" in captured.err
+
+
+def test_catalog_bad_date(backups, capsys):
+    """Select backups with a date that is not valid."""
+    with pytest.raises(SystemExit):
+        main([PROC_NAME, backups, "catalog", "--since", "01/01/2021"])
+    captured = capsys.readouterr()
+    assert "'01/01/2021' is not a YYYY-MM-DD date" in captured.err
+
+
+def test_directory_not_database(backups, capsys):
+    """Attempt a database command on a directory."""
+    assert main([PROC_NAME, backups, "list-tables"]) == 2
+    captured = capsys.readouterr()
+    assert "is a directory, not a database" in captured.err
+
+
+def test_search_directory(backups, tmp_path, capsys):
+    """Search a directory of backups."""
+    output = os.path.join(tmp_path, "output.csv")
+    argv = [PROC_NAME, backups, "search", "-f", "csv", "lunch", output]
+    assert main(argv) == 0
+    with open(output, "r", newline="") as source:
+        rows = list(reader(source))
+    # Backups without any matching readings are skipped.
+    assert rows[0] == ["2021_mazzini"]
+    assert len(rows) == 3
+    assert rows[-1][0] == "18"
+
+    # Only the second patient has readings in May 2022, and only the dinner is on
+    # the 1st.
+    argv = [PROC_NAME, "-v", backups, "search", "-f", "csv"]
+    argv += ["--since", "2022-05-01", "--until", "2022-05-01"]
+    assert main(argv + ["lunch OR dinner", output]) == 0
+    captured = capsys.readouterr()
+    assert "1 of 2 backups selected" in captured.err
+    with open(output, "r", newline="") as source:
+        rows = list(reader(source))
+    assert len(rows) == 3
+    assert rows[-1][0] == "22"
+
+
+def test_search_directory_excel(backups, tmp_path, capsys):
+    """Search a directory of backups into a spreadsheet."""
+    output = os.path.join(tmp_path, "output.xlsx")
+    argv = [PROC_NAME, backups, "search", "-f", "excel", "--patient", "G", "x", output]
+    assert main(argv) == 0
+
+
+def test_search_directory_bad_query(backups, tmp_path, capsys):
+    """Search a directory of backups with a query that is not valid."""
+    output = os.path.join(tmp_path, "output.csv")
+    argv = [PROC_NAME, backups, "search", "-f", "csv", "NOT lunch", output]
+    assert main(argv) == 2
+    captured = capsys.readouterr()
+    assert "is not valid" in captured.err
@@ -0,0 +1,84 @@
+"""Test using a GlucoLog database from Python."""
+import os
+import sys
+import logging
+import pytest
+from mock_database import DB_TABLES, DB_EN_TABLES
+from src.glucolog.glucolog import GlucoLogDatabase, GlucoLogError
+
+
+def test_database_names(db):
+    """Tables and columns are listed once, and translated."""
+    handlers = list(logging.getLogger().handlers)
+    with GlucoLogDatabase(db, "en") as database:
+        assert database.tables() == DB_EN_TABLES
+        schema = database.read_schema()
+        assert database.columns("t_results")[:3] == ["_id", "date", "now"]
+        assert database.read_schema() is schema
+        assert GlucoLogDatabase(db, "en").translator is database.translator
+    with GlucoLogDatabase(db) as database:
+        assert database.tables() == DB_TABLES
+    # Logging is left to the caller.
+    assert logging.getLogger().handlers == handlers
+
+
+def test_database_rows(db):
+    """Rows are read, filtered, reformatted and translated."""
+    with GlucoLogDatabase(db, "en") as database:
+        rows = list(database.rows("t_results", ["_id", "date", "period"]))
+        assert len(rows) == 6
+        assert rows[0] == (17, "2021-04-28", "morning")
+
+        rows = database.rows(
+            "t_results", ["_id", "now"], {"period": "sera"}, periods=True
+        )
+        assert list(rows) == [(22, "19:11", "evening")]
+        (row,) = database.rows("t_results", ["date"], {"_id": 17}, excel=True)
+        assert isinstance(row[0], float)
+
+
+def test_database_export(db, tmp_path):
+    """Export a table, or the whole database, many times from one connection."""
+    output = os.path.join(tmp_path, "results.csv")
+    with GlucoLogDatabase(db, "en") as database:
+        assert database.export(output, "t_results", ["_id", "period"]) == [output]
+        with open(output, "r") as source:
+            assert source.read().splitlines()[1:3] == ["_id,period", "17,morning"]
+
+        output = os.path.join(tmp_path, "dump")
+        assert database.export(output, output_format="csv,excel", units="mg/dl") == [
+            output + ".csv",
+            output + ".xlsx",
+        ]
+
+
+def test_database_errors(db, tmp_path):
+    """Errors raise GlucoLogError rather than exiting."""
+    missing = os.path.join(tmp_path, "missing.sql3")
+    with pytest.raises(GlucoLogError, match="Database '.*' does not exist"):
+        GlucoLogDatabase(missing)
+    with pytest.raises(GlucoLogError, match="Language 'xx' is not recognised"):
+        GlucoLogDatabase(db, "xx")
+
+    with GlucoLogDatabase(db, "en") as database:
+        with pytest.raises(GlucoLogError, match="Table 't_risultati' is not"):
+            database.columns("t_risultati")
+        with pytest.raises(GlucoLogError, match="Column 'data' is not"):
+            list(database.rows("t_results", ["data"]))
+        with pytest.raises(GlucoLogError, match="Units 'mmol' are not"):
+            list(database.rows("t_results", units="mmol"))
+        with pytest.raises(GlucoLogError, match="Format 'pdf' is not"):
+            database.export("results.pdf", output_format="pdf")
+        with pytest.raises(GlucoLogError, match="does not end in '.csv'"):
+            database.export("results.xlsx")
+        with pytest.raises(GlucoLogError, match="exit code 2"):
+            with database.errors():
+                sys.exit(2)
+
+    # A backup which is still being copied is not yet a database.
+    partial = os.path.join(tmp_path, "partial.dbglu")
+    with open(partial, "w") as target:
+        target.write("Not yet a database")
+    with GlucoLogDatabase(partial) as database:
+        with pytest.raises(GlucoLogError, match="cannot be read: file is not a"):
+            database.tables()
@@ -1,5 +1,10 @@
 """Test the 'dump' command."""
+import os
 import re
+import datetime
+import zipfile
+import pytest
+from openpyxl import load_workbook
 from mock_database import (
     DATABASE,
     TABLES,
@@ -71,3 +76,126 @@ def test_dump_translated(db, csv, capsys):
     data_translation_validation(output)
     assert "primo_pomeriggio" not in output
     assert "mezzanotte" in output
+
+
+def test_dump_periods(db, csv, capsys):
+    """Perform a dump with the computed period of the day."""
+    args = [PROC_NAME, db, "dump-db", "--periods", "--format", "csv", csv]
+    main(args)
+
+    with open(csv, "r") as source:
+        output = source.read()
+
+    assert ",periodo_calcolato\n" in output
+    assert output.count(",mattino,") == 2
+
+
+def test_dump_languages(db, tmp_path, capsys):
+    """Dump once, writing a file for each language."""
+    output = os.path.join(tmp_path, "dump.csv")
+    args = [PROC_NAME, "--xlat", "all", db, "dump-db", "--format", "csv", output]
+    assert main(args) == 0
+    assert not os.path.exists(output)
+
+    with open(os.path.join(tmp_path, "dump.en.csv"), "r") as source:
+        en_output = source.read()
+    dump_basic_validation(en_output, EN_NAME)
+    data_translation_validation(en_output)
+
+    with open(os.path.join(tmp_path, "dump.it.csv"), "r") as source:
+        it_output = source.read()
+    dump_basic_validation(it_output, NAME)
+    assert "primo_pomeriggio" in it_output
+
+
+def test_dump_languages_one_command(db, capsys):
+    """Only exports may be written in several languages."""
+    args = [PROC_NAME, "-x", "it,en", db, "join-insulin", "-f", "csv", "join.csv"]
+    with pytest.raises(SystemExit) as ee:
+        main(args)
+    assert ee.value.code == 2
+    assert "Only one language" in capsys.readouterr().err
+
+
+def test_dump_formats(db, tmp_path, capsys):
+    """Dump once to both CSV and Excel, in both languages."""
+    output = os.path.join(tmp_path, "dump.xlsx")
+    args = [PROC_NAME, "-x", "en,it", db, "dump-db", "--format", "csv,excel", output]
+    assert main(args) == 0
+
+    for language in ("en", "it"):
+        assert os.path.exists(os.path.join(tmp_path, "dump.%s.xlsx" % language))
+    with open(os.path.join(tmp_path, "dump.en.csv"), "r") as source:
+        output = source.read()
+    dump_basic_validation(output, EN_NAME)
+    data_translation_validation(output)
+
+    # Dates and times are formatted for each kind of output.
+    workbook = load_workbook(os.path.join(tmp_path, "dump.en.xlsx"))
+    assert isinstance(workbook["t_results"]["B2"].value, datetime.datetime)
+    assert re.search(r"\n\d+,\d{4}-\d\d-\d\d,", output)
+
+
+def test_dump_formats_one_command(db, capsys):
+    """Only exports may be written in several formats."""
+    args = [PROC_NAME, db, "join-insulin", "-f", "excel,csv", "join"]
+    with pytest.raises(SystemExit) as ee:
+        main(args)
+    assert ee.value.code == 2
+    assert "Only one format" in capsys.readouterr().err
+
+
+def test_dump_bad_format(db, capsys):
+    """Formats must be known."""
+    args = [PROC_NAME, db, "dump-db", "-f", "csv,pdf", "dump"]
+    with pytest.raises(SystemExit) as ee:
+        main(args)
+    assert ee.value.code == 2
+    assert (
+        "invalid choice: 'pdf' (choose from csv, excel, ndjson)"
+        in capsys.readouterr().err
+    )
+
+
+def test_dump_split(db, tmp_path, capsys):
+    """Dump each table to its own CSV file in a directory, for each language."""
+    output = os.path.join(tmp_path, "dump")
+    args = [PROC_NAME, "-x", "en,it", db, "dump-db", "-s", "-j", "2", "-f", "csv"]
+    assert main(args + [output]) == 0
+
+    for language, name in (("en", EN_NAME), ("it", NAME)):
+        directory = os.path.join(tmp_path, "dump.%s" % language)
+        assert sorted(os.listdir(directory)) == sorted(
+            table[name] + ".csv" for table in DATABASE[TABLES]
+        )
+        for table in DATABASE[TABLES]:
+            with open(os.path.join(directory, table[name] + ".csv"), "r") as source:
+                lines = source.read().splitlines()
+            # The file holds the column names and rows, with no title.
+            assert len(lines) == 1 + len(table.get(DATA, []))
+    with open(os.path.join(tmp_path, "dump.en", "t_results.csv"), "r") as source:
+        data_translation_validation(source.read())
+
+
+def test_dump_split_zip(db, tmp_path, capsys):
+    """Dump each table to its own CSV file in a zip archive."""
+    output = os.path.join(tmp_path, "dump.zip")
+    args = [PROC_NAME, db, "dump-db", "--split", "-f", "csv", output]
+    assert main(args) == 0
+
+    with zipfile.ZipFile(output) as archive:
+        assert sorted(archive.namelist()) == sorted(
+            table[NAME] + ".csv" for table in DATABASE[TABLES]
+        )
+        results = archive.read("t_risultati.csv").decode()
+    assert results.startswith("_id,")
+    assert results.count("\n") == 7
+
+
+def test_dump_split_excel(db, capsys):
+    """Only CSV can be split into a file per table."""
+    args = [PROC_NAME, db, "dump-db", "--split", "-f", "excel", "dump.zip"]
+    with pytest.raises(SystemExit) as ee:
+        main(args)
+    assert ee.value.code == 2
+    assert "Only the 'csv' format" in capsys.readouterr().err
@@ -0,0 +1,196 @@
+"""Test writing Excel spreadsheets without openpyxl."""
+
+import os
+import datetime
+import pytest
+from openpyxl import load_workbook
+from src.glucolog import glucolog
+from src.glucolog.glucolog import (
+    PROC_NAME,
+    XlsxExport,
+    column_letter,
+    day_month_year,
+    excel_serial,
+    hour_minute,
+    main,
+    rollover_title,
+    time_seconds,
+    unix_date_microseconds,
+)
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def _dump(db, tmp_path, engine):
+    """Dump the database to Excel using an engine and load the result."""
+    output = os.path.join(tmp_path, "%s.xlsx" % engine)
+    argv = [PROC_NAME, "--excel-engine", engine, "-x", "en", db, "dump-db"]
+    assert main(argv + ["-f", "excel", output]) == 0
+    return load_workbook(output)
+
+
+def test_native_dump(db, tmp_path):
+    """The native engine writes the same values as openpyxl."""
+    native = _dump(db, tmp_path, "native")
+    expected = _dump(db, tmp_path, "openpyxl")
+    assert native.sheetnames == expected.sheetnames
+
+    for title in expected.sheetnames:
+        native_rows = list(native[title].iter_rows(values_only=True))
+        expected_rows = list(expected[title].iter_rows(values_only=True))
+        assert len(native_rows) == len(expected_rows)
+        for native_row, expected_row in zip(native_rows, expected_rows):
+            for native_value, expected_value in zip(native_row, expected_row):
+                if isinstance(expected_value, datetime.datetime):
+                    # Serial dates are only accurate to within a millisecond.
+                    delta = abs(native_value - expected_value)
+                    assert delta < datetime.timedelta(milliseconds=1)
+                elif isinstance(expected_value, datetime.timedelta):
+                    # openpyxl reads its own times back as durations.
+                    assert (
+                        native_value == (datetime.datetime.min + expected_value).time()
+                    )
+                elif expected_value != "":
+                    assert native_value == expected_value
+
+    results = native["t_results"]
+    assert results["B2"].number_format == "YYYY-MM-DD"
+    assert results.column_dimensions["B"].width == 12
+
+
+def test_native_values(tmp_path):
+    """Write values of each type, escaping text that XML does not allow."""
+    output = os.path.join(tmp_path, "values.xlsx")
+    export_file = XlsxExport(output)
+    worksheet = export_file.worksheet("A & B")
+    export_file.layout(worksheet, "t_nascosto", ["testo"])
+    export_file.columns(worksheet, ["testo", "numero", "giorno", "ora", "vero"])
+    export_file.data(
+        worksheet,
+        [
+            "<1 & 2>\x01",
+            1.5,
+            datetime.date(2021, 3, 4),
+            datetime.time(6, 30),
+            True,
+        ],
+    )
+    export_file.data(worksheet, [None, "", datetime.timedelta(hours=12), None, 7])
+    export_file.data(worksheet, [datetime.datetime(2021, 3, 4, 12), Ellipsis])
+    assert export_file.tell() > 0
+    export_file.close()
+
+    worksheet = load_workbook(output)["A & B"]
+    assert [cell.value for cell in worksheet[2]] == [
+        "<1 & 2>",
+        1.5,
+        datetime.datetime(2021, 3, 4),
+        datetime.time(6, 30),
+        True,
+    ]
+    assert worksheet["A3"].value is None
+    assert worksheet["C3"].value == datetime.time(12, 0)
+    assert worksheet["E3"].value == 7
+    assert worksheet["A4"].value == datetime.datetime(2021, 3, 4, 12)
+    assert worksheet["B4"].value == "Ellipsis"
+
+
+def test_native_empty(tmp_path):
+    """A spreadsheet with nothing written still has a worksheet."""
+    output = os.path.join(tmp_path, "empty.xlsx")
+    XlsxExport(output).close()
+    assert load_workbook(output).sheetnames == ["Sheet"]
+
+
+def test_column_letter():
+    """Columns are lettered A to Z, then AA onwards."""
+    assert [column_letter(column) for column in (1, 26, 27, 52, 703)] == [
+        "A",
+        "Z",
+        "AA",
+        "AZ",
+        "AAA",
+    ]
+
+
+def test_native_many_rows(tmp_path):
+    """Rows are streamed to the spreadsheet in blocks."""
+    output = os.path.join(tmp_path, "many.xlsx")
+    export_file = XlsxExport(output)
+    worksheet = export_file.worksheet("many")
+    for row in range(2500):
+        export_file.data(worksheet, [row, "row %d" % row])
+    export_file.close()
+
+    worksheet = load_workbook(output, read_only=True)["many"]
+    rows = list(worksheet.iter_rows(values_only=True))
+    assert len(rows) == 2500
+    assert rows[-1] == (2499, "row 2499")
+
+
+def test_excel_serials():
+    """Dates and times for Excel are serial numbers of days."""
+    assert excel_serial((datetime.date(1900, 1, 1) - EPOCH).days) == 1
+    assert excel_serial((datetime.date(1900, 3, 1) - EPOCH).days) == 61
+    assert day_month_year(True, "04-07-2007") == 39267
+    assert hour_minute(True, "18:00") == 0.75
+    assert time_seconds(True, 6 * 60 * 60 * 1000) == 0.25
+    serial = unix_date_microseconds(True, 1619611200000)
+    assert 44313 <= serial < 44315
+
+
+@pytest.mark.parametrize("engine", ["native", "openpyxl"])
+def test_rollover(db, tmp_path, monkeypatch, engine):
+    """Tables too long for one worksheet continue on further worksheets."""
+    monkeypatch.setattr(glucolog, "EXCEL_MAX_ROWS", 4)
+    workbook = _dump(db, tmp_path, engine)
+    assert workbook.sheetnames.index("t_results (2)") == (
+        workbook.sheetnames.index("t_results") + 1
+    )
+    first = list(workbook["t_results"].iter_rows(values_only=True))
+    second = list(workbook["t_results (2)"].iter_rows(values_only=True))
+    assert len(first) == 4
+    assert len(second) == 4
+    assert second[0] == first[0]
+    assert workbook["t_results (2)"]["B2"].number_format == "YYYY-MM-DD"
+    assert workbook["t_results (2)"].column_dimensions["B"].width == 12
+
+
+def test_rollover_title():
+    """Continuation worksheet titles stay within the title length limit."""
+    assert rollover_title("t_results", 2) == "t_results (2)"
+    assert rollover_title("x" * 31, 12) == "x" * 26 + " (12)"
+
+
+@pytest.mark.parametrize("engine", ["native", "openpyxl"])
+def test_sheet_titles(tmp_path, monkeypatch, engine):
+    """Worksheet titles are made valid and unique, as Excel requires."""
+    monkeypatch.setattr(glucolog, "EXCEL_MAX_ROWS", 1)
+    output = os.path.join(tmp_path, "titles.xlsx")
+    export_file = glucolog.EXCEL_EXPORTERS[engine](output)
+    for title in ["a/b:c", "x" * 40, "Dup", "dup", "d" * 31]:
+        worksheet = export_file.worksheet(title)
+        export_file.data(worksheet, [title])
+    export_file.data(worksheet, ["more"])
+    export_file.close()
+
+    assert load_workbook(output).sheetnames == [
+        "a_b_c",
+        "x" * 31,
+        "Dup",
+        "dup1",
+        "d" * 31,
+        "d" * 27 + " (2)",
+    ]
+
+
+def test_native_non_finite(tmp_path):
+    """Infinities and NaNs, which Excel does not have, are left empty."""
+    output = os.path.join(tmp_path, "non_finite.xlsx")
+    export_file = XlsxExport(output)
+    worksheet = export_file.worksheet("floats")
+    export_file.data(worksheet, [1.5, float("nan"), float("inf"), -float("inf"), 2])
+    export_file.close()
+
+    worksheet = load_workbook(output)["floats"]
+    assert [cell.value for cell in worksheet[1]] == [1.5, None, None, None, 2]
@@ -1,5 +1,12 @@
 """Test the 'export' command."""
+import os
 import re
+import datetime
+import json
+import pytest
+import sqlite3
+from openpyxl import load_workbook
+from csv import reader
 from typing import Dict
 from mock_database import (
     DATABASE,
@@ -12,6 +19,11 @@ from mock_database import (
 from src.glucolog.glucolog import (
     PROC_NAME,
     main,
+    export_partition,
+    format_partition,
+    row_partitions,
+    date_milliseconds,
+    unix_date_microseconds,
     CSV_SEPARATOR,
 )
 from conftest import data_translation_validation
@@ -178,3 +190,405 @@ def test_export_translated(db, csv, capsys):
 
     export_basic_validation(output, DATABASE[TABLES][2], DB_EN_TABLES[2])
     data_translation_validation(output)
+
+
+def test_export_periods(db, csv, capsys):
+    """Perform an export with the computed period of the day."""
+    assert DB_TABLES[2] == "t_risultati"
+    args = [
+        PROC_NAME,
+        db,
+        "export-table",
+        "--table",
+        DB_TABLES[2],
+        "--periods",
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+
+    # Table name, then columns, then data.
+    assert rows[1][-1] == "periodo_calcolato"
+    periodo = rows[1].index("periodo")
+    for row in rows[2:]:
+        # The computed period should match that recorded by the meter, except for
+        # our made-up "mezzanotte" reading.
+        if row[periodo] != "mezzanotte":
+            assert row[-1] == row[periodo]
+        else:
+            assert row[-1] == "notte"
+
+
+def test_export_periods_translated(db, csv, capsys):
+    """Perform an export with a translated computed period of the day."""
+    args = [
+        PROC_NAME,
+        "--xlat",
+        "en",
+        db,
+        "export-table",
+        "--table",
+        DB_EN_TABLES[2],
+        "--periods",
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+
+    assert rows[1][-1] == "calculated_period"
+    assert rows[2][-1] == "morning"
+
+
+def test_export_periods_no_time(db, csv, capsys):
+    """Request the computed period of the day without the time of the reading."""
+    assert DB_TABLES[2] == "t_risultati"
+    columns = ",".join(DATABASE[TABLES][2][COLUMNS][5:9])
+    args = [
+        PROC_NAME,
+        db,
+        "export-table",
+        "--table",
+        DB_TABLES[2],
+        "--columns",
+        columns,
+        "--periods",
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    captured = capsys.readouterr()
+    assert "Column 'ora' is required to compute 'periodo_calcolato'." in captured.err
+    with open(csv, "r") as source:
+        output = source.read()
+    export_basic_validation(output, DATABASE[TABLES][2], DB_TABLES[2])
+
+
+def test_export_periods_unused(db, csv, capsys):
+    """Compute the period of the day when custom periods are unused."""
+    con = sqlite3.connect(db)
+    con.execute("UPDATE t_parametri SET periodocustoms1 = '', periodocustoms2 = NULL")
+    con.commit()
+    con.close()
+
+    args = [
+        PROC_NAME,
+        db,
+        "export-table",
+        "--table",
+        DB_TABLES[2],
+        "--periods",
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+
+    assert rows[2][-1] == "mattino"
+
+
+def test_export_periods_custom(db, csv, capsys):
+    """Custom periods are used unless unset or starting with another period."""
+    # Readings at 03:00 and 06:05; custom periods are unset ("01:00") in the mock.
+    con = sqlite3.connect(db)
+    con.execute(
+        "INSERT INTO t_risultati (_id, data, ora, periodo) "
+        "VALUES (23, 1620129600000, 10800000, 'digiuno')"
+    )
+    con.commit()
+
+    def periods():
+        main(
+            [PROC_NAME, db, "export-table", "-t", DB_TABLES[2], "-p", "-f", "csv", csv]
+        )
+        with open(csv, "r", newline="") as source:
+            rows = list(reader(source))
+        periodo = rows[1].index("periodo")
+        return {row[0]: (row[periodo], row[-1]) for row in rows[2:]}
+
+    computed = periods()
+    assert computed["23"] == ("digiuno", "digiuno")
+    assert computed["17"] == ("mattino", "mattino")
+
+    # A custom period at the same time as another period does not replace it.
+    con.execute(
+        "UPDATE t_parametri SET periodocustoms1 = '02:30', periodocustoms2 = '06:00'"
+    )
+    con.commit()
+    con.close()
+    computed = periods()
+    assert computed["23"][-1] == "periodocustoms1"
+    assert computed["17"][-1] == "mattino"
+
+
+def test_export_periods_unconfigured(db, csv, capsys):
+    """Compute the period of the day when there are no period boundaries."""
+    con = sqlite3.connect(db)
+    con.execute("DROP TABLE t_parametri")
+    con.commit()
+    con.close()
+
+    args = [
+        PROC_NAME,
+        db,
+        "export-table",
+        "--table",
+        DB_TABLES[2],
+        "--periods",
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    captured = capsys.readouterr()
+    assert "Unable to read period boundaries" in captured.err
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+
+    assert rows[1][-1] == "periodo_calcolato"
+    for row in rows[2:]:
+        assert row[-1] == ""
+
+
+def _export_results(db, csv, units):
+    """Export the results table converting glycaemia units."""
+    args = [
+        PROC_NAME,
+        db,
+        "export-table",
+        "--table",
+        DB_TABLES[2],
+        "--units",
+        units,
+        "--format",
+        "csv",
+        csv,
+    ]
+    main(args)
+
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+
+    risultato = rows[1].index("risultato")
+    return [row[risultato] for row in rows[2:]]
+
+
+def test_export_units_mg_dl(db, csv, capsys):
+    """Convert results from mmol/L to mg/dL."""
+    results = _export_results(db, csv, "mg/dl")
+    assert results == ["153", "164", "132", "182", "157", "155"]
+
+
+def test_export_units_mmol_l(db, csv, capsys):
+    """Convert results from mg/dL to mmol/L."""
+    con = sqlite3.connect(db)
+    con.execute("UPDATE t_parametri SET um_glicemia = 1")
+    con.execute("UPDATE t_risultati SET risultato = ROUND(risultato * 18.0182)")
+    con.execute("UPDATE t_risultati SET risultato = '' WHERE periodo = 'mezzanotte'")
+    con.commit()
+    con.close()
+
+    results = _export_results(db, csv, "mmol/l")
+    assert results == ["8.5", "9.1", "7.3", "10.1", "8.7", ""]
+
+
+def test_export_units_unchanged(db, csv, capsys):
+    """Request the units that the results are already in."""
+    results = _export_results(db, csv, "mmol/l")
+    assert results == ["8.5", "9.1", "7.3", "10.1", "8.7", "8.6"]
+
+
+def test_export_units_unknown(db, csv, capsys):
+    """Request unit conversion when the meter's units are not known."""
+    con = sqlite3.connect(db)
+    con.execute("DROP TABLE t_parametri")
+    con.commit()
+    con.close()
+
+    results = _export_results(db, csv, "mg/dl")
+    assert results == ["8.5", "9.1", "7.3", "10.1", "8.7", "8.6"]
+    captured = capsys.readouterr()
+    assert "Unable to read glycaemia units" in captured.err
+    assert "results are not converted" in captured.err
+
+
+def test_export_languages(db, tmp_path, capsys):
+    """Export a table in two languages, naming it in the first of them."""
+    output = os.path.join(tmp_path, "results.xlsx")
+    argv = [
+        PROC_NAME,
+        "-x",
+        "it,en",
+        db,
+        "export-table",
+        "-t",
+        "t_risultati",
+        "-c",
+        "data,periodo",
+        "-f",
+        "excel",
+        output,
+    ]
+    assert main(argv) == 0
+    it_workbook = load_workbook(os.path.join(tmp_path, "results.it.xlsx"))
+    assert it_workbook.sheetnames == ["t_risultati"]
+    en_workbook = load_workbook(os.path.join(tmp_path, "results.en.xlsx"))
+    assert en_workbook.sheetnames == ["t_results"]
+    assert [cell.value for cell in en_workbook["t_results"][1]] == ["date", "period"]
+
+
+def _export_jobs(db, tmp_path, name, table, jobs):
+    """Export a table to CSV and NDJSON, in two languages, using several jobs."""
+    output = os.path.join(tmp_path, name)
+    argv = [PROC_NAME, "-x", "en,it", db, "export-table", "-t", table]
+    argv += ["-p", "-f", "csv,ndjson", "-j", str(jobs), output]
+    assert main(argv) == 0
+    outputs = {}
+    for suffix in ("en.csv", "en.ndjson", "it.csv", "it.ndjson"):
+        with open("%s.%s" % (output, suffix), "r", newline="") as source:
+            outputs[suffix] = source.read()
+    return outputs
+
+
+def test_export_jobs(db, tmp_path, capsys):
+    """Export ranges of a table in parallel, appending them in order."""
+    expected = _export_jobs(db, tmp_path, "serial", "t_results", 1)
+    assert _export_jobs(db, tmp_path, "parallel", "t_results", 4) == expected
+    assert os.listdir(tmp_path).count("parallel.en.csv") == 1
+
+    lines = expected["en.ndjson"].splitlines()
+    assert json.loads(lines[0]) == {"table": "t_results"}
+    assert len(lines) == 7
+    row = json.loads(lines[1])
+    assert row["_id"] == 17
+    assert row["period"] == "morning"
+    assert row["calculated_period"] == "morning"
+
+
+@pytest.mark.parametrize("without_rowid", [False, True])
+def test_export_jobs_unpartitioned(db, tmp_path, capsys, without_rowid):
+    """Empty tables, and tables without rowids, are exported by a single job."""
+    if without_rowid:
+        with sqlite3.connect(db) as con:
+            con.execute("DROP TABLE t_insulina")
+            con.execute("CREATE TABLE t_insulina (_id PRIMARY KEY) WITHOUT ROWID")
+    expected = _export_jobs(db, tmp_path, "serial", "t_insulin", 1)
+    assert _export_jobs(db, tmp_path, "parallel", "t_insulin", 2) == expected
+    if without_rowid:
+        assert "Unable to partition 't_insulina'" in capsys.readouterr().err
+
+
+def test_export_partition(db, tmp_path):
+    """Export a range of rows to chunk files, as a worker process does."""
+    chunk = os.path.join(tmp_path, "chunk.csv")
+    partition = {
+        "database": db,
+        "periods": False,
+        "units": None,
+        "table": "t_risultati",
+        "columns": ["_id", "periodo"],
+        "range": (2, 4),
+        "chunks": [("en", "csv", chunk)],
+    }
+    result = export_partition(partition)
+    assert result["counts"]["t_risultati"]["rows_written"] == 2
+    with open(chunk, "r", newline="") as source:
+        source.seek(result["starts"][0])
+        assert source.read() == "18,early_afternoon\r\n19,late_afternoon\r\n"
+
+
+def test_export_jobs_excel(db, tmp_path, capsys):
+    """Rows for spreadsheets are reformatted by workers and written by one process."""
+    argv = [PROC_NAME, "-x", "en", db, "export-table", "-t", "t_results", "-p"]
+    argv += ["-f", "csv,excel"]
+    serial = os.path.join(tmp_path, "serial")
+    parallel = os.path.join(tmp_path, "parallel")
+    assert main(argv + [serial]) == 0
+    assert main(argv + ["-j", "2", parallel]) == 0
+
+    with open(serial + ".csv", "r") as source:
+        expected = source.read()
+    with open(parallel + ".csv", "r") as source:
+        assert source.read() == expected
+    expected = load_workbook(serial + ".xlsx")["t_results"]
+    worksheet = load_workbook(parallel + ".xlsx")["t_results"]
+    assert list(worksheet.values) == list(expected.values)
+    assert worksheet["B2"].number_format == "YYYY-MM-DD"
+
+
+def test_format_partition(db):
+    """Read and reformat a range of rows, as a worker does."""
+    partition = {
+        "database": db,
+        "periods": False,
+        "units": None,
+        "excel_flags": [False, True],
+        "table": "t_risultati",
+        "columns": ["_id", "data", "periodo"],
+        "range": (2, 4),
+    }
+    result = format_partition(partition)
+    assert result["counts"]["t_risultati"]["rows_read"] == 2
+    (batches,) = result["batches"]
+    rows = batches[False]
+    assert [(row[0], row[2]) for row in rows] == [
+        (18, "primo_pomeriggio"),
+        (19, "tardo_pomeriggio"),
+    ]
+    assert isinstance(rows[0][1], str)
+    excel_rows = batches[True]
+    assert [row[0] for row in excel_rows] == [18, 19]
+    assert isinstance(excel_rows[0][1], float)
+
+
+def test_row_partitions_size(db):
+    """A table is split into more ranges than jobs if the ranges would be too big."""
+    with sqlite3.connect(db) as con:
+        cur = con.cursor()
+        assert row_partitions(cur, "t_risultati", 2) == [(1, 4), (4, 7)]
+        assert row_partitions(cur, "t_risultati", 2, 2) == [(1, 3), (3, 5), (5, 7)]
+        assert row_partitions(cur, "t_risultati", 4, 6) == [
+            (1, 2),
+            (2, 4),
+            (4, 5),
+            (5, 7),
+        ]
+    con.close()
+
+
+def test_export_times_in_timezone(db, csv, timezone):
+    """Times of day are exported as recorded, whatever the time zone."""
+    argv = [PROC_NAME, db, "export-table", "-t", "t_risultati", "-c", "_id,ora"]
+    assert main(argv + ["-f", "csv", csv]) == 0
+    with open(csv, "r") as source:
+        rows = list(reader(source))
+    assert rows[2] == ["17", "06:05"]
+
+
+def test_export_dates_in_timezone(db, csv, timezone):
+    """Dates are exported, and selected, in UTC whatever the time zone."""
+    late = date_milliseconds(datetime.date(2021, 5, 10)) + 23 * 60 * 60 * 1000
+    con = sqlite3.connect(db)
+    con.execute("UPDATE t_risultati SET data = ? WHERE _id = 17", (late,))
+    con.commit()
+    con.close()
+
+    argv = [PROC_NAME, db, "export-table", "-t", "t_risultati", "-c", "_id,data"]
+    assert main(argv + ["-f", "csv", csv]) == 0
+    with open(csv, "r") as source:
+        rows = list(reader(source))
+    assert rows[2] == ["17", "2021-05-10"]
+    assert unix_date_microseconds(True, late) == pytest.approx(44326 + 23 / 24)
@@ -0,0 +1,96 @@
+"""Test the 'join-insulin' command."""
+import sqlite3
+from csv import reader
+from src.glucolog.glucolog import (
+    PROC_NAME,
+    main,
+    merge_asof,
+)
+
+# Insulin doses, recorded in the results table, as (_id, data, ora, insulina, dose).
+DOSES = [
+    # 05:50 on the day of the first reading, 15 minutes before it.
+    (30, 1619611200000, 21000000, 1, 4),
+    # 12:00 on the day of the second reading, 7 minutes before it.
+    (31, 1619697600000, 43200000, 2, 6),
+]
+
+
+def add_doses(db):
+    """Add insulin doses to the mock database."""
+    con = sqlite3.connect(db)
+    con.execute("INSERT INTO t_insulina VALUES (1, '', 'Humalog')")
+    for dose in DOSES:
+        con.execute(
+            "INSERT INTO t_risultati (_id, data, ora, risultato, insulina, dose) "
+            "VALUES (?, ?, ?, '', ?, ?)",
+            dose,
+        )
+    con.commit()
+    con.close()
+
+
+def join_insulin(db, csv, *options):
+    """Run the join and return the rows written."""
+    argv = [PROC_NAME, db, "join-insulin", *options, "--format", "csv", csv]
+    assert main(argv) == 0
+
+    with open(csv, "r", newline="") as source:
+        return list(reader(source))
+
+
+def test_merge_asof():
+    """Pair rows with the nearest preceding row within the tolerance."""
+    left = [1, 5, 7, 20, 21]
+    right = [0, 4, 5, 15]
+    pairs = list(merge_asof(left, right, lambda x: x, 3))
+    assert pairs == [(1, 0), (5, 5), (7, 5), (20, None), (21, None)]
+    assert list(merge_asof(left, [], lambda x: x, 3))[0] == (1, None)
+
+
+def test_join_minimal(db, csv, capsys):
+    """Join readings with the preceding insulin dose."""
+    add_doses(db)
+    rows = join_insulin(db, csv)
+
+    assert rows[0] == ["t_risultati_insulina"]
+    assert rows[1][4:] == ["data_dose", "ora_dose", "insulina", "dose"]
+    # Only readings with a result are included, not the doses themselves.
+    assert len(rows) == 2 + 6
+    assert rows[2][2:] == ["mattino", "8.5", "2021-04-28", "05:50", "Humalog", "4"]
+    assert rows[3][2:] == ["primo_pomeriggio", "9.1", "2021-04-29", "12:00", "2", "6"]
+    for row in rows[4:]:
+        assert row[4:] == ["", "", "", ""]
+
+
+def test_join_window(db, csv, capsys):
+    """Join readings with insulin doses in a narrow window."""
+    add_doses(db)
+    rows = join_insulin(db, csv, "--window", "10")
+
+    assert rows[2][4:] == ["", "", "", ""]
+    assert rows[3][4:] == ["2021-04-29", "12:00", "2", "6"]
+
+
+def test_join_translated(db, csv, capsys):
+    """Join readings with insulin doses and translate the output."""
+    argv = [PROC_NAME, "--xlat", "en", db, "join-insulin", "--format", "csv", csv]
+    main(argv)
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+    assert rows[0] == ["t_results_insulin"]
+    assert rows[1][4:6] == ["dose_date", "dose_time"]
+    assert rows[2][2] == "morning"
+
+
+def test_join_no_insulins(db, excel, capsys):
+    """Join readings when there is no table of insulins."""
+    con = sqlite3.connect(db)
+    con.execute("DROP TABLE t_insulina")
+    con.commit()
+    con.close()
+
+    argv = [PROC_NAME, db, "join-insulin", "--format", "excel", excel]
+    assert main(argv) == 0
+    captured = capsys.readouterr()
+    assert "Unable to read insulin descriptions" in captured.err
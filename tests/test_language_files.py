@@ -1,4 +1,9 @@
 """Test (validate) language files."""
+
+import os
+import json
+import pytest
+from src.glucolog import glucolog
 from src.glucolog.glucolog import list_languages, read_language_file
 
 
@@ -30,3 +35,80 @@ def test_language_files():
     for ot in languages:
         ot_to, _ot_from = read_language_file(ot)
         _compare_dicts("it", it_to, ot, ot_to)
+
+
+def _no_compile(filename):
+    """Fail if a language file is compiled rather than read from the cache."""
+    raise AssertionError("'%s' should not have been compiled" % filename)
+
+
+def test_language_cache(cache, monkeypatch):
+    """Compile a language file once and then read it from the cache."""
+    xlat_to, xlat_from = read_language_file("en")
+    cache_file = os.path.join(cache, "lang_en.v1.json")
+    assert os.path.exists(cache_file)
+
+    monkeypatch.setattr(glucolog, "compile_language_file", _no_compile)
+    assert read_language_file("en") == (xlat_to, xlat_from)
+
+    # A language file that has only been touched is recognised by its hash.
+    with open(cache_file) as source:
+        compiled = json.load(source)
+    compiled["mtime"] = 0
+    with open(cache_file, "w") as target:
+        json.dump(compiled, target)
+    assert read_language_file("en") == (xlat_to, xlat_from)
+    with open(cache_file) as source:
+        assert json.load(source)["mtime"] != 0
+
+
+def test_language_cache_stale(cache, monkeypatch):
+    """Recompile a language file whose cache is out of date or corrupt."""
+    xlat_to, xlat_from = read_language_file("it")
+    cache_file = os.path.join(cache, "lang_it.v1.json")
+    with open(cache_file, "w") as target:
+        json.dump({"size": 0, "mtime": 0, "sha256": "", "to": {}, "from": {}}, target)
+    assert read_language_file("it") == (xlat_to, xlat_from)
+
+    with open(cache_file, "w") as target:
+        target.write("{")
+    assert read_language_file("it") == (xlat_to, xlat_from)
+
+
+def test_language_cache_unwritable(cache, caplog):
+    """Translations are still returned if they cannot be cached."""
+    os.makedirs(os.path.join(cache, "lang_en.v1.json.%d.tmp" % os.getpid()))
+    xlat_to, _xlat_from = read_language_file("en")
+    assert xlat_to["tables"]["t_risultati"] == "t_results"
+    assert "Unable to write compiled language file" in caplog.text
+
+
+def test_language_cache_no_directory(cache, monkeypatch, caplog):
+    """Translations are still returned if the cache directory cannot be created."""
+    with open(cache, "w"):
+        pass
+    monkeypatch.setenv("GLUCOLOG_CACHE", os.path.join(cache, "nope"))
+    xlat_to, _xlat_from = read_language_file("en")
+    assert xlat_to["tables"]["t_risultati"] == "t_results"
+    assert "Unable to use cache directory" in caplog.text
+
+
+def test_translator():
+    """Translate a header and rows using a plan made once for the table."""
+    translator = glucolog.Translator("en")
+    columns = ["data", "periodo", "risultato"]
+    assert translator.columns(columns) == ["date", "period", "result"]
+
+    plan = translator.row_plan("t_risultati", columns)
+    assert plan == ((1, "periodo"),)
+    assert translator.rows("t_risultati", plan, [(1, "sera", 8.5), (2, "", 9.1)]) == [
+        (1, "evening", 8.5),
+        (2, "", 9.1),
+    ]
+    with pytest.raises(TypeError):
+        translator.to_data["sera"] = "night"
+
+    # Without a language there is nothing to plan, or translate.
+    untranslated = glucolog.Translator()
+    assert untranslated.row_plan("t_risultati", columns) == ()
+    assert untranslated.columns(columns) == columns
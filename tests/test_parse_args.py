@@ -71,8 +71,8 @@ def test_pa_tables_minimal(capsys):
     assert args.cmd == "list-tables"
     assert "format" not in args
     assert args.xlat is None
-    assert args.xlat_to == {}
-    assert args.xlat_from == {}
+    assert args.translator.language is None
+    assert not args.translator.to_columns
 
 
 def test_pa_tables_short(capsys):
@@ -98,8 +98,8 @@ def test_pa_tables_short(capsys):
     assert args.cmd == "list-tables"
     assert "format" not in args
     assert args.xlat == "it"
-    assert "columns" in args.xlat_to
-    assert "data" in args.xlat_from
+    assert "t_risultati" in args.translator.to_tables
+    assert "risultato" in args.translator.from_columns
 
 
 def test_pa_tables_long(capsys):
@@ -126,8 +126,20 @@ def test_pa_tables_long(capsys):
     assert args.cmd == "list-tables"
     assert "format" not in args
     assert args.xlat == "en"
-    assert "tables" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert args.translator.to_tables["t_risultati"] == "t_results"
+    assert args.translator.from_columns["result"] == "risultato"
+
+
+def test_pa_unknown_language(capsys):
+    """Test a language for which there is no language file."""
+    with pytest.raises(SystemExit) as ee:
+        parse_args([PROC_NAME, "-x", "fr", "database.dat", "list-tables"])
+    assert ee.type == SystemExit
+    assert ee.value.code == 2
+
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "invalid choice: 'fr' (choose from en, it, or all)" in captured.err
 
 
 def test_pa_columns_missing_table(capsys):
@@ -156,8 +168,8 @@ def test_pa_columns_minimal(capsys):
     assert args.table == "t_something"
     assert "format" not in args
     assert args.xlat is None
-    assert args.xlat_to == {}
-    assert args.xlat_from == {}
+    assert args.translator.language is None
+    assert not args.translator.to_columns
 
 
 def test_pa_columns_short(capsys):
@@ -186,8 +198,8 @@ def test_pa_columns_short(capsys):
     assert args.table == "t_something"
     assert "format" not in args
     assert args.xlat == "en"
-    assert "tables" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert args.translator.to_tables["t_risultati"] == "t_results"
+    assert args.translator.from_columns["result"] == "risultato"
 
 
 def test_pa_columns_long(capsys):
@@ -217,8 +229,8 @@ def test_pa_columns_long(capsys):
     assert args.table == "t_something"
     assert "format" not in args
     assert args.xlat == "it"
-    assert "data" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert "sera" in args.translator.to_data
+    assert "risultato" in args.translator.from_columns.values()
 
 
 def test_pa_export_missing_table(capsys):
@@ -373,8 +385,8 @@ def test_pa_export_short(capsys):
     assert args.columns == ["c_firstName"]
     assert args.format == "excel"
     assert args.xlat == "en"
-    assert "tables" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert args.translator.to_tables["t_risultati"] == "t_results"
+    assert args.translator.from_columns["result"] == "risultato"
     assert args.output == "output.xlsx"
 
 
@@ -411,8 +423,8 @@ def test_pa_export_long(capsys):
     assert args.columns == ["c_firstName", "c_middleName", "c_lastName"]
     assert args.format == "csv"
     assert args.xlat == "it"
-    assert "data" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert "sera" in args.translator.to_data
+    assert "risultato" in args.translator.from_columns.values()
     assert args.output == "output.csv"
 
 
@@ -482,8 +494,8 @@ def test_pa_dump_short(capsys):
     assert args.cmd == "dump-db"
     assert args.format == "excel"
     assert args.xlat == "en"
-    assert "tables" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert args.translator.to_tables["t_risultati"] == "t_results"
+    assert args.translator.from_columns["result"] == "risultato"
     assert args.output == "output.xlsx"
 
 
@@ -514,6 +526,6 @@ def test_pa_dump_long(capsys):
     assert args.cmd == "dump-db"
     assert args.format == "csv"
     assert args.xlat == "it"
-    assert "data" in args.xlat_to
-    assert "columns" in args.xlat_from
+    assert "sera" in args.translator.to_data
+    assert "risultato" in args.translator.from_columns.values()
     assert args.output == "output.csv"
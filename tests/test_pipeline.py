@@ -0,0 +1,53 @@
+"""Test pipelined exports, which read, reformat and write in separate threads."""
+import os
+import time
+import pytest
+from src.glucolog import glucolog
+from src.glucolog.glucolog import PROC_NAME, main, pipelined
+
+
+def _read(filename):
+    """Read an output file."""
+    with open(filename, "r", newline="") as source:
+        return source.read()
+
+
+@pytest.mark.parametrize("command", ["export-table", "dump-db"])
+def test_pipeline(db, tmp_path, capsys, command):
+    """Pipelined exports write the same output as unpipelined ones."""
+    argv = [PROC_NAME, "-x", "en", db, command, "-p", "-f", "csv,excel"]
+    if command == "export-table":
+        argv += ["-t", "t_results"]
+    serial = os.path.join(tmp_path, "serial")
+    pipeline = os.path.join(tmp_path, "pipeline")
+    assert main(argv + [serial]) == 0
+    assert main(argv + ["--pipeline", pipeline]) == 0
+    assert _read(pipeline + ".csv") == _read(serial + ".csv")
+    assert "calculated_period" in _read(pipeline + ".csv")
+
+
+def test_pipeline_bad_column(db, csv, capsys):
+    """Errors in the reader thread end the command."""
+    argv = [PROC_NAME, db, "export-table", "-t", "t_risultati", "-c", "_id,nessuna"]
+    assert main(argv + ["--pipeline", "-f", "csv", csv]) == 2
+    assert "One or more columns are not recognised." in capsys.readouterr().err
+
+
+def test_pipeline_stopped(monkeypatch):
+    """The thread stops, closing its generator, when no more batches are wanted."""
+    monkeypatch.setattr(glucolog, "PIPELINE_DEPTH", 1)
+    monkeypatch.setattr(glucolog, "PIPELINE_POLL", 0.01)
+    closed = []
+
+    def generate():
+        try:
+            yield from range(100)
+        finally:
+            closed.append(True)
+
+    batches = pipelined(generate())
+    assert next(batches) == 0
+    # Give the thread time to fill the queue and wait for room in it.
+    time.sleep(0.1)
+    batches.close()
+    assert closed == [True]
@@ -0,0 +1,29 @@
+"""Test profiling of commands."""
+
+import os
+import pstats
+from src.glucolog.glucolog import PROC_NAME, main
+
+
+def test_profile_dump(db, csv, tmp_path, capsys):
+    """Profile a dump of the database."""
+    profile = os.path.join(tmp_path, "dump.prof")
+    argv = [PROC_NAME, "-v", "--profile", profile, db, "dump-db", "-f", "csv", csv]
+    assert main(argv) == 0
+
+    stats = pstats.Stats(profile)
+    assert any(function == "do_dump_db" for _, _, function in stats.stats)
+
+    captured = capsys.readouterr()
+    assert "Profile written to" in captured.err
+    for stage in ("query", "format", "translate", "write"):
+        assert "t_risultati: %s took" % stage in captured.err
+    assert "*: close took" in captured.err
+
+
+def test_profile_failure(db, tmp_path, capsys):
+    """Profile a command that fails."""
+    profile = os.path.join(tmp_path, "columns.prof")
+    argv = [PROC_NAME, "--profile", profile, db, "list-columns", "-t", "t_mancante"]
+    assert main(argv) == 2
+    assert os.path.exists(profile)
@@ -0,0 +1,73 @@
+"""Test the machine-readable run report."""
+
+import os
+import json
+from src.glucolog.glucolog import PROC_NAME, main
+
+
+def _report(tmp_path, argv):
+    """Run a command with a report and return the report."""
+    report = os.path.join(tmp_path, "report.json")
+    rc = main(argv[:1] + ["--report", report] + argv[1:])
+    with open(report) as report_file:
+        return rc, json.load(report_file)
+
+
+def test_report_dump(db, csv, tmp_path):
+    """Report on a dump of the database to CSV."""
+    rc, report = _report(tmp_path, [PROC_NAME, db, "dump-db", "-f", "csv", csv])
+    assert rc == 0
+    assert report["command"] == "dump-db"
+    assert report["completed"]
+    assert report["bytes_written"] == os.path.getsize(csv)
+    assert report["peak_memory_bytes"] > 0
+
+    results = report["tables"]["t_risultati"]
+    assert results["rows_read"] == 6
+    assert results["rows_written"] == 6
+    assert 0 < results["bytes_written"] < report["bytes_written"]
+    for seconds in ("query_seconds", "transform_seconds", "write_seconds"):
+        assert results[seconds] >= 0
+    assert report["tables"]["t_insulina"]["rows_written"] == 0
+
+    # Two of the six readings were taken at the same time, so must hit the cache.
+    times = report["converters"]["time_seconds"]
+    assert times["hits"] + times["misses"] >= 6
+    assert times["hits"] > 0
+    assert 0 < times["hit_rate"] <= 1
+
+
+def test_report_export_excel(db, excel, tmp_path):
+    """Report on exporting a table to Excel, whose size is only known at the end."""
+    rc, report = _report(
+        tmp_path,
+        [PROC_NAME, db, "export-table", "-t", "t_risultati", "-f", "excel", excel],
+    )
+    assert rc == 0
+    assert report["format"] == "excel"
+    assert report["bytes_written"] == os.path.getsize(excel)
+    assert list(report["tables"]) == ["t_risultati"]
+    assert report["tables"]["t_risultati"]["bytes_written"] is None
+
+
+def test_report_formats(db, tmp_path):
+    """Rows written in several formats and languages are only counted once."""
+    output = os.path.join(tmp_path, "output")
+    rc, report = _report(
+        tmp_path,
+        [PROC_NAME, "-x", "it,en", db, "dump-db", "-f", "csv,excel", output],
+    )
+    assert rc == 0
+    results = report["tables"]["t_risultati"]
+    assert results["rows_read"] == 6
+    assert results["rows_written"] == 6
+
+
+def test_report_failure(db, tmp_path):
+    """A report is still written when the command fails."""
+    rc, report = _report(tmp_path, [PROC_NAME, db, "list-columns", "-t", "t_mancante"])
+    assert rc == 2
+    assert not report["completed"]
+    assert report["tables"] == {}
+    assert report["output"] is None
+    assert report["converters"]["hour_minute"]["hit_rate"] is None
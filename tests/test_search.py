@@ -0,0 +1,103 @@
+"""Test the 'search' command."""
+
+import os
+import sqlite3
+from csv import reader
+import pytest
+from src.glucolog.glucolog import PROC_NAME, main
+
+# Free text to add to readings, as (_id, evento, commento).
+TEXT = [
+    (17, "sport", "Football training before breakfast"),
+    (19, "", "Forgot to eat lunch"),
+    (22, "party", "Birthday cake"),
+]
+
+
+def add_text(db):
+    """Add free text to readings in the mock database."""
+    con = sqlite3.connect(db)
+    con.executemany(
+        "UPDATE t_risultati SET evento = ?, commento = ? WHERE _id = ?",
+        [(evento, commento, _id) for _id, evento, commento in TEXT],
+    )
+    con.commit()
+    con.close()
+
+
+def search(db, output, query, *options):
+    """Search the database and return the return code."""
+    argv = [PROC_NAME, *options, db, "search", "--format", "csv", query, output]
+    return main(argv)
+
+
+def test_search_minimal(db, csv, cache, capsys):
+    """Search readings for some text."""
+    add_text(db)
+    assert search(db, csv, "football OR cake", "-v") == 0
+
+    with open(csv, "r", newline="") as source:
+        rows = list(reader(source))
+    assert rows[0] == ["t_risultati"]
+    assert len(rows) == 2 + 2
+    assert [row[0] for row in rows[2:]] == ["17", "22"]
+
+    captured = capsys.readouterr()
+    assert "Building search index" in captured.err
+    assert "2 readings in" in captured.err
+    assert len(os.listdir(cache)) == 1
+
+    # The second search should reuse the index.
+    assert search(db, csv, "evento:party", "-v") == 0
+    captured = capsys.readouterr()
+    assert "Using search index" in captured.err
+    assert "1 readings in" in captured.err
+
+    # ...until the database changes.
+    con = sqlite3.connect(db)
+    con.execute("UPDATE t_risultati SET commento = 'lunch' WHERE _id = 18")
+    con.commit()
+    con.close()
+    assert search(db, csv, "lunch", "-v") == 0
+    captured = capsys.readouterr()
+    assert "Building search index" in captured.err
+    assert "2 readings in" in captured.err
+    assert len(os.listdir(cache)) == 2
+
+
+def test_search_translated(db, excel, capsys):
+    """Search readings and translate the output."""
+    add_text(db)
+    argv = [PROC_NAME, "-x", "en", db, "search", "-f", "excel", "lunch", excel]
+    assert main(argv) == 0
+
+
+@pytest.mark.parametrize(
+    "query, reason",
+    [
+        ('"unbalanced', "unterminated string"),
+        ("lunch AND", "syntax error"),
+        ("nessuna:lunch", "no such column: nessuna"),
+    ],
+)
+def test_search_bad_query(db, tmp_path, capsys, query, reason):
+    """Search with a query that is not valid, which writes no output."""
+    output = os.path.join(tmp_path, "output.csv")
+    assert search(db, output, query, "-v") == 2
+    captured = capsys.readouterr()
+    assert "Search '%s' is not valid" % query in captured.err
+    assert reason in captured.err
+    assert not os.path.exists(output)
+
+
+def test_search_no_table(db, tmp_path, cache, capsys):
+    """Search a database without any results."""
+    con = sqlite3.connect(db)
+    con.execute("DROP TABLE t_risultati")
+    con.commit()
+    con.close()
+
+    assert search(db, os.path.join(tmp_path, "output.csv"), "lunch") == 2
+    captured = capsys.readouterr()
+    assert "Unable to build search index" in captured.err
+    assert os.listdir(cache) == []
@@ -0,0 +1,188 @@
+"""Test serving a directory of backups over HTTP."""
+import os
+import json
+import time
+import shutil
+import threading
+import http.server
+import urllib.request
+from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from mock_database import DB_EN_TABLES
+from src.glucolog.glucolog import (
+    PROC_NAME,
+    GlucoLogDatabase,
+    GlucoLogError,
+    main,
+    make_server,
+    parse_args,
+)
+
+
+@pytest.fixture
+def httpd(db, tmp_path):
+    """Serve a directory of backups, keeping one connection open."""
+    dirname = os.path.join(tmp_path, "backups")
+    os.makedirs(os.path.join(dirname, "sub"))
+    shutil.copy(db, os.path.join(dirname, "a.dbglu"))
+    shutil.copy(db, os.path.join(dirname, "sub", "b.dbglu"))
+
+    # ...and a backup which is still being copied.
+    with open(os.path.join(dirname, "partial.dbglu"), "w") as target:
+        target.write("Not yet a database")
+
+    args = parse_args([PROC_NAME, "-x", "en", dirname, "serve", "--port", "0"])
+    args.pool = 1
+    server = make_server(args)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    server.server_close()
+    server.pool.close()
+
+
+@pytest.fixture
+def server(httpd):
+    """Return the URL of the server."""
+    yield "http://%s:%d" % httpd.server_address[:2]
+
+
+def _get(url):
+    """Return the content type and body of a response."""
+    with urllib.request.urlopen(url) as response:
+        return response.headers["Content-Type"], response.read().decode()
+
+
+def _json(url):
+    """Return the JSON body of a response."""
+    return json.loads(_get(url)[1])
+
+
+def test_serve(server):
+    """List backups, tables and columns, and export tables."""
+    assert _json(server + "/backups") == [
+        "a.dbglu",
+        "partial.dbglu",
+        os.path.join("sub", "b.dbglu"),
+    ]
+    assert _json(server + "/tables?backup=a.dbglu") == DB_EN_TABLES
+    columns = _json(server + "/columns?backup=sub/b.dbglu&table=t_results")
+    assert columns[:3] == ["_id", "date", "now"]
+
+    content_type, body = _get(
+        server + "/export.csv?backup=a.dbglu&table=t_results&columns=_id,period"
+    )
+    assert content_type.startswith("text/csv")
+    lines = body.splitlines()
+    assert lines[:2] == ["_id,period", "17,morning"]
+    assert len(lines) == 7
+
+    content_type, body = _get(
+        server + "/export.ndjson?backup=a.dbglu&table=t_results&columns=_id,now"
+        "&periods=1&units=mmol/l"
+    )
+    assert content_type == "application/x-ndjson"
+    rows = [json.loads(line) for line in body.splitlines()]
+    assert rows[0] == {"_id": 17, "now": "06:05", "calculated_period": "morning"}
+
+    stats = _json(server + "/stats")
+    assert stats["requests"] == 6
+    assert stats["rows_written"] == 12
+    assert stats["pool_hits"] == 1
+    assert stats["pool_misses"] == 3
+    assert stats["pool_evictions"] == 2
+    assert stats["idle_connections"] == 1
+
+
+def test_serve_concurrently(server):
+    """Requests are handled at the same time, each with its own connection."""
+    url = server + "/export.csv?backup=a.dbglu&table=t_results"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        bodies = list(executor.map(lambda _: _get(url)[1], range(8)))
+    assert len(set(bodies)) == 1
+    assert _json(server + "/stats")["errors"] == 0
+
+
+@pytest.mark.parametrize(
+    "path, code",
+    [
+        ("/export.csv?backup=a.dbglu&table=t_nessuna", 400),
+        ("/export.csv?backup=a.dbglu&table=t_results&columns=nessuna", 400),
+        ("/tables?backup=../backups/a.dbglu", 400),
+        ("/tables?backup=/etc/passwd", 400),
+        ("/tables", 400),
+        ("/tables?backup=partial.dbglu", 400),
+        ("/export.csv?backup=a.dbglu&table=t_results&units=xx", 400),
+        ("/export.csv?backup=partial.dbglu&table=t_results", 400),
+        ("/export.xlsx?backup=a.dbglu&table=t_results", 404),
+        ("/nessuna", 404),
+    ],
+)
+def test_serve_errors(server, path, code):
+    """Unknown backups, tables, columns and paths are errors."""
+    with pytest.raises(HTTPError) as ee:
+        _get(server + path)
+    assert ee.value.code == code
+    assert _json(server + "/stats")["errors"] == 1
+
+
+def test_serve_command(tmp_path, monkeypatch, capsys):
+    """Serve until interrupted."""
+
+    def interrupt(_server):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(http.server.ThreadingHTTPServer, "serve_forever", interrupt)
+    argv = [PROC_NAME, str(tmp_path), "serve", "--host", "localhost", "--port", "0"]
+    assert main(argv) == 0
+    assert "Stopped serving" in capsys.readouterr().err
+
+
+def test_serve_database(db, capsys):
+    """Only directories of backups can be served."""
+    assert main([PROC_NAME, db, "serve", "--port", "0"]) == 2
+    assert "is not a directory of backups" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize(
+    "table, detail",
+    [
+        ("x%0D%0ASet-Cookie:%20a=b", "Table 'x\r\nSet-Cookie: a=b' is not"),
+        ("%E5%90%8D", "Table '\u540d' is not"),
+        ("%3Cb%3E", "Table '&lt;b&gt;' is not"),
+    ],
+)
+def test_serve_error_reasons(server, table, detail):
+    """Reasons quoting the request are only sent, escaped, in the body."""
+    with pytest.raises(HTTPError) as ee:
+        _get(server + "/export.csv?backup=a.dbglu&table=" + table)
+    assert ee.value.code == 400
+    assert ee.value.reason == "Bad request"
+    assert "Set-Cookie" not in ee.value.headers
+    assert detail in ee.value.read().decode()
+
+
+def test_serve_cut_short(server, monkeypatch):
+    """Errors after a response has started cut it short."""
+
+    def batches(self, *_args, **_kwargs):
+        yield [(17,)]
+        raise GlucoLogError("Database 'a.dbglu' cannot be read")
+
+    monkeypatch.setattr(GlucoLogDatabase, "batches", batches)
+    url = server + "/export.csv?backup=a.dbglu&table=t_results&columns=_id"
+    assert _get(url)[1].splitlines() == ["_id", "17"]
+    assert _json(server + "/stats")["errors"] == 1
+
+
+def test_serve_changed_backup(httpd, server):
+    """Only the schema of the latest version of a backup is kept."""
+    backup = os.path.join(httpd.pool.directory, "a.dbglu")
+    _json(server + "/tables?backup=a.dbglu")
+    later = time.time() + 10
+    os.utime(backup, (later, later))
+    _json(server + "/tables?backup=a.dbglu")
+    assert list(httpd.pool.schemas) == [httpd.pool.key("a.dbglu")]
@@ -0,0 +1,33 @@
+"""Test that the command line tool starts quickly."""
+
+import sys
+import subprocess  # nosec
+
+# Generous, so that a slow CI machine does not fail, but well below the time taken
+# to import openpyxl.
+IMPORT_BUDGET = 0.5
+
+STARTUP = """
+import sys
+import time
+start = time.perf_counter()
+from src.glucolog.glucolog import PROC_NAME, main
+print(time.perf_counter() - start)
+rc = main([PROC_NAME, "-l", sys.argv[2], sys.argv[1], "list-tables"])
+print(rc)
+print(",".join(sorted(m for m in ("csv", "openpyxl", "yaml") if m in sys.modules)))
+"""
+
+
+def test_startup(db, tmp_path):
+    """List tables without importing modules that only exports need."""
+    output = subprocess.run(  # nosec
+        [sys.executable, "-c", STARTUP, db, str(tmp_path / "startup.log")],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.splitlines()
+
+    assert float(output[0]) < IMPORT_BUDGET
+    assert output[-2] == "0"
+    assert output[-1] == ""
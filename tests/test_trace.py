@@ -0,0 +1,111 @@
+"""Test tracing of commands as Chrome trace events."""
+import os
+import json
+import shutil
+import threading
+from src.glucolog import glucolog
+from src.glucolog.glucolog import PROC_NAME, Tracer, entry_exit, main
+
+
+def _trace(tmp_path, argv):
+    """Run a command with tracing and return the trace events."""
+    trace = os.path.join(tmp_path, "trace.json")
+    rc = main(argv[:1] + ["--trace", trace] + argv[1:])
+    with open(trace) as trace_file:
+        return rc, json.load(trace_file)["traceEvents"]
+
+
+def test_trace_dump(db, csv, tmp_path):
+    """Trace a dump of the database."""
+    rc, events = _trace(tmp_path, [PROC_NAME, db, "dump-db", "-f", "csv", csv])
+    assert rc == 0
+    assert all(event["ph"] == "X" for event in events)
+    assert all(event["ts"] >= 0 and event["dur"] >= 0 for event in events)
+
+    spans = {}
+    for event in events:
+        spans.setdefault(event["name"], []).append(event)
+    dump = spans["do_dump_db"][0]
+    assert dump["args"]["calls"] == 1
+
+    # Each table is a span of its own but its rows are merged into a single span.
+    assert len(spans["write_batches"]) == len(spans["worksheet"])
+    assert {event["args"]["calls"] for event in spans["data"]} >= {6}
+    rows = [event for event in events if event["args"]["calls"] > 1]
+    for event in rows:
+        assert dump["ts"] <= event["ts"]
+        assert event["ts"] + event["dur"] <= dump["ts"] + dump["dur"]
+        assert event["args"]["total_ms"] <= event["dur"] / 1000
+
+
+def test_trace_failure(db, tmp_path):
+    """A trace is still written when the command fails."""
+    rc, events = _trace(tmp_path, [PROC_NAME, db, "list-columns", "-t", "t_mancante"])
+    assert rc == 2
+    assert "do_list_columns" in [event["name"] for event in events]
+
+
+def test_trace_threads(db, tmp_path):
+    """Calls made by worker threads are traced on their own threads."""
+    backups = os.path.join(tmp_path, "backups")
+    os.mkdir(backups)
+    for backup in ("garibaldi.dbglu", "mazzini.dbglu"):
+        shutil.copy(db, os.path.join(backups, backup))
+
+    rc, events = _trace(tmp_path, [PROC_NAME, backups, "catalog", "-j", "2"])
+    assert rc == 0
+    scans = [event for event in events if event["name"] == "scan_backup"]
+    assert scans
+    main_thread = [e["tid"] for e in events if e["name"] == "do_catalog"]
+    assert all(event["tid"] != main_thread[0] for event in scans)
+
+
+def test_trace_reused_threads(monkeypatch):
+    """Threads that reuse the ident of one that has ended keep their own spans."""
+    tracer = Tracer()
+    monkeypatch.setattr(glucolog, "tracer", tracer)
+
+    @entry_exit
+    def traced():
+        pass
+
+    # Each thread ends before the next starts so their idents are reused.
+    for _ in range(8):
+        thread = threading.Thread(target=traced)
+        thread.start()
+        thread.join()
+    events = tracer.trace()["traceEvents"]
+    assert len(events) == 8
+    assert len({event["tid"] for event in events}) < 8
+
+
+def test_trace_generators(monkeypatch):
+    """The items of a generator are traced, not just creating the generator."""
+    tracer = Tracer()
+    monkeypatch.setattr(glucolog, "tracer", tracer)
+
+    @entry_exit
+    def produce():
+        yield 1
+        yield 2
+
+    @entry_exit
+    def consume(item):
+        return item
+
+    assert [consume(item) for item in produce()] == [1, 2]
+    events = tracer.trace()["traceEvents"]
+    # Creating the generator is merged with producing the first item.
+    assert [event["name"] for event in events] == [
+        "produce",
+        "consume",
+        "produce",
+        "consume",
+        "produce",
+    ]
+    assert [event["args"]["calls"] for event in events] == [2, 1, 1, 1, 1]
+
+    # Generators work as before without a tracer, and can be left unfinished.
+    monkeypatch.setattr(glucolog, "tracer", None)
+    assert list(produce()) == [1, 2]
+    assert next(produce()) == 1
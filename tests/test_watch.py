@@ -0,0 +1,194 @@
+"""Test the 'watch' command."""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import pytest
+from src.glucolog.glucolog import PROC_NAME, main, WATCH_STATE_FILE
+
+
+@pytest.fixture
+def backups(tmp_path, db):
+    """Create a directory of backups, one of which is still being copied."""
+    dirname = os.path.join(tmp_path, "backups")
+    os.makedirs(os.path.join(dirname, "sub"))
+    shutil.copy(db, os.path.join(dirname, "a.dbglu"))
+    shutil.copy(db, os.path.join(dirname, "sub", "b.dbglu"))
+    with open(os.path.join(dirname, "partial.dbglu"), "w") as target:
+        target.write("Not yet a database")
+    yield dirname
+
+
+def watch(backups, output, *options):
+    """Look for new or changed backups once."""
+    argv = [PROC_NAME, "-v", "-x", "en", backups, "watch", "--once", *options, output]
+    assert main(argv) == 0
+
+
+def lines(output, filename):
+    """Return the lines of an output file."""
+    with open(os.path.join(output, filename), "r") as source:
+        return source.read().splitlines()
+
+
+def add_reading(database, _id):
+    """Add a reading to a backup, copying the first one."""
+    con = sqlite3.connect(database)
+    con.execute(
+        "INSERT INTO t_risultati (_id, data, ora, periodo) "
+        "SELECT ?, data, ora, periodo FROM t_risultati WHERE _id = 17",
+        (_id,),
+    )
+    con.commit()
+    con.close()
+
+
+def test_watch(backups, tmp_path, capsys):
+    """Only the readings added to changed backups are appended."""
+    output = os.path.join(tmp_path, "output")
+    watch(backups, output, "-c", "_id,date")
+    captured = capsys.readouterr()
+    assert "Ignoring 'partial.dbglu' for now" in captured.err
+    assert "2 of 3 backups changed" in captured.err
+    assert "Watching" not in captured.err
+    assert lines(output, "a.csv") == [
+        "_id,date",
+        "17,2021-04-28",
+        "18,2021-04-29",
+        "19,2021-04-30",
+        "22,2021-05-01",
+        "20,2021-05-02",
+        "20,2021-05-03",
+    ]
+    assert lines(output, os.path.join("sub", "b.csv")) == lines(output, "a.csv")
+    with open(os.path.join(output, WATCH_STATE_FILE), "r") as source:
+        state = json.load(source)["backups"]
+    assert state["a.dbglu"]["high_water"] == 6
+    assert len(state["a.dbglu"]["sha256"]) == 64
+    assert state["partial.dbglu"] == {}
+
+    # Nothing has changed.
+    watch(backups, output, "-c", "_id,date")
+    assert "0 of 3 backups changed" in capsys.readouterr().err
+
+    # A reading is added to one backup, and another is touched but not changed.
+    add_reading(os.path.join(backups, "a.dbglu"), 23)
+    b_csv = os.path.join(output, "sub", "b.csv")
+    written = os.stat(b_csv).st_mtime_ns
+    later = time.time() + 10
+    os.utime(os.path.join(backups, "sub", "b.dbglu"), (later, later))
+    watch(backups, output, "-c", "_id,date")
+    captured = capsys.readouterr()
+    assert "1 new readings from 'a.dbglu'" in captured.err
+    assert "1 of 3 backups changed" in captured.err
+    assert lines(output, "a.csv")[-2:] == ["20,2021-05-03", "23,2021-04-28"]
+    assert len(lines(output, "a.csv")) == 8
+    assert os.stat(b_csv).st_mtime_ns == written
+
+
+def test_watch_ndjson(backups, tmp_path):
+    """Readings can be appended as NDJSON, with their periods."""
+    output = os.path.join(tmp_path, "output")
+    watch(backups, output, "-f", "ndjson", "-p", "-c", "_id,now")
+    add_reading(os.path.join(backups, "a.dbglu"), 23)
+    watch(backups, output, "-f", "ndjson", "-p", "-c", "_id,now")
+    rows = [json.loads(line) for line in lines(output, "a.ndjson")]
+    assert len(rows) == 7
+    assert rows[0] == dict(rows[-1], _id=17)
+    assert rows[-1] == {"_id": 23, "now": "06:05", "calculated_period": "morning"}
+
+
+def test_watch_again(backups, tmp_path, capsys):
+    """Backups are exported again if readings or output files go missing."""
+    output = os.path.join(tmp_path, "output")
+    watch(backups, output)
+    header = lines(output, "a.csv")[0]
+
+    con = sqlite3.connect(os.path.join(backups, "a.dbglu"))
+    con.execute("DELETE FROM t_risultati WHERE _id = 20")
+    con.commit()
+    con.close()
+    os.remove(os.path.join(output, "sub", "b.csv"))
+    add_reading(os.path.join(backups, "sub", "b.dbglu"), 23)
+    watch(backups, output)
+    assert "'a.dbglu' has lost readings" in capsys.readouterr().err
+    assert lines(output, "a.csv")[0] == header
+    assert len(lines(output, "a.csv")) == 5
+    assert lines(output, os.path.join("sub", "b.csv"))[0] == header
+    assert len(lines(output, os.path.join("sub", "b.csv"))) == 8
+
+
+def test_watch_options(backups, tmp_path, capsys):
+    """Backups are exported again, rather than appended to, if the options change."""
+    output = os.path.join(tmp_path, "output")
+    watch(backups, output, "-c", "_id,date")
+    with open(os.path.join(output, WATCH_STATE_FILE), "r") as source:
+        state = json.load(source)["backups"]
+    assert state["a.dbglu"]["options"] == {
+        "format": "csv",
+        "columns": ["_id", "date"],
+        "periods": False,
+        "units": None,
+        "language": "en",
+    }
+
+    add_reading(os.path.join(backups, "a.dbglu"), 23)
+    watch(backups, output, "-c", "_id,now", "-p")
+    assert "2 of 3 backups changed" in capsys.readouterr().err
+    for filename in ("a.csv", os.path.join("sub", "b.csv")):
+        assert lines(output, filename)[:2] == [
+            "_id,now,calculated_period",
+            "17,06:05,morning",
+        ]
+    assert len(lines(output, "a.csv")) == 8
+    assert len(lines(output, os.path.join("sub", "b.csv"))) == 7
+
+    # The same options again change nothing.
+    watch(backups, output, "-c", "_id,now", "-p")
+    assert "0 of 3 backups changed" in capsys.readouterr().err
+    assert len(lines(output, "a.csv")) == 8
+
+
+def test_watch_state(backups, tmp_path, capsys):
+    """Backups which have gone are forgotten, as are states of other versions."""
+    output = os.path.join(tmp_path, "output")
+    watch(backups, output)
+    os.remove(os.path.join(backups, "partial.dbglu"))
+    os.remove(os.path.join(backups, "sub", "b.dbglu"))
+    watch(backups, output)
+    state_file = os.path.join(output, WATCH_STATE_FILE)
+    with open(state_file, "r") as source:
+        state = json.load(source)
+    assert list(state["backups"]) == ["a.dbglu"]
+
+    state["version"] = 0
+    with open(state_file, "w") as target:
+        json.dump(state, target)
+    watch(backups, output)
+    captured = capsys.readouterr()
+    assert "Ignoring watch state" in captured.err
+    assert "1 of 1 backups changed" in captured.err
+
+
+def test_watch_until_interrupted(backups, tmp_path, monkeypatch, capsys):
+    """Watch a directory until interrupted."""
+
+    def interrupt(seconds):
+        assert seconds == 5
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(time, "sleep", interrupt)
+    output = os.path.join(tmp_path, "output")
+    argv = [PROC_NAME, backups, "watch", "--interval", "5", output]
+    assert main(argv) == 0
+    captured = capsys.readouterr()
+    assert "Watching '%s' every 5 seconds" % backups in captured.err
+    assert "Stopped watching" in captured.err
+    assert len(lines(output, "a.csv")) == 7
+
+
+def test_watch_database(db, tmp_path, capsys):
+    """Only directories of backups can be watched."""
+    assert main([PROC_NAME, db, "watch", str(tmp_path)]) == 2
+    assert "is not a directory of backups" in capsys.readouterr().err